@@ -0,0 +1,47 @@
+import json
+import logging
+import queue
+import threading
+
+
+class AlertFeed:
+    """
+    Fan-out of alert events to streaming subscribers (one queue per client).
+    A slow client drops events instead of blocking the poller.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                logging.warning("Dropping energy alert for a slow subscriber")
+
+    def stream(self, subscriber, heartbeat=15):
+        """Yield server-sent events for a subscriber until the client disconnects."""
+        try:
+            while True:
+                try:
+                    event = subscriber.get(timeout=heartbeat)
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,133 @@
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+
+HOURS_PER_WEEK = 7 * 24
+
+
+class EnergyAnomalyDetector:
+    """
+    Streaming energy baselines for one plug (or the whole home).
+
+    Keeps an exponentially weighted mean and variance of the energy used in
+    each of the 168 hours of the week, and of the full-day total for each
+    weekday. observe() folds in one daily-counter sample in O(1): it only
+    does work when a sample closes an hour or a day. evaluate() compares
+    today's energy so far against the expected energy by this point of this
+    weekday, which is the sum of the baselines of the hours already elapsed
+    plus the elapsed fraction of the current hour.
+
+    skip() notes a missing sample. The counter is cumulative, so a gap within
+    an hour costs nothing; a gap across the end of an hour leaves the hours
+    on either side (and a day that ended in it) out of the baselines.
+    """
+
+    def __init__(self, alpha=0.2, z_threshold=2.5, min_weeks=2):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_weeks = min_weeks
+        self.hour_mean = np.zeros(HOURS_PER_WEEK)
+        self.hour_var = np.zeros(HOURS_PER_WEEK)
+        self.hour_count = np.zeros(HOURS_PER_WEEK, dtype=np.int64)
+        self.day_mean = np.zeros(7)
+        self.day_var = np.zeros(7)
+        self.day_count = np.zeros(7, dtype=np.int64)
+        # Hour currently being accumulated: (date, hour), daily counter at its start
+        self._hour = None
+        self._hour_start_energy = 0.0
+        self._last_energy = 0.0
+        # The first hour and day seen are only partly observed and are not learned
+        self._partial_hour = True
+        self._partial_day = True
+        self._gap = False
+        self._lock = threading.Lock()
+
+    def _ewma(self, mean, var, count, index, value):
+        # Incremental EWMA of mean and variance (West/Finch update)
+        if count[index] == 0:
+            mean[index], var[index] = value, 0.0
+        else:
+            diff = value - mean[index]
+            increment = self.alpha * diff
+            mean[index] += increment
+            var[index] = (1 - self.alpha) * (var[index] + diff * increment)
+        count[index] += 1
+
+    def observe(self, when, daily_energy_kwh):
+        """Fold in a sample of the plug's daily energy counter taken at `when`."""
+        hour = (when.date(), when.hour)
+        with self._lock:
+            crossed_gap = self._gap and self._hour is not None and hour != self._hour
+            self._gap = False
+            if crossed_gap:
+                self._partial_hour = True
+                if hour[0] != self._hour[0]:
+                    self._partial_day = True
+            if self._hour is not None and hour != self._hour:
+                day, hour_of_day = self._hour
+                hour_index = day.weekday() * 24 + hour_of_day
+                if not self._partial_hour:
+                    used = max(self._last_energy - self._hour_start_energy, 0.0)
+                    self._ewma(self.hour_mean, self.hour_var, self.hour_count, hour_index, used)
+                if hour[0] != day:
+                    # The daily counter resets at midnight, so its last value is the day's total
+                    if not self._partial_day:
+                        self._ewma(self.day_mean, self.day_var, self.day_count, day.weekday(), self._last_energy)
+                    self._last_energy = 0.0
+                    self._partial_day = False
+                self._hour_start_energy = self._last_energy
+                # After a gap the energy at the start of this hour is unknown too
+                self._partial_hour = crossed_gap
+            elif self._hour is None:
+                self._hour_start_energy = daily_energy_kwh
+            self._hour = hour
+            self._last_energy = daily_energy_kwh
+
+    def skip(self):
+        """Note a poll with no sample for this plug (or no complete whole-home total)."""
+        with self._lock:
+            self._gap = True
+
+    def evaluate(self, now=None, today_energy_kwh=None):
+        """
+        Compare today's energy so far with the weekday baseline at this time.
+        Uses the last observed counter value unless today_energy_kwh is given.
+        z_score and projected_kwh are None until this weekday's hours have
+        min_weeks of history; a near-empty baseline would make them meaningless.
+        """
+        now = now or datetime.now()
+        with self._lock:
+            if today_energy_kwh is None:
+                today_energy_kwh = self._last_energy if self._hour and self._hour[0] == now.date() else 0.0
+            base = now.weekday() * 24
+            fraction = (now.minute * 60 + now.second) / 3600
+            elapsed = slice(base, base + now.hour)
+            current = base + now.hour
+
+            expected = self.hour_mean[elapsed].sum() + fraction * self.hour_mean[current]
+            variance = self.hour_var[elapsed].sum() + fraction ** 2 * self.hour_var[current]
+            remaining = (1 - fraction) * self.hour_mean[current] + self.hour_mean[current + 1:base + 24].sum()
+            trained_weeks = int(self.hour_count[base:base + 24].min())
+            day_baseline = self.day_mean[now.weekday()]
+
+        ready = trained_weeks >= self.min_weeks
+        z_score = projected = None
+        if ready:
+            # Floor the spread so a very regular baseline does not flag tiny deviations
+            std = max(math.sqrt(variance), 0.1 * expected, 0.01)
+            z_score = round(float((today_energy_kwh - expected) / std), 2)
+            projected = round(float(today_energy_kwh + remaining), 4)
+        return {
+            "today_energy_kwh": round(today_energy_kwh, 4),
+            "expected_kwh_so_far": round(float(expected), 4),
+            "projected_kwh": projected,
+            "daily_baseline_kwh": round(float(day_baseline), 4),
+            "z_score": z_score,
+            "is_above_average": bool(ready and today_energy_kwh > expected),
+            "is_anomaly": bool(ready and z_score > self.z_threshold),
+            "baseline_weeks": trained_weeks,
+            "baseline_ready": ready,
+            "timestamp": now.strftime("%Y-%m-%d %H:%M:%S")
+        }
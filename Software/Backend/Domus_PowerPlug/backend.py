@@ -1,14 +1,21 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
-import asyncio
 from datetime import datetime, timedelta
-import csv
+import atexit
+import gzip
+import json
 import os
 import logging
-from kasa import Discover
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from apscheduler.schedulers.background import BackgroundScheduler
-import pandas as pd
-import numpy as np
+from plug_manager import PlugLoop, PlugRegistry
+from energy_store import EnergyStore
+from alert_feed import AlertFeed
+from export import EXPORT_FORMATS, csv_chunks, gzip_chunks, arrow_available, arrow_chunks
+# NumPy-backed helpers (downsample, power_buffer, anomaly) are imported where
+# they are used so the service can bind before NumPy has loaded
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
@@ -16,282 +23,384 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Smart Plug IP and CSV file paths
-PLUG_IP = "192.168.1.152"
-ENERGY_CSV_FILE = "energy_data.csv"  # Main data file
-HOURLY_ENERGY_CSV = "hourly_energy_data.csv"  # Hourly energy data (0-23)
-DAILY_ENERGY_CSV = "daily_energy_data.csv"  # Weekly energy data (Mon-Sun)
-POWER_CSV_FILE = "power_data.csv"  # Recent power readings for graph
-
-# Global variables for tracking
-today_total_energy = 0
-daily_start_value = 0
-last_reset_day = datetime.now().day
-today_hourly_energy = [0] * 24  # Energy consumed each hour of today
-weekly_energy = [0] * 7  # Energy consumed each day of the week
-recent_power_readings = []  # List to store recent power readings (timestamp, value)
-
-# Function to initialize CSV files
-def initialize_csv_files():
-    # Main energy data CSV
-    if not os.path.exists(ENERGY_CSV_FILE):
-        with open(ENERGY_CSV_FILE, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                "timestamp", 
-                "current_power_watts", 
-                "total_energy_kwh", 
-                "daily_energy_kwh", 
-                "running_energy_sum"
-            ])
-    
-    # Hourly energy data CSV
-    if not os.path.exists(HOURLY_ENERGY_CSV):
-        with open(HOURLY_ENERGY_CSV, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["hour", "energy_kwh"])
-            for hour in range(24):
-                writer.writerow([hour, 0])
-    
-    # Daily energy data CSV
-    if not os.path.exists(DAILY_ENERGY_CSV):
-        with open(DAILY_ENERGY_CSV, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["day", "energy_kwh"])
-            days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-            for i, day in enumerate(days):
-                writer.writerow([day, 0])
-    
-    # Power data CSV
-    if not os.path.exists(POWER_CSV_FILE):
-        with open(POWER_CSV_FILE, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["timestamp", "power_watts"])
-
-# Function to log energy data to main CSV
-def log_energy_data(current_power, total_energy, daily_energy, running_sum):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    with open(ENERGY_CSV_FILE, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp, str(current_power), str(total_energy), str(daily_energy), str(running_sum)])
-    
-    logging.info(f"Logged energy at {timestamp}")
+# Smart Plug IP and data file paths
+PLUG_IP = os.environ.get("SMART_PLUG_IP", "192.168.1.152")  # Used when no plug list is configured
+PLUGS_CONFIG_FILE = "plugs.json"  # Optional {"plug_id": "ip", ...} map
+ENERGY_DB_FILE = "energy_data.db"  # Raw samples plus hourly/daily rollups
+ENERGY_CSV_FILE = "energy_data.csv"  # Legacy log, imported into the store once
+POWER_SNAPSHOT_FILE = "power_buffer.npz"  # Periodic copy of the in-memory power buffers
+
+# Plug reading cache: how old a shared reading may be before the plug is
+# queried again, and how long request handlers wait for the plug
+PLUG_READING_TTL = float(os.environ.get("PLUG_READING_TTL", "10"))
+REQUEST_DEADLINE = float(os.environ.get("PLUG_REQUEST_DEADLINE", "2"))
+TOGGLE_DEADLINE = float(os.environ.get("PLUG_TOGGLE_DEADLINE", "5"))  # Covers the retries of a relay command
+POLL_INTERVAL = 30
+POLL_DEADLINE = 20
+
+# High-resolution power sampling: one realtime query per plug every
+# POWER_SAMPLE_INTERVAL seconds, kept in memory for POWER_BUFFER_SECONDS and
+# snapshotted to disk every POWER_SNAPSHOT_INTERVAL seconds (0 disables)
+POWER_SAMPLE_INTERVAL = max(float(os.environ.get("POWER_SAMPLE_INTERVAL", "2")), 1)
+POWER_BUFFER_SECONDS = int(os.environ.get("POWER_BUFFER_SECONDS", "3600"))
+POWER_SNAPSHOT_INTERVAL = int(os.environ.get("POWER_SNAPSHOT_INTERVAL", "300"))
+POWER_BUFFER_CAPACITY = int(POWER_BUFFER_SECONDS / POWER_SAMPLE_INTERVAL)
+
+# Anomaly detection: how unusual today's energy must be (in standard deviations
+# of the time-of-week baseline) to alert, and how much history seeds the baselines
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "2.5"))
+ANOMALY_SEED_DAYS = 56
+
+# History API: default chart resolution and the upper bound a client may ask for
+HISTORY_DEFAULT_POINTS = 300
+HISTORY_MAX_POINTS = 5000
+HISTORY_FIELDS = {"power": "current_power_watts", "daily_energy": "daily_energy_kwh", "total_energy": "total_energy_kwh"}
 
-# Function to update hourly energy data
-def update_hourly_energy_data():
-    now = datetime.now()
-    current_hour = now.hour
+ALL_PLUGS = "all"  # Selector for the whole-home aggregate
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Global variables for tracking, keyed by plug id plus ALL_PLUGS for the home total
+power_buffers = {}  # High-resolution power samples per plug (PowerRingBuffer)
+latest_readings = {}  # Most recent stored sample per plug, served by /energy
+latest_reading_lock = threading.Lock()
+anomaly_detectors = {}  # Streaming time-of-week baselines per plug
+alerting = set()  # Selectors currently flagged as anomalous
+alert_feed = AlertFeed()  # Pushes alert transitions to /energy/alert/stream clients
+
+# Long-lived plug sessions on one shared loop, used by the scheduler and the Flask routes
+plug_loop = PlugLoop().start()
+plugs = PlugRegistry(plug_loop, retries=2, retry_delay=1, reading_ttl=PLUG_READING_TTL)
+
+# Time-series store shared by the poller and the Flask routes, opened by warm_up()
+energy_store = None
+
+# Background warm-up progress, reported by /ready
+startup_began = time.perf_counter()
+warmup_state = {"ready": False, "error": None, "steps": {}, "startup_seconds": None}
+
+# Function to import the legacy CSV log the first time the store is opened
+def migrate_legacy_csv():
+    if not energy_store.is_empty() or not os.path.exists(ENERGY_CSV_FILE) or not len(plugs):
+        return
     
-    # Read existing data
-    data = []
-    if os.path.exists(HOURLY_ENERGY_CSV):
-        with open(HOURLY_ENERGY_CSV, mode="r", newline="") as file:
-            reader = csv.reader(file)
-            next(reader)  # Skip header
-            data = [[int(row[0]), float(row[1])] for row in reader]
-    else:
-        # Initialize with zeros if file doesn't exist
-        data = [[hour, 0] for hour in range(24)]
+    try:
+        # The legacy log came from the single plug the backend used to poll
+        plug_id = plugs.ids()[0]
+        count = energy_store.import_energy_csv(ENERGY_CSV_FILE, plug_id=plug_id)
+        logging.info(f"Imported {count} samples from {ENERGY_CSV_FILE} into {ENERGY_DB_FILE} as plug {plug_id}")
+    except Exception as e:
+        logging.error(f"Error importing {ENERGY_CSV_FILE}: {e}")
+
+# Function to resolve the ?plug= selector into a list of plug ids
+def selected_plug_ids(selector=None):
+    selector = selector or request.args.get("plug", ALL_PLUGS)
+    if selector == ALL_PLUGS:
+        return plugs.ids()
+    return [selector] if plugs.get(selector) else None
+
+def unknown_plug_response():
+    return jsonify({"error": "Unknown plug", "plugs": plugs.ids()}), 404
+
+# Function to build the /energy payload from a stored sample
+def sample_to_reading(sample):
+    return {
+        "timestamp": datetime.fromtimestamp(sample["ts"]).strftime("%Y-%m-%d %H:%M:%S"),
+        "current_power": sample["current_power_watts"],
+        "total_energy": sample["total_energy_kwh"],
+        "daily_energy": sample["daily_energy_kwh"],
+        "running_energy_sum": sample["running_energy_sum"]
+    }
+
+# Function to add up per-plug readings into a whole-home reading
+def combine_readings(readings):
+    combined = {"current_power": 0, "total_energy": 0, "daily_energy": 0, "running_energy_sum": 0}
+    timestamps = [reading["timestamp"] for reading in readings if reading.get("timestamp")]
+    latest = max(timestamps) if timestamps else None
+    for reading in readings:
+        # A plug last read on an earlier day still holds that day's counters,
+        # which are not part of today's total
+        today = latest is not None and (reading.get("timestamp") or "")[:10] == latest[:10]
+        for key in combined:
+            if today or key not in ("daily_energy", "running_energy_sum"):
+                combined[key] += reading.get(key) or 0
+    combined["timestamp"] = latest
+    return combined
+
+# Function to rebuild the latest-reading snapshots on a cold start
+def load_latest_reading():
+    try:
+        snapshots = {}
+        for plug_id in plugs.ids():
+            sample = energy_store.latest_sample(plug_id)
+            if sample:
+                snapshots[plug_id] = sample_to_reading(sample)
+        if snapshots:
+            snapshots[ALL_PLUGS] = combine_readings(list(snapshots.values()))
+        with latest_reading_lock:
+            latest_readings.update(snapshots)
+    except Exception as e:
+        logging.error(f"Error loading latest energy reading: {e}")
+
+# Function to log a poll's worth of plug readings to the store
+def log_energy_data(readings, now):
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
     
-    # Update the current hour with the latest value
-    for row in data:
-        if row[0] == current_hour:
-            row[1] = today_hourly_energy[current_hour]
-            break
+    # One transaction appends the samples and folds them into the hourly/daily rollups
+    energy_store.insert_samples([
+        (plug_id, now, r["current_power"], r["total_energy"], r["daily_energy"], r["running_energy_sum"])
+        for plug_id, r in readings.items()
+    ])
     
-    # Write updated data
-    with open(HOURLY_ENERGY_CSV, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["hour", "energy_kwh"])
-        for row in sorted(data, key=lambda x: x[0]):
-            writer.writerow(row)
-
-# Function to update daily energy data
-def update_daily_energy_data():
-    now = datetime.now()
-    current_day_idx = now.weekday()  # 0 = Monday, 6 = Sunday
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    # Keep the snapshots served by /energy in step with the store
+    with latest_reading_lock:
+        for plug_id, reading in readings.items():
+            latest_readings[plug_id] = sample_to_reading({
+                "ts": now.timestamp(),
+                "current_power_watts": reading["current_power"],
+                "total_energy_kwh": reading["total_energy"],
+                "daily_energy_kwh": reading["daily_energy"],
+                "running_energy_sum": reading["running_energy_sum"]
+            })
+        latest_readings[ALL_PLUGS] = combine_readings(
+            [reading for plug_id, reading in latest_readings.items() if plug_id != ALL_PLUGS]
+        )
     
-    # Read existing data
-    data = []
-    if os.path.exists(DAILY_ENERGY_CSV):
-        with open(DAILY_ENERGY_CSV, mode="r", newline="") as file:
-            reader = csv.reader(file)
-            next(reader)  # Skip header
-            data = [[row[0], float(row[1])] for row in reader]
+    logging.info(f"Logged energy for {len(readings)} plug(s) at {timestamp}")
+
+# Function to build the anomaly baselines from the stored hourly rollups on a cold start
+def seed_anomaly_detectors():
+    from anomaly import EnergyAnomalyDetector
+    try:
+        now = datetime.now()
+        for selector in plugs.ids() + [ALL_PLUGS]:
+            detector = EnergyAnomalyDetector(z_threshold=ANOMALY_Z_THRESHOLD)
+            plug_ids = plugs.ids() if selector == ALL_PLUGS else [selector]
+            # Each hourly row holds the daily counter at the end of that hour.
+            # Hours with no row, or with rows from only some of the plugs, are gaps
+            previous = None
+            for row in energy_store.hourly_between(now - timedelta(days=ANOMALY_SEED_DAYS), now, plug_ids):
+                if previous is not None and row["hour_start"] != previous + 3600:
+                    detector.skip()
+                previous = row["hour_start"]
+                if row["plugs"] < len(plug_ids):
+                    detector.skip()
+                    continue
+                detector.observe(datetime.fromtimestamp(row["hour_start"]), row["energy_kwh"] or 0)
+            anomaly_detectors[selector] = detector
+    except Exception as e:
+        logging.error(f"Error seeding anomaly baselines: {e}")
+
+# Function to fold a poll into the anomaly baselines and push alert transitions
+def update_anomaly_state(readings, now):
+    from anomaly import EnergyAnomalyDetector
+    # Only this poll's readings count, and only those taken today: a cached
+    # reading from just before midnight still holds yesterday's counter
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    daily_energy = {plug_id: data["daily_energy"] for plug_id, data in readings.items()
+                    if now - timedelta(seconds=data.get("age_seconds") or 0) >= midnight}
+    missing = [plug_id for plug_id in plugs.ids() if plug_id not in daily_energy]
+    # The whole-home total is only known when every plug has reported
+    if missing:
+        missing.append(ALL_PLUGS)
     else:
-        # Initialize with zeros if file doesn't exist
-        data = [[day, 0] for day in days]
-    
-    # Update the current day with the latest value
-    for row in data:
-        if row[0] == days[current_day_idx]:
-            row[1] = weekly_energy[current_day_idx]
-            break
-    
-    # Write updated data
-    with open(DAILY_ENERGY_CSV, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["day", "energy_kwh"])
-        # Ensure days are in correct order
-        day_dict = {row[0]: row[1] for row in data}
-        for day in days:
-            writer.writerow([day, day_dict.get(day, 0)])
-
-# Function to update power data CSV
-def update_power_data(power_watts):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Add to recent readings
-    global recent_power_readings
-    recent_power_readings.append((timestamp, power_watts))
+        daily_energy[ALL_PLUGS] = sum(daily_energy.values())
     
-    # Keep only last 10 readings (5 minutes @ 30 second intervals)
-    if len(recent_power_readings) > 10:
-        recent_power_readings = recent_power_readings[-10:]
-    
-    # Update CSV
-    with open(POWER_CSV_FILE, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["timestamp", "power_watts"])
-        for ts, power in recent_power_readings:
-            writer.writerow([ts, power])
-
-# Async function to get Smart Plug energy data
-async def get_kasa_data():
-    retries = 3
-    delay = 5
-    for attempt in range(retries):
-        try:
-            plug = await Discover.discover_single(PLUG_IP)
-            await plug.update()
-            
-            # Get realtime data
-            emeter_data = await plug.get_emeter_realtime()
-            current_power = emeter_data.get("power_mw", 0) / 1000
-            total_energy = emeter_data.get("total_wh", 0) / 1000
-            
-            # Get daily stats
-            daily_data = await plug.get_emeter_daily()
-            today = datetime.now().day
-            daily_energy = daily_data.get(today, 0) / 1000  # Convert Wh to kWh
-            
-            return {
-                "current_power": current_power,
-                "total_energy": total_energy,
-                "daily_energy": daily_energy,
-                "daily_data": daily_data
-            }
-        except Exception as e:
-            logging.warning(f"Attempt {attempt + 1}/{retries}: Failed to fetch energy data. Error: {e}")
-            await asyncio.sleep(delay)
-    
-    logging.error("All retries failed. Returning default values.")
-    return {"current_power": 0, "total_energy": 0, "daily_energy": 0, "daily_data": {}}
+    for selector in missing:
+        anomaly_detectors.setdefault(selector, EnergyAnomalyDetector(z_threshold=ANOMALY_Z_THRESHOLD)).skip()
+    for selector, energy in daily_energy.items():
+        detector = anomaly_detectors.setdefault(selector, EnergyAnomalyDetector(z_threshold=ANOMALY_Z_THRESHOLD))
+        detector.observe(now, energy)
+        evaluation = detector.evaluate(now)
+        
+        # Only changes are pushed, so subscribers are not flooded every poll
+        if evaluation["is_anomaly"] and selector not in alerting:
+            alerting.add(selector)
+            logging.warning(f"Energy anomaly for {selector}: {evaluation}")
+            alert_feed.publish(dict(evaluation, type="energy_alert", plug=selector))
+        elif not evaluation["is_anomaly"] and selector in alerting:
+            alerting.discard(selector)
+            alert_feed.publish(dict(evaluation, type="energy_alert_cleared", plug=selector))
+
+# Function to get the power buffer for a plug id (or ALL_PLUGS), creating it on first use
+def power_buffer(plug_id):
+    buffer = power_buffers.get(plug_id)
+    if buffer is None:
+        from power_buffer import PowerRingBuffer
+        buffer = power_buffers.setdefault(plug_id, PowerRingBuffer(POWER_BUFFER_CAPACITY))
+    return buffer
+
+# Function to sample realtime power from every plug into the in-memory buffers
+def sample_power():
+    try:
+        now = time.time()
+        samples = plugs.sample_power(deadline=POWER_SAMPLE_INTERVAL)
+        measured = {plug_id: watts for plug_id, watts in samples.items() if watts is not None}
+        if not measured:
+            return
+        
+        for plug_id, watts in measured.items():
+            power_buffer(plug_id).append(now, watts)
+        # A plug that missed this tick contributes its last known power to the total
+        total = 0.0
+        for plug_id in samples:
+            if plug_id in measured:
+                total += measured[plug_id]
+            elif plug_id in power_buffers and len(power_buffers[plug_id]):
+                total += power_buffers[plug_id].latest()[1]
+        power_buffer(ALL_PLUGS).append(now, total)
+    except Exception as e:
+        logging.error(f"Error sampling power: {e}")
+
+# Functions to keep the power buffers across restarts
+def save_power_snapshot():
+    from power_buffer import save_buffers
+    try:
+        save_buffers(dict(power_buffers), POWER_SNAPSHOT_FILE)
+    except Exception as e:
+        logging.error(f"Error saving {POWER_SNAPSHOT_FILE}: {e}")
+
+def load_power_snapshot():
+    from power_buffer import load_buffers
+    power_buffers.update(load_buffers(POWER_SNAPSHOT_FILE, POWER_BUFFER_CAPACITY))
+    if power_buffers:
+        logging.info(f"Restored power buffers for {', '.join(power_buffers)} from {POWER_SNAPSHOT_FILE}")
+
+# Function to get Smart Plug energy data through the shared reading cache
+def get_kasa_data(plug_ids, deadline=REQUEST_DEADLINE):
+    """
+    Poll the selected plugs concurrently and return {plug_id: reading}.
+    Plugs with no reading yet get zeroed values flagged as stale.
+    """
+    readings = plugs.get_readings(plug_ids, deadline=deadline)
+    for plug_id, reading in readings.items():
+        if reading is None:
+            logging.error(f"No reading available from plug {plug_id} yet. Returning default values.")
+            readings[plug_id] = {"current_power": 0, "total_energy": 0, "daily_energy": 0, "daily_data": {},
+                                 "is_on": None, "stale": True, "age_seconds": None}
+    return readings
 
 # Function to update all data every 30 seconds
 def update_all_data():
-    global today_total_energy, daily_start_value, last_reset_day, today_hourly_energy, weekly_energy
-    
-    async def fetch_data():
-        return await get_kasa_data()
-    
     try:
+        # Poll every plug in one concurrent round trip, sharing any reading taken within the TTL
         now = datetime.now()
-        current_hour = now.hour
-        current_day_idx = now.weekday()
-        
-        # Fetch data from Kasa device
-        data = asyncio.run(fetch_data())
-        current_power = data["current_power"]
-        total_energy = data["total_energy"]
-        daily_energy = data["daily_energy"]
-        
-        # Check if day has changed
-        if now.day != last_reset_day:
-            # Store yesterday's total for the weekly data
-            yesterday_idx = (current_day_idx - 1) % 7
-            weekly_energy[yesterday_idx] = today_total_energy
-            
-            # Reset daily counter
-            today_total_energy = 0
-            daily_start_value = daily_energy
-            today_hourly_energy = [0] * 24
-            last_reset_day = now.day
-            
-            # Update daily data CSV
-            update_daily_energy_data()
-        
-        # Calculate today's energy consumption
-        today_total_energy = daily_energy
-        
-        # Update hourly energy data
-        today_hourly_energy[current_hour] = daily_energy
-        
-        # Update weekly energy data for current day
-        weekly_energy[current_day_idx] = daily_energy
-        
-        # Calculate running sum (for logging purposes)
-        running_sum = today_total_energy
-        
-        # Log to main CSV file
-        log_energy_data(current_power, total_energy, daily_energy, running_sum)
-        
-        # Update power data
-        update_power_data(current_power)
-        
-        # Update hourly and daily CSV files
-        update_hourly_energy_data()
-        update_daily_energy_data()
-        
+        readings = get_kasa_data(plugs.ids(), deadline=POLL_DEADLINE)
+        fresh = {}
+        for plug_id, data in readings.items():
+            if data["stale"]:
+                logging.warning(f"Skipping sample for plug {plug_id}: no fresh reading")
+                continue
+            # The plug's own daily counter resets at midnight, so today's
+            # running sum is simply its current value
+            fresh[plug_id] = dict(data, running_energy_sum=data["daily_energy"])
+        
+        if not fresh:
+            return
+        
+        # Store the samples; hourly and daily rollups are updated incrementally
+        log_energy_data(fresh, now)
+        update_anomaly_state(fresh, now)
+    
     except Exception as e:
         logging.error(f"Error updating data: {e}")
 
-# Check historical energy data to get baseline values
-def initialize_baseline_values():
-    global today_total_energy, daily_start_value, last_reset_day, weekly_energy
-    
-    async def fetch_initial_data():
-        return await get_kasa_data()
+# Function to get the energy recorded for each weekday over the last 7 days
+def get_weekly_energy(plug_ids):
+    today = datetime.now().date()
+    weekly_energy = [0] * 7
+    for row in energy_store.daily_between(today - timedelta(days=6), today, plug_ids):
+        weekday = datetime.strptime(row["day"], "%Y-%m-%d").weekday()
+        weekly_energy[weekday] = row["energy_kwh"]
+    return weekly_energy
+
+# Function to stream rows as a download; columns are (name, arrow type) pairs.
+# Rows are pulled lazily from the store and encoded chunk by chunk, so memory
+# stays flat however long the export is
+def export_response(name, columns, rows, file_format="csv"):
+    if file_format in ("arrow", "parquet"):
+        body = arrow_chunks(columns, rows, file_format)
+    else:
+        body = csv_chunks([column for column, _ in columns], rows)
+        if file_format == "csv.gz":
+            body = gzip_chunks(body)
     
+    extension, mimetype = EXPORT_FORMATS[file_format]
+    return Response(body, mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={name}{extension}"
+    })
+
+# Function to parse a ?from=/?to= value given as epoch seconds or ISO date/time
+def parse_time_arg(value, default):
+    if not value:
+        return default
     try:
-        # Get current values from Kasa
-        data = asyncio.run(fetch_initial_data())
-        daily_energy = data["daily_energy"]
-        
-        # Set initial values
-        today_total_energy = daily_energy
-        daily_start_value = 0  # We start tracking from current value
-        last_reset_day = datetime.now().day
-        
-        # Load daily data if available
-        if os.path.exists(DAILY_ENERGY_CSV):
-            df = pd.read_csv(DAILY_ENERGY_CSV)
-            days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-            
-            for i, day in enumerate(days):
-                row = df[df["day"] == day]
-                if not row.empty:
-                    weekly_energy[i] = row.iloc[0]["energy_kwh"]
-        
-        # Update current day's energy
-        current_day_idx = datetime.now().weekday()
-        weekly_energy[current_day_idx] = daily_energy
-        
-    except Exception as e:
-        logging.error(f"Error initializing baseline values: {e}")
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
 
-# Start Background Scheduler
+# Function to send JSON gzip-compressed when the client accepts it
+def compressed_json(payload, status=200):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    response = Response(body, status=status, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    if len(body) > 1024 and "gzip" in request.headers.get("Accept-Encoding", ""):
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+# Function to open the time-series store
+def open_energy_store():
+    global energy_store
+    energy_store = EnergyStore(ENERGY_DB_FILE)
+
+# Background Scheduler, started once the store and in-memory state are loaded
 scheduler = BackgroundScheduler()
-scheduler.add_job(update_all_data, "interval", seconds=30, coalesce=True, max_instances=1)
-scheduler.start()
+
+def start_scheduler():
+    # The first poll runs right away on the scheduler thread instead of blocking start-up
+    scheduler.add_job(update_all_data, "interval", seconds=POLL_INTERVAL, coalesce=True, max_instances=1,
+                      next_run_time=datetime.now())
+    scheduler.add_job(sample_power, "interval", seconds=POWER_SAMPLE_INTERVAL, coalesce=True, max_instances=1)
+    if POWER_SNAPSHOT_INTERVAL > 0:
+        scheduler.add_job(save_power_snapshot, "interval", seconds=POWER_SNAPSHOT_INTERVAL, coalesce=True, max_instances=1)
+        atexit.register(save_power_snapshot)
+    scheduler.start()
+
+# Function to load everything the routes need, run in the background so the
+# server binds its port straight away; nothing here waits on the plugs
+def warm_up():
+    steps = [
+        ("plugs", lambda: plugs.load(PLUGS_CONFIG_FILE, default_host=PLUG_IP)),
+        ("energy_store", open_energy_store),
+        ("legacy_csv", migrate_legacy_csv),
+        ("latest_reading", load_latest_reading),
+        ("anomaly_baselines", seed_anomaly_detectors),
+        ("power_snapshot", load_power_snapshot),
+        ("scheduler", start_scheduler)
+    ]
+    try:
+        for name, step in steps:
+            began = time.perf_counter()
+            step()
+            warmup_state["steps"][name] = round(time.perf_counter() - began, 3)
+        warmup_state["startup_seconds"] = round(time.perf_counter() - startup_began, 3)
+        warmup_state["ready"] = True
+        logging.info(f"Warm-up finished in {warmup_state['startup_seconds']}s: {warmup_state['steps']}")
+    except Exception as e:
+        warmup_state["error"] = f"{name}: {e}"
+        logging.error(f"Warm-up failed at {name}: {e}")
 
 # Flask API Routes
 @app.before_request
 def log_request_info():
     logging.info(f"Request: {request.method} {request.url}")
 
+@app.before_request
+def require_warm_up():
+    # Data routes answer 503 until the store and plug list are loaded
+    if not warmup_state["ready"] and request.endpoint not in ("home", "favicon", "readiness"):
+        return jsonify({"error": "Service is starting up", "warmup": warmup_state}), 503, {"Retry-After": "1"}
+
 @app.route("/", methods=["GET"])
 def home():
     return jsonify({"message": "Welcome to the Smart Plug Energy Monitoring API"}), 200
@@ -300,24 +409,39 @@ def home():
 def favicon():
     return "", 204
 
+@app.route("/ready", methods=["GET"])
+def readiness():
+    """
+    Readiness probe: 200 once warm-up has finished, 503 with its progress until then
+    """
+    return jsonify(warmup_state), 200 if warmup_state["ready"] else 503
+
+@app.route("/plugs", methods=["GET"])
+def list_plugs():
+    """
+    List the monitored plugs with their last known reading
+    """
+    plug_list = {}
+    for plug in plugs:
+        reading = plug.cached_reading() or {}
+        reading.pop("daily_data", None)
+        plug_list[plug.plug_id] = {"host": plug.host, "reading": reading}
+    return jsonify(plug_list), 200
+
 @app.route("/energy", methods=["GET"])
 def energy_readings():
-    if not os.path.exists(ENERGY_CSV_FILE):
-        return jsonify({"error": "No data available"}), 404
+    selector = request.args.get("plug", ALL_PLUGS)
+    if selector != ALL_PLUGS and not plugs.get(selector):
+        return unknown_plug_response()
     
-    with open(ENERGY_CSV_FILE, mode="r", newline="") as file:
-        reader = list(csv.reader(file))
-        if len(reader) <= 1:
-            return jsonify({"error": "No data recorded yet"}), 404
-        
-        last_entry = reader[-1]
-        return jsonify({
-            "timestamp": last_entry[0],
-            "current_power": float(last_entry[1]),
-            "total_energy": float(last_entry[2]),
-            "daily_energy": float(last_entry[3]),
-            "running_energy_sum": float(last_entry[4])
-        }), 200
+    # Served from the in-memory snapshot so cost does not grow with the log
+    with latest_reading_lock:
+        reading = latest_readings.get(selector)
+    
+    if reading is None:
+        return jsonify({"error": "No data recorded yet"}), 404
+    
+    return jsonify(reading), 200
 
 @app.route("/energy_daily", methods=["GET"])
 def energy_daily():
@@ -325,16 +449,19 @@ def energy_daily():
     Get today's total energy consumption so far
     """
     try:
-        async def fetch_daily_energy():
-            data = await get_kasa_data()
-            return data["daily_energy"]
+        plug_ids = selected_plug_ids()
+        if plug_ids is None:
+            return unknown_plug_response()
         
-        daily_energy = asyncio.run(fetch_daily_energy())
+        readings = get_kasa_data(plug_ids)
         
         return jsonify({
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "daily_energy_kwh": daily_energy,
-            "day": datetime.now().strftime("%A")
+            "daily_energy_kwh": sum(data["daily_energy"] for data in readings.values()),
+            "day": datetime.now().strftime("%A"),
+            "stale": any(data["stale"] for data in readings.values()),
+            "reading_age_seconds": max((data["age_seconds"] or 0 for data in readings.values()), default=None),
+            "plugs": {plug_id: data["daily_energy"] for plug_id, data in readings.items()}
         }), 200
     except Exception as e:
         logging.error(f"Error in /energy_daily: {e}")
@@ -346,16 +473,19 @@ def get_hourly_energy():
     Get today's energy consumption broken down by hour (0-23)
     """
     try:
-        if not os.path.exists(HOURLY_ENERGY_CSV):
-            return jsonify({"error": "No hourly data available"}), 404
+        plug_ids = selected_plug_ids()
+        if plug_ids is None:
+            return unknown_plug_response()
         
-        df = pd.read_csv(HOURLY_ENERGY_CSV)
-        df = df.sort_values("hour")
+        # Indexed range read over today's hourly rollups
+        values = [0] * 24
+        for row in energy_store.hourly_for_day(datetime.now().date(), plug_ids):
+            values[datetime.fromtimestamp(row["hour_start"]).hour] = row["energy_kwh"]
         
         # Format for frontend use
         hourly_data = {
-            "hours": df["hour"].tolist(),
-            "values": df["energy_kwh"].tolist(),
+            "hours": list(range(24)),
+            "values": values,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
@@ -370,25 +500,19 @@ def get_daily_energy():
     Get energy data for each day of the week (Mon-Sun)
     """
     try:
-        if not os.path.exists(DAILY_ENERGY_CSV):
-            return jsonify({"error": "No daily data available"}), 404
-        
-        df = pd.read_csv(DAILY_ENERGY_CSV)
-        
-        # Ensure days are in correct order
-        days_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        df["day"] = pd.Categorical(df["day"], categories=days_order, ordered=True)
-        df = df.sort_values("day")
+        plug_ids = selected_plug_ids()
+        if plug_ids is None:
+            return unknown_plug_response()
         
         # Format for frontend use
         daily_data = {
-            "days": df["day"].tolist(),
-            "values": df["energy_kwh"].tolist(),
+            "days": DAYS,
+            "values": get_weekly_energy(plug_ids),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
         return jsonify(daily_data), 200
-        
+    
     except Exception as e:
         logging.error(f"Error in /energy/daily: {e}")
         return jsonify({"error": str(e)}), 500
@@ -396,97 +520,228 @@ def get_daily_energy():
 @app.route("/energy/current_power", methods=["GET"])
 def get_current_power():
     """
-    Get power data for the last 5 minutes (30-second intervals)
+    Get recent power data from the in-memory buffer.
+    Query: seconds (window, default 300), points (max points returned, default 60), plug
     """
+    import numpy as np
+    from downsample import lttb
+    
     try:
-        if not os.path.exists(POWER_CSV_FILE):
+        selector = request.args.get("plug", ALL_PLUGS)
+        if selector != ALL_PLUGS and not plugs.get(selector):
+            return unknown_plug_response()
+        
+        seconds = float(request.args.get("seconds", 300))
+        points = min(max(int(request.args.get("points", 60)), 3), HISTORY_MAX_POINTS)
+        buffer = power_buffers.get(selector)
+        ts, values = buffer.since(time.time() - seconds) if buffer is not None else ([], [])
+        if not len(ts):
             return jsonify({"error": "No power data available"}), 404
         
-        df = pd.read_csv(POWER_CSV_FILE, parse_dates=["timestamp"])
-        
-        # Get most recent readings (up to 10 = 5 minutes worth)
-        df = df.tail(10).copy()
+        # LTTB keeps the spikes of short appliance transients when thinning the window
+        shown_ts, shown_values = lttb(ts, values, points)
         
         # Format for frontend use
         power_data = {
-            "timestamps": [ts.strftime("%H:%M:%S") for ts in df["timestamp"]],
-            "values": df["power_watts"].tolist(),
-            "current_value": df["power_watts"].iloc[-1] if not df.empty else 0,
+            "timestamps": [datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in shown_ts],
+            "values": np.round(shown_values, 2).tolist(),
+            "current_value": round(float(values[-1]), 2),
+            "peak_value": round(float(values.max()), 2),
+            "sample_interval": POWER_SAMPLE_INTERVAL,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
         return jsonify(power_data), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
     except Exception as e:
         logging.error(f"Error in /energy/current_power: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/energy/history", methods=["GET"])
+def get_energy_history():
+    """
+    Get a downsampled series for a time range.
+    Query: from/to (epoch seconds or ISO), points, mode (lttb|minmax),
+    field (power|daily_energy|total_energy), plug
+    """
+    import numpy as np
+    from downsample import lttb, bucket_stats
+    
+    try:
+        plug_ids = selected_plug_ids()
+        if plug_ids is None:
+            return unknown_plug_response()
+        
+        end = parse_time_arg(request.args.get("to"), datetime.now())
+        start = parse_time_arg(request.args.get("from"), end - timedelta(days=1))
+        points = min(max(int(request.args.get("points", HISTORY_DEFAULT_POINTS)), 3), HISTORY_MAX_POINTS)
+        mode = request.args.get("mode", "lttb")
+        field = request.args.get("field", "power")
+        if end <= start:
+            return jsonify({"error": "'to' must be after 'from'"}), 400
+        if mode not in ("lttb", "minmax") or field not in HISTORY_FIELDS:
+            return jsonify({"error": "Invalid mode or field"}), 400
+        
+        ts, values = energy_store.series_between(start, end, plug_ids, HISTORY_FIELDS[field])
+        
+        # Compact columnar payload: epoch seconds plus values rounded to 3 decimals
+        history = {
+            "plug": request.args.get("plug", ALL_PLUGS),
+            "field": field,
+            "mode": mode,
+            "from": int(start.timestamp()),
+            "to": int(end.timestamp()),
+            "raw_points": len(ts)
+        }
+        if mode == "lttb":
+            ts, values = lttb(ts, values, points)
+            history.update(t=ts.astype(np.int64).tolist(), v=np.round(values, 3).tolist())
+        else:
+            bucket_start, mins, maxs, avgs, counts = bucket_stats(ts, values, start.timestamp(), end.timestamp(), points)
+            history.update(
+                t=bucket_start.astype(np.int64).tolist(),
+                min=np.round(mins, 3).tolist(),
+                max=np.round(maxs, 3).tolist(),
+                avg=np.round(avgs, 3).tolist(),
+                count=counts.astype(np.int64).tolist()
+            )
+        
+        return compressed_json(history)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        logging.error(f"Error in /energy/history: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/energy/alert", methods=["GET"])
 def energy_alert():
     """
-    Check if today's energy usage is above the rolling average
+    Check today's energy so far against the time-of-week baseline for this
+    point of the day. Served from the streaming detector without touching the plug.
     """
     try:
-        # Get today's energy
-        async def fetch_daily_energy():
-            data = await get_kasa_data()
-            return data["daily_energy"]
+        selector = request.args.get("plug", ALL_PLUGS)
+        if selector != ALL_PLUGS and not plugs.get(selector):
+            return unknown_plug_response()
+        
+        detector = anomaly_detectors.get(selector)
+        with latest_reading_lock:
+            reading = latest_readings.get(selector)
+        if detector is None or reading is None:
+            return jsonify({"error": "No data recorded yet"}), 404
         
-        today_energy = asyncio.run(fetch_daily_energy())
+        now = datetime.now()
+        reading_time = datetime.strptime(reading["timestamp"], "%Y-%m-%d %H:%M:%S")
+        today_energy = reading["daily_energy"] if reading_time.date() == now.date() else 0
+        alert = detector.evaluate(now, today_energy)
         
-        # Calculate rolling average from weekly data
-        if os.path.exists(DAILY_ENERGY_CSV):
-            df = pd.read_csv(DAILY_ENERGY_CSV)
-            # Exclude zeros when calculating average
-            non_zero_values = df[df["energy_kwh"] > 0]["energy_kwh"]
-            rolling_avg = non_zero_values.mean() if len(non_zero_values) > 0 else 0
+        if alert["baseline_ready"]:
+            rolling_avg = alert["expected_kwh_so_far"]
         else:
-            rolling_avg = 0
-        
-        # Check if today's usage is above average
-        is_above_average = today_energy > rolling_avg if rolling_avg > 0 else False
-        
-        return jsonify({
-            "is_above_average": bool(is_above_average),
-            "today_energy_kwh": today_energy,
-            "rolling_average_kwh": round(rolling_avg, 3),
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }), 200
+            # Until a couple of weeks are learned, fall back to the plain mean of recent days
+            plug_ids = selected_plug_ids(selector)
+            non_zero_values = [value for value in get_weekly_energy(plug_ids) if value > 0]
+            rolling_avg = sum(non_zero_values) / len(non_zero_values) if non_zero_values else 0
+            alert["is_above_average"] = today_energy > rolling_avg if rolling_avg > 0 else False
+        
+        reading_age = (now - reading_time).total_seconds()
+        return jsonify(dict(
+            alert,
+            rolling_average_kwh=round(rolling_avg, 3),
+            stale=reading_age > 2 * POLL_INTERVAL,
+            reading_age_seconds=round(reading_age, 1)
+        )), 200
     except Exception as e:
         logging.error(f"Error in /energy/alert: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/energy/alert/stream", methods=["GET"])
+def energy_alert_stream():
+    """
+    Server-sent events: energy_alert / energy_alert_cleared as the poller detects them
+    """
+    subscriber = alert_feed.subscribe()
+    return Response(alert_feed.stream(subscriber), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route("/download_csv", methods=["GET"])
 def download_csv():
     """
-    Download a CSV file
+    Download energy data as a streamed file.
+    Query: type (energy|hourly|daily|power), plug, format (csv|csv.gz|arrow|parquet);
+    for type=energy also from/to (epoch seconds or ISO) and resolution (raw|hourly|daily)
     """
-    file_type = request.args.get("type", "energy")
-    
-    if file_type == "energy":
-        file_path = ENERGY_CSV_FILE
-    elif file_type == "hourly":
-        file_path = HOURLY_ENERGY_CSV
-    elif file_type == "daily":
-        file_path = DAILY_ENERGY_CSV
-    elif file_type == "power":
-        file_path = POWER_CSV_FILE
-    else:
-        return jsonify({"error": "Invalid file type"}), 400
-    
-    if not os.path.exists(file_path):
-        return jsonify({"error": "File not available"}), 404
-    
-    return send_file(file_path, as_attachment=True)
+    try:
+        file_type = request.args.get("type", "energy")
+        file_format = request.args.get("format", "csv")
+        plug_ids = selected_plug_ids()
+        if plug_ids is None:
+            return unknown_plug_response()
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({"error": "Invalid format", "formats": list(EXPORT_FORMATS)}), 400
+        if file_format in ("arrow", "parquet") and not arrow_available():
+            return jsonify({"error": f"The {file_format} format needs pyarrow installed on the server"}), 400
+        
+        if file_type == "energy":
+            end = parse_time_arg(request.args.get("to"), datetime.now() + timedelta(days=1))
+            start = parse_time_arg(request.args.get("from"), datetime.fromtimestamp(0))
+            resolution = request.args.get("resolution", "raw")
+            if resolution == "raw":
+                samples = energy_store.samples_between(start, end, plug_ids)
+                rows = ((sample["plug_id"], datetime.fromtimestamp(sample["ts"]), sample["current_power_watts"],
+                         sample["total_energy_kwh"], sample["daily_energy_kwh"], sample["running_energy_sum"])
+                        for sample in samples)
+                columns = [("plug_id", "string"), ("timestamp", "timestamp_s"), ("current_power_watts", "float64"),
+                           ("total_energy_kwh", "float64"), ("daily_energy_kwh", "float64"), ("running_energy_sum", "float64")]
+            elif resolution == "hourly":
+                rows = ((datetime.fromtimestamp(r["hour_start"]), r["energy_kwh"], r["samples"], r["power_sum"] / r["samples"])
+                        for r in energy_store.hourly_between(start, end, plug_ids))
+                columns = [("hour_start", "timestamp_s"), ("energy_kwh", "float64"), ("samples", "int64"), ("avg_power_watts", "float64")]
+            elif resolution == "daily":
+                rows = ((datetime.strptime(r["day"], "%Y-%m-%d").date(), r["energy_kwh"], r["samples"], r["power_sum"] / r["samples"])
+                        for r in energy_store.daily_between(start.date(), end.date(), plug_ids))
+                columns = [("day", "date"), ("energy_kwh", "float64"), ("samples", "int64"), ("avg_power_watts", "float64")]
+            else:
+                return jsonify({"error": "Invalid resolution. Use 'raw', 'hourly' or 'daily'"}), 400
+            name = "energy_data" if resolution == "raw" else f"{resolution}_energy_data"
+            return export_response(name, columns, rows, file_format)
+        elif file_type == "hourly":
+            rows = ((datetime.fromtimestamp(r["hour_start"]).hour, r["energy_kwh"]) for r in energy_store.hourly_for_day(datetime.now().date(), plug_ids))
+            return export_response("hourly_energy_data", [("hour", "int64"), ("energy_kwh", "float64")], rows, file_format)
+        elif file_type == "daily":
+            return export_response("daily_energy_data", [("day", "string"), ("energy_kwh", "float64")],
+                                   zip(DAYS, get_weekly_energy(plug_ids)), file_format)
+        elif file_type == "power":
+            buffer = power_buffers.get(request.args.get("plug", ALL_PLUGS))
+            ts, values = buffer.snapshot() if buffer is not None else ([], [])
+            rows = ((datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], round(float(v), 3)) for t, v in zip(ts, values))
+            return export_response("power_data", [("timestamp", "string"), ("power_watts", "float64")], rows, file_format)
+        else:
+            return jsonify({"error": "Invalid file type"}), 400
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
 
 @app.route("/status", methods=["GET"])
 def get_plug_status():
     try:
-        async def fetch_plug_status():
-            plug = await Discover.discover_single(PLUG_IP)
-            await plug.update()
-            return plug.is_on
-        is_on = asyncio.run(fetch_plug_status())
-        return jsonify({"plug_state": is_on}), 200
+        plug_ids = selected_plug_ids()
+        if plug_ids is None:
+            return unknown_plug_response()
+        
+        readings = get_kasa_data(plug_ids)
+        states = {plug_id: data["is_on"] for plug_id, data in readings.items()}
+        if all(state is None for state in states.values()):
+            raise ConnectionError("No reading available from the plugs")
+        
+        # For the whole home, the plug state is "on" if any plug is on
+        return jsonify({
+            "plug_state": any(states.values()),
+            "stale": any(data["stale"] for data in readings.values()),
+            "plugs": states
+        }), 200
     except Exception as e:
         logging.error(f"Failed to fetch plug status: {e}")
         return jsonify({"error": "Failed to get plug status"}), 500
@@ -498,25 +753,39 @@ def toggle_plug():
         action = data.get("action")
         if action not in ["on", "off"]:
             return jsonify({"error": "Invalid action. Use 'on' or 'off'"}), 400
-        async def toggle_action():
-            plug = await Discover.discover_single(PLUG_IP)
-            await plug.update()
-            if action == "on":
-                await plug.turn_on()
-            else:
-                await plug.turn_off()
-            await plug.update()
-            return plug.is_on
-        is_on = asyncio.run(toggle_action())
-        return jsonify({"plug_state": is_on}), 200
+        
+        # A switch is never defaulted to the whole home: without a plug it only
+        # means the single configured plug, as the app sends it
+        plug_id = data.get("plug")
+        if plug_id is None and len(plugs) == 1:
+            plug_id = plugs.ids()[0]
+        if plug_id is None or plug_id == ALL_PLUGS:
+            return jsonify({"error": "Name the plug to switch", "plugs": plugs.ids()}), 400
+        plug = plugs.get(plug_id)
+        if plug is None:
+            return unknown_plug_response()
+        
+        # A command the plug has not carried out by the deadline is cancelled,
+        # so a retry cannot switch it long after the user gave up
+        future = plug_loop.submit(plug.set_state(action == "on"))
+        try:
+            state = future.result(TOGGLE_DEADLINE)
+        except FutureTimeoutError:
+            future.cancel()
+            logging.error(f"Plug {plug_id} did not switch {action} within {TOGGLE_DEADLINE}s")
+            return jsonify({"error": "Plug did not answer in time", "plug": plug_id}), 504
+        
+        return jsonify({"plug_state": state, "plugs": {plug_id: state}}), 200
     except Exception as e:
         logging.error(f"Failed to toggle plug state: {e}")
         return jsonify({"error": "Failed to toggle plug"}), 500
 
-# Initialize everything
-initialize_csv_files()
-initialize_baseline_values()
+# Initialize everything in the background
+threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
 # Run Flask app
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5050, debug=True)
+    # The reloader re-imports the app in a second process, which doubles start-up
+    # and runs a second poller; opt in with FLASK_RELOAD=1 while developing
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "5050")), debug=True,
+            use_reloader=os.environ.get("FLASK_RELOAD") == "1")
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a sorted series.
+
+    Keeps the first and last points and, for each of the n_out - 2 buckets in
+    between, the point forming the largest triangle with the previously kept
+    point and the average of the next bucket. The loop runs once per output
+    bucket; all per-sample work inside it is vectorized.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Bucket boundaries over the interior points 1..n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of every bucket from cumulative sums, with the last point
+    # standing in as the bucket after the final one
+    counts = ends - starts
+    x_cum = np.concatenate(([0.0], np.cumsum(x)))
+    y_cum = np.concatenate(([0.0], np.cumsum(y)))
+    avg_x = np.append((x_cum[ends] - x_cum[starts]) / counts, x[-1])
+    avg_y = np.append((y_cum[ends] - y_cum[starts]) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = starts[i], ends[i]
+        areas = np.abs(
+            (x[prev] - avg_x[i + 1]) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (avg_y[i + 1] - y[prev])
+        )
+        prev = start + int(np.argmax(areas))
+        selected[i + 1] = prev
+
+    return x[selected], y[selected]
+
+
+def bucket_stats(x, y, start, end, n_buckets):
+    """
+    Split [start, end) into n_buckets equal time buckets and return
+    (bucket_start, min, max, avg, count) arrays for the non-empty ones.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(start, end, n_buckets + 1)
+    if len(x) == 0:
+        empty = np.array([])
+        return empty, empty, empty, empty, empty
+
+    bucket = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, n_buckets - 1)
+    # x is sorted, so each bucket is a contiguous run starting where its index first appears
+    firsts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[firsts, len(x)])
+    mins = np.minimum.reduceat(y, firsts)
+    maxs = np.maximum.reduceat(y, firsts)
+    avgs = np.add.reduceat(y, firsts) / counts
+    return edges[bucket[firsts]], mins, maxs, avgs, counts
@@ -0,0 +1,277 @@
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+
+class EnergyStore:
+    """
+    SQLite time-series store for smart plug readings.
+
+    Raw samples live in `samples`, keyed by (plug_id, epoch second). Every
+    insert also upserts the matching rows of the `hourly` and `daily` rollup
+    tables in the same transaction, so the graph endpoints become primary-key
+    range reads instead of re-parsing CSV files. A sample already stored for
+    that plug and second is kept and not folded in again, so importing the
+    same log twice leaves the rollups as they were.
+
+    Rollup energy_kwh holds the plug's daily energy counter as of the last
+    sample in that hour/day, which is what the old hourly/daily CSVs stored.
+    Reads take a list of plug ids and sum the rollups across them, which gives
+    the whole-home view when every plug is selected.
+    """
+
+    SERIES_COLUMNS = ("current_power_watts", "total_energy_kwh", "daily_energy_kwh")
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS samples (
+            plug_id TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            current_power_watts REAL,
+            total_energy_kwh REAL,
+            daily_energy_kwh REAL,
+            running_energy_sum REAL,
+            PRIMARY KEY (plug_id, ts)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS hourly (
+            plug_id TEXT NOT NULL,
+            hour_start INTEGER NOT NULL,
+            energy_kwh REAL,
+            samples INTEGER,
+            power_sum REAL,
+            power_min REAL,
+            power_max REAL,
+            PRIMARY KEY (plug_id, hour_start)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily (
+            plug_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            energy_kwh REAL,
+            samples INTEGER,
+            power_sum REAL,
+            power_min REAL,
+            power_max REAL,
+            PRIMARY KEY (plug_id, day)
+        ) WITHOUT ROWID
+        """,
+    ]
+
+    INSERT_SAMPLE = """
+        INSERT OR IGNORE INTO samples (plug_id, ts, current_power_watts, total_energy_kwh, daily_energy_kwh, running_energy_sum)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+
+    UPSERT_HOURLY = """
+        INSERT INTO hourly (plug_id, hour_start, energy_kwh, samples, power_sum, power_min, power_max)
+        VALUES (?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT(plug_id, hour_start) DO UPDATE SET
+            energy_kwh = excluded.energy_kwh,
+            samples = samples + 1,
+            power_sum = power_sum + excluded.power_sum,
+            power_min = min(power_min, excluded.power_min),
+            power_max = max(power_max, excluded.power_max)
+    """
+
+    UPSERT_DAILY = """
+        INSERT INTO daily (plug_id, day, energy_kwh, samples, power_sum, power_min, power_max)
+        VALUES (?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT(plug_id, day) DO UPDATE SET
+            energy_kwh = excluded.energy_kwh,
+            samples = samples + 1,
+            power_sum = power_sum + excluded.power_sum,
+            power_min = min(power_min, excluded.power_min),
+            power_max = max(power_max, excluded.power_max)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        with self._write_lock, self._writer:
+            for statement in self.SCHEMA:
+                self._writer.execute(statement)
+
+    # ---------------- Connections ---------------- #
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets Flask threads read while the poller writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    # ---------------- Writes ---------------- #
+
+    @staticmethod
+    def _sample_params(plug_id, when, current_power, total_energy, daily_energy, running_sum):
+        ts = int(when.timestamp())
+        hour_start = int(when.replace(minute=0, second=0, microsecond=0).timestamp())
+        day = when.strftime("%Y-%m-%d")
+        return (
+            (plug_id, ts, current_power, total_energy, daily_energy, running_sum),
+            (plug_id, hour_start, daily_energy, current_power, current_power, current_power),
+            (plug_id, day, daily_energy, current_power, current_power, current_power),
+        )
+
+    def insert_sample(self, plug_id, when, current_power, total_energy, daily_energy, running_sum):
+        self.insert_samples([(plug_id, when, current_power, total_energy, daily_energy, running_sum)])
+
+    def insert_samples(self, rows):
+        """
+        Insert (plug_id, datetime, current_power, total_energy, daily_energy,
+        running_sum) rows and fold them into the rollups in a single transaction.
+        Returns how many were new; duplicates of stored samples are skipped.
+        """
+        params = [self._sample_params(*row) for row in rows]
+        inserted = 0
+        with self._write_lock, self._writer:
+            for sample, hourly, daily in params:
+                # Only a sample that was actually stored may count in the rollups
+                if self._writer.execute(self.INSERT_SAMPLE, sample).rowcount:
+                    self._writer.execute(self.UPSERT_HOURLY, hourly)
+                    self._writer.execute(self.UPSERT_DAILY, daily)
+                    inserted += 1
+        return inserted
+
+    # ---------------- Reads ---------------- #
+
+    @staticmethod
+    def _in_clause(plug_ids):
+        return ", ".join("?" for _ in plug_ids)
+
+    def is_empty(self):
+        return self._reader().execute("SELECT 1 FROM samples LIMIT 1").fetchone() is None
+
+    def latest_sample(self, plug_id):
+        row = self._reader().execute(
+            "SELECT * FROM samples WHERE plug_id = ? ORDER BY ts DESC LIMIT 1", (plug_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def samples_between(self, start, end, plug_ids):
+        """Yield raw samples of the given plugs with start <= time < end, oldest first."""
+        cursor = self._reader().execute(
+            f"SELECT * FROM samples WHERE plug_id IN ({self._in_clause(plug_ids)}) AND ts >= ? AND ts < ? ORDER BY ts",
+            (*plug_ids, int(start.timestamp()), int(end.timestamp()))
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def series_between(self, start, end, plug_ids, column="current_power_watts"):
+        """
+        Return (timestamps, values) NumPy arrays for one sample column over
+        start <= time < end, summed across the selected plugs at each tick.
+        """
+        import numpy as np
+        if column not in self.SERIES_COLUMNS:
+            raise ValueError(f"Unknown series column: {column}")
+        rows = self._reader().execute(
+            f"""
+            SELECT ts, SUM({column}) FROM samples
+            WHERE plug_id IN ({self._in_clause(plug_ids)}) AND ts >= ? AND ts < ?
+            GROUP BY ts ORDER BY ts
+            """,
+            (*plug_ids, int(start.timestamp()), int(end.timestamp()))
+        ).fetchall()
+        series = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return series[:, 0], series[:, 1]
+
+    def hourly_between(self, start, end, plug_ids):
+        """
+        Yield hourly rollups for start <= hour < end, summed across plugs,
+        oldest first; "plugs" is how many of the plugs have a row that hour.
+        """
+        cursor = self._reader().execute(
+            f"""
+            SELECT hour_start, SUM(energy_kwh) AS energy_kwh, SUM(samples) AS samples, SUM(power_sum) AS power_sum,
+                   COUNT(*) AS plugs
+            FROM hourly
+            WHERE plug_id IN ({self._in_clause(plug_ids)}) AND hour_start >= ? AND hour_start < ?
+            GROUP BY hour_start ORDER BY hour_start
+            """,
+            (*plug_ids, int(start.timestamp()), int(end.timestamp()))
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def daily_between(self, start_day, end_day, plug_ids):
+        """Yield daily rollups for start_day <= day <= end_day (date objects), summed across plugs."""
+        cursor = self._reader().execute(
+            f"""
+            SELECT day, SUM(energy_kwh) AS energy_kwh, SUM(samples) AS samples, SUM(power_sum) AS power_sum
+            FROM daily
+            WHERE plug_id IN ({self._in_clause(plug_ids)}) AND day >= ? AND day <= ?
+            GROUP BY day ORDER BY day
+            """,
+            (*plug_ids, start_day.strftime("%Y-%m-%d"), end_day.strftime("%Y-%m-%d"))
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def hourly_for_day(self, day, plug_ids):
+        start = datetime.combine(day, datetime.min.time())
+        return self.hourly_between(start, start + timedelta(days=1), plug_ids)
+
+    # ---------------- Migration ---------------- #
+
+    def import_energy_csv(self, csv_path, plug_id="main", batch_size=5000):
+        """
+        Import the legacy append-only energy_data.csv log. The hourly, daily
+        and power CSVs were derived from this log, so the rollups are rebuilt
+        from it rather than imported separately.
+        """
+        imported = 0
+        batch = []
+        with open(csv_path, mode="r", newline="") as file:
+            # Power loss on the SD card can leave runs of NUL bytes in the log
+            reader = csv.reader(line.replace("\x00", "") for line in file)
+            next(reader, None)  # Skip header
+            for row in reader:
+                try:
+                    when = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
+                    batch.append((plug_id, when, float(row[1]), float(row[2]), float(row[3]), float(row[4])))
+                except (ValueError, IndexError):
+                    logging.warning(f"Skipping malformed energy row: {row}")
+                    continue
+                if len(batch) >= batch_size:
+                    imported += self.insert_samples(batch)
+                    batch = []
+        if batch:
+            imported += self.insert_samples(batch)
+        return imported
+
+
+if __name__ == "__main__":
+    # Usage: python energy_store.py [energy_data.csv] [energy_data.db] [plug_id]
+    logging.basicConfig(level=logging.INFO)
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "energy_data.csv"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "energy_data.db"
+    plug_id = sys.argv[3] if len(sys.argv) > 3 else "main"
+
+    if not os.path.exists(csv_path):
+        print(f"ERROR: {csv_path} not found")
+        sys.exit(1)
+
+    store = EnergyStore(db_path)
+    count = store.import_energy_csv(csv_path, plug_id=plug_id)
+    print(f"Imported {count} samples from {csv_path} into {db_path} as plug '{plug_id}'")
@@ -0,0 +1,89 @@
+import csv
+import io
+import itertools
+import zlib
+
+# format -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "arrow": (".arrows", "application/vnd.apache.arrow.stream"),
+    "parquet": (".parquet", "application/vnd.apache.parquet")
+}
+
+CHUNK_SIZE = 64 * 1024
+BATCH_ROWS = 10000
+
+
+def csv_chunks(header, rows, chunk_size=CHUNK_SIZE):
+    """Encode rows as CSV text, yielded in chunks of about chunk_size characters."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of str/bytes chunks incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def arrow_chunks(columns, rows, file_format="arrow", batch_rows=BATCH_ROWS):
+    """
+    Encode rows as an Arrow IPC stream or a Parquet file, one record batch
+    (or row group) of batch_rows at a time. columns is a list of
+    (name, pyarrow type name) pairs, e.g. ("timestamp", "timestamp_s").
+    Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"string": pa.string(), "float64": pa.float64(), "int64": pa.int64(),
+             "timestamp_s": pa.timestamp("s"), "date": pa.date32()}
+    schema = pa.schema([(name, types[type_name]) for name, type_name in columns])
+
+    # Writers append to this buffer; whatever they wrote is handed on and the buffer emptied
+    sink = io.BytesIO()
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = writer.write_table
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_rows))
+        if not batch:
+            break
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        record_batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        write(pa.Table.from_batches([record_batch]) if file_format == "parquet" else record_batch)
+        yield drain()
+    writer.close()
+    yield drain()
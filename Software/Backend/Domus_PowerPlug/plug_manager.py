@@ -0,0 +1,357 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+
+class PlugLoop:
+    """
+    A single long-lived asyncio loop running in a daemon thread.
+
+    Flask routes and the APScheduler job hand coroutines to the loop with
+    submit()/run() instead of spinning up a fresh event loop per call. Every
+    plug shares this one loop, so polling a dozen plugs is one gather().
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="kasa-loop", daemon=True)
+        self._started = threading.Event()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self):
+        if not self._thread.is_alive():
+            self._thread.start()
+            self._started.wait()
+        return self
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the plug loop and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the plug loop and block the calling thread for its result."""
+        return self.submit(coro).result(timeout)
+
+
+class PlugManager:
+    """
+    Cached, reconnecting handle to one Kasa plug, driven from a shared PlugLoop.
+
+    The device is discovered once and every later request is a single round
+    trip. If a call fails the handle is dropped and rediscovered on the next
+    attempt.
+
+    Energy readings go through a shared cache: a reading younger than the
+    freshness TTL is reused, concurrent refreshes share one in-flight device
+    query, and callers stop waiting at their deadline. After repeated failures
+    a circuit breaker stops querying the plug for a cooldown period and the
+    last known reading is served, flagged as stale.
+    """
+
+    def __init__(self, plug_id, host, loop, retries=3, retry_delay=5, reading_ttl=10, query_timeout=10,
+                 breaker_threshold=3, breaker_cooldown=30, device=None):
+        self.plug_id = plug_id
+        self.host = host
+        self.loop = loop
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.reading_ttl = reading_ttl
+        self.query_timeout = query_timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._device = device
+        self._device_lock = None
+        # (reading, monotonic time it was taken); replaced as a whole so other
+        # threads can read it without a lock
+        self._cached = (None, 0.0)
+        self._inflight = None
+        self._failures = 0
+        self._breaker_open_until = 0.0
+
+    def submit(self, coro):
+        return self.loop.submit(coro)
+
+    def run(self, coro, timeout=None):
+        return self.loop.run(coro, timeout)
+
+    # ---------------- Device Handle ---------------- #
+
+    async def _get_device(self):
+        # Created lazily on the loop thread so it is bound to the right loop
+        if self._device_lock is None:
+            self._device_lock = asyncio.Lock()
+        async with self._device_lock:
+            if self._device is None:
+                from kasa import Discover  # python-kasa is slow to import; load it on first use
+                device = await Discover.discover_single(self.host)
+                if device is None:
+                    raise ConnectionError(f"Plug {self.host} did not answer discovery")
+                self._device = device
+                logging.info(f"Connected to plug {self.plug_id} at {self.host}")
+            return self._device
+
+    async def disconnect(self):
+        device, self._device = self._device, None
+        if device is not None:
+            try:
+                await device.disconnect()
+            except Exception as e:
+                logging.debug(f"Ignoring error while closing plug {self.host}: {e}")
+
+    async def _call(self, action):
+        """
+        Run action(device) against the cached handle, reconnecting between attempts.
+        """
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                device = await self._get_device()
+                return await action(device)
+            except Exception as e:
+                last_error = e
+                logging.warning(f"Attempt {attempt + 1}/{self.retries}: Plug {self.host} call failed. Error: {e}")
+                await self.disconnect()
+                if attempt + 1 < self.retries:
+                    await asyncio.sleep(self.retry_delay)
+        raise last_error
+
+    # ---------------- Plug Operations ---------------- #
+
+    async def read_energy(self):
+        async def action(plug):
+            await plug.update()
+
+            # Get realtime data
+            emeter_data = await plug.get_emeter_realtime()
+            current_power = emeter_data.get("power_mw", 0) / 1000
+            total_energy = emeter_data.get("total_wh", 0) / 1000
+
+            # Get daily stats
+            daily_data = await plug.get_emeter_daily()
+            today = datetime.now().day
+            daily_energy = daily_data.get(today, 0) / 1000  # Convert Wh to kWh
+
+            return {
+                "current_power": current_power,
+                "total_energy": total_energy,
+                "daily_energy": daily_energy,
+                "daily_data": daily_data,
+                "is_on": plug.is_on
+            }
+        return await self._call(action)
+
+    async def read_power(self):
+        """
+        Single realtime power query for high-rate sampling, in watts.
+
+        Skips the full update and daily stats, and does not retry: a missed
+        sample is cheaper than a delayed one. Failures count towards the
+        breaker like failed refreshes do; returns None while it is open.
+        """
+        if self._breaker_open():
+            return None
+        try:
+            device = await asyncio.wait_for(self._get_device(), self.query_timeout)
+            emeter_data = await asyncio.wait_for(device.get_emeter_realtime(), self.query_timeout)
+        except (Exception, asyncio.CancelledError) as e:
+            # A sample cancelled at its deadline counts too, so a plug that hangs opens the breaker
+            self._record_failure(e, "sample power from")
+            await self.disconnect()
+            raise
+        self._failures = 0
+        return emeter_data.get("power_mw", 0) / 1000
+
+    async def set_state(self, on):
+        async def action(plug):
+            # The cached handle already knows the device, so the relay command
+            # is the only round trip; its success tells us the new state.
+            if on:
+                await plug.turn_on()
+            else:
+                await plug.turn_off()
+            return on
+        is_on = await self._call(action)
+
+        # Keep the cached relay state in step so /status does not flip back
+        reading, taken_at = self._cached
+        if reading is not None:
+            self._cached = (dict(reading, is_on=is_on), taken_at)
+        return is_on
+
+    # ---------------- Cached Readings ---------------- #
+
+    def _breaker_open(self):
+        return time.monotonic() < self._breaker_open_until
+
+    def _record_failure(self, error, action):
+        self._failures += 1
+        if self._failures >= self.breaker_threshold:
+            self._breaker_open_until = time.monotonic() + self.breaker_cooldown
+            logging.error(f"Plug {self.host} failed {self._failures} times in a row; "
+                          f"serving cached readings for {self.breaker_cooldown}s. Error: {error!r}")
+        else:
+            logging.warning(f"Failed to {action} plug {self.host}. Error: {error!r}")
+
+    async def _refresh(self):
+        try:
+            # A plug that hangs instead of erroring still counts as a failure
+            reading = await asyncio.wait_for(self.read_energy(), self.query_timeout)
+            self._cached = (reading, time.monotonic())
+            self._failures = 0
+        except Exception as e:
+            self._record_failure(e, "refresh reading from")
+        finally:
+            self._inflight = None
+
+    async def ensure_fresh(self, max_age=None):
+        max_age = self.reading_ttl if max_age is None else max_age
+        reading, taken_at = self._cached
+        if reading is not None and time.monotonic() - taken_at <= max_age:
+            return
+        if self._breaker_open():
+            return
+        # Single flight: every caller waits on the same device query
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        await asyncio.shield(self._inflight)
+
+    def cached_reading(self, max_age=None):
+        """The cached reading with "stale"/"age_seconds" flags, or None if there is none yet."""
+        max_age = self.reading_ttl if max_age is None else max_age
+        reading, taken_at = self._cached
+        if reading is None:
+            return None
+        age = time.monotonic() - taken_at
+        return dict(reading, stale=age > max_age, age_seconds=round(age, 1))
+
+
+class PlugRegistry:
+    """
+    The set of plugs this backend monitors, all sharing one PlugLoop.
+
+    Plugs come from the SMART_PLUGS environment variable
+    ("kitchen=192.168.1.152,desk=192.168.1.153"), a plugs.json file mapping
+    ids to hosts, network discovery when SMART_PLUG_DISCOVERY=1, or finally
+    the single legacy SMART_PLUG_IP.
+    """
+
+    def __init__(self, loop, **manager_options):
+        self.loop = loop
+        self.manager_options = manager_options
+        self.plugs = {}
+
+    def add(self, plug_id, host, device=None):
+        self.plugs[plug_id] = PlugManager(plug_id, host, self.loop, device=device, **self.manager_options)
+        return self.plugs[plug_id]
+
+    def get(self, plug_id):
+        return self.plugs.get(plug_id)
+
+    def ids(self):
+        return list(self.plugs)
+
+    def __iter__(self):
+        return iter(list(self.plugs.values()))
+
+    def __len__(self):
+        return len(self.plugs)
+
+    # ---------------- Configuration ---------------- #
+
+    def load(self, config_path="plugs.json", default_host=None):
+        spec = os.environ.get("SMART_PLUGS", "").strip()
+        if spec:
+            for index, entry in enumerate(item.strip() for item in spec.split(",")):
+                if not entry:
+                    continue
+                plug_id, _, host = entry.rpartition("=")
+                self.add(plug_id or f"plug{index + 1}", host)
+        elif os.path.exists(config_path):
+            with open(config_path) as file:
+                for plug_id, host in json.load(file).items():
+                    self.add(plug_id, host)
+        elif os.environ.get("SMART_PLUG_DISCOVERY") == "1":
+            self.loop.run(self._discover())
+        elif default_host:
+            self.add("main", default_host)
+
+        logging.info(f"Monitoring plugs: {', '.join(f'{p.plug_id}={p.host}' for p in self) or 'none'}")
+        return self
+
+    async def _discover(self):
+        from kasa import Discover
+        devices = await Discover.discover()
+        for host, device in sorted(devices.items()):
+            if not getattr(device, "has_emeter", False):
+                continue
+            plug_id = (device.alias or host).strip().lower().replace(" ", "_")
+            self.add(plug_id, host, device=device)
+
+    # ---------------- Polling ---------------- #
+
+    async def _refresh_all(self, plugs, max_age):
+        # Per-plug timeouts live in PlugManager._refresh, so one slow plug
+        # cannot hold up the others
+        await asyncio.gather(*(plug.ensure_fresh(max_age) for plug in plugs), return_exceptions=True)
+
+    def get_readings(self, plug_ids=None, max_age=None, deadline=None):
+        """
+        Refresh the selected plugs concurrently in a single gather() on the
+        shared loop and return {plug_id: reading or None}.
+        """
+        plugs = [self.plugs[plug_id] for plug_id in (plug_ids or self.ids())]
+        try:
+            self.loop.run(self._refresh_all(plugs, max_age), deadline)
+        except FutureTimeoutError:
+            logging.warning(f"Plug poll did not finish within {deadline}s; serving cached readings")
+        except Exception as e:
+            logging.error(f"Error polling plugs: {e}")
+        return {plug.plug_id: plug.cached_reading(max_age) for plug in plugs}
+
+    async def _sample_all(self, plugs):
+        return await asyncio.gather(*(plug.read_power() for plug in plugs), return_exceptions=True)
+
+    def sample_power(self, plug_ids=None, deadline=None):
+        """
+        Take one realtime power sample from every selected plug concurrently
+        and return {plug_id: watts or None}.
+        """
+        plugs = [self.plugs[plug_id] for plug_id in (plug_ids or self.ids())]
+        future = self.loop.submit(self._sample_all(plugs))
+        try:
+            results = future.result(deadline)
+        except FutureTimeoutError:
+            # Stop the queries still running, so they do not pile up behind the next sample
+            future.cancel()
+            logging.debug(f"Power sample did not finish within {deadline}s")
+            return {plug.plug_id: None for plug in plugs}
+        samples = {}
+        for plug, result in zip(plugs, results):
+            if isinstance(result, Exception):
+                logging.debug(f"Power sample from plug {plug.host} failed: {result!r}")
+                result = None
+            samples[plug.plug_id] = result
+        return samples
+
+    def stop(self):
+        async def disconnect_all():
+            await asyncio.gather(*(plug.disconnect() for plug in self), return_exceptions=True)
+        try:
+            self.loop.run(disconnect_all(), timeout=5)
+        except Exception as e:
+            logging.warning(f"Error disconnecting from plugs: {e}")
+        self.loop.stop()
@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+
+class PowerRingBuffer:
+    """
+    Fixed-capacity ring of (epoch seconds, watts) samples in NumPy arrays.
+
+    Appends overwrite the oldest sample once the buffer is full, so memory
+    stays constant however fine the sampling interval is. Reads return copies
+    in chronological order, so callers never see a half-written slot.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._ts = np.zeros(self.capacity, dtype=np.float64)
+        self._power = np.zeros(self.capacity, dtype=np.float32)
+        self._next = 0  # Slot the next sample goes into
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, ts, power_watts):
+        with self._lock:
+            self._ts[self._next] = ts
+            self._power[self._next] = power_watts
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def extend(self, ts, power_watts):
+        """Append arrays of samples, oldest first; only the newest capacity survive."""
+        ts = np.asarray(ts, dtype=np.float64)[-self.capacity:]
+        power_watts = np.asarray(power_watts, dtype=np.float32)[-self.capacity:]
+        with self._lock:
+            slots = (self._next + np.arange(len(ts))) % self.capacity
+            self._ts[slots] = ts
+            self._power[slots] = power_watts
+            self._next = (self._next + len(ts)) % self.capacity
+            self._count = min(self._count + len(ts), self.capacity)
+
+    def latest(self):
+        """The newest (ts, watts) sample, or None when empty."""
+        with self._lock:
+            if not self._count:
+                return None
+            slot = (self._next - 1) % self.capacity
+            return float(self._ts[slot]), float(self._power[slot])
+
+    def snapshot(self):
+        """All samples as (ts, watts) arrays, oldest first."""
+        with self._lock:
+            order = (self._next - self._count + np.arange(self._count)) % self.capacity
+            return self._ts[order], self._power[order]
+
+    def since(self, start_ts):
+        """Samples with ts >= start_ts, oldest first."""
+        ts, power = self.snapshot()
+        first = np.searchsorted(ts, start_ts, side="left")
+        return ts[first:], power[first:]
+
+
+def save_buffers(buffers, path):
+    """Write {key: PowerRingBuffer} to an .npz file, replacing it atomically."""
+    arrays = {}
+    for key, buffer in buffers.items():
+        ts, power = buffer.snapshot()
+        arrays[f"ts__{key}"] = ts
+        arrays[f"power__{key}"] = power
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_buffers(path, capacity):
+    """Read buffers written by save_buffers, keeping the newest capacity samples of each."""
+    buffers = {}
+    if not os.path.exists(path):
+        return buffers
+    try:
+        with np.load(path) as data:
+            for name in data.files:
+                if not name.startswith("ts__"):
+                    continue
+                key = name[len("ts__"):]
+                buffer = PowerRingBuffer(capacity)
+                buffer.extend(data[name], data[f"power__{key}"])
+                buffers[key] = buffer
+    except Exception as e:
+        logging.error(f"Ignoring unreadable power snapshot {path}: {e}")
+        return {}
+    return buffers
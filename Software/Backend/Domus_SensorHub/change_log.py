@@ -0,0 +1,74 @@
+import asyncio
+import collections
+import itertools
+
+
+class CursorExpired(Exception):
+    """The cursor is from an earlier run of the hub or older than the log holds; the client must resync."""
+
+
+class ChangeLog:
+    """
+    The most recent readings of one sensor type in the order the hub accepted
+    them, for clients that sync with ?since=<cursor> instead of re-fetching
+    snapshots.
+
+    A cursor is "<run>-<sequence>". run changes at every start of the hub, so
+    a cursor is never read against another run's sequence numbers; those and
+    cursors whose readings have been pushed out of the log raise
+    CursorExpired. A client that is up to date is answered from memory.
+    """
+
+    def __init__(self, run, size):
+        self.run = run
+        self.entries = collections.deque(maxlen=size)  # (sequence, payload)
+        self.sequence = 0
+        self.changed = asyncio.Event()
+        self.closed = False
+
+    def cursor(self):
+        return f"{self.run}-{self.sequence}"
+
+    def append(self, payload):
+        self.sequence += 1
+        self.entries.append((self.sequence, payload))
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def since(self, cursor, device_id=None, limit=None):
+        """
+        Readings after cursor, optionally of one device, at most limit of
+        them; returns (readings, cursor to continue from, whether more are
+        waiting). Raises ValueError for a malformed cursor.
+        """
+        run, _, sequence = cursor.rpartition("-")
+        sequence = int(sequence)
+        if run != self.run or not 0 <= sequence <= self.sequence:
+            raise CursorExpired(cursor)
+        if sequence == self.sequence:
+            return [], cursor, False
+        oldest = self.entries[0][0]
+        if sequence < oldest - 1:
+            raise CursorExpired(cursor)
+
+        readings, last = [], sequence
+        for last, payload in itertools.islice(self.entries, sequence - oldest + 1, None):
+            if device_id in (None, payload["device_id"]):
+                readings.append(payload)
+                if len(readings) == limit:
+                    break
+        return readings, f"{self.run}-{last}", last < self.sequence
+
+    async def wait(self, timeout):
+        """Wait up to timeout seconds for the next reading."""
+        if self.closed:
+            return
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        """Wake every waiting client, e.g. at shutdown."""
+        self.closed = True
+        self.changed.set()
@@ -0,0 +1,72 @@
+import asyncio
+
+
+class Subscriber:
+    """One streaming client and the updates it has not been sent yet, newest per (event, device)."""
+
+    def __init__(self, events, device_id=None):
+        self.events = events
+        self.device_id = device_id
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+
+
+class LiveFeed:
+    """
+    Fan-out of sensor updates to streaming clients, on the event loop.
+
+    Each subscriber holds only the newest update per event and device, so a
+    client that falls behind is sent current state when it catches up rather
+    than a backlog, and publishing never waits on a client.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, events, device_id=None, snapshot=()):
+        """Register a client; snapshot is the (event, payload) pairs it starts with."""
+        subscriber = Subscriber(events, device_id)
+        for event, payload in snapshot:
+            self._offer(subscriber, event, payload)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+        subscriber.closed = True
+        subscriber.ready.set()
+
+    def close(self):
+        """Disconnect every client, e.g. at shutdown."""
+        for subscriber in list(self._subscribers):
+            self.unsubscribe(subscriber)
+
+    def publish(self, event, payload):
+        for subscriber in self._subscribers:
+            self._offer(subscriber, event, payload)
+
+    def _offer(self, subscriber, event, payload):
+        if event in subscriber.events and subscriber.device_id in (None, payload["device_id"]):
+            subscriber.pending[(event, payload["device_id"])] = (event, payload)
+            subscriber.ready.set()
+
+    async def take(self, subscriber, timeout=None):
+        """
+        Wait up to timeout seconds for updates; returns the pending (event,
+        payload) pairs, oldest first ([] on timeout), or None once the client
+        is gone.
+        """
+        try:
+            await asyncio.wait_for(subscriber.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        if subscriber.closed:
+            return None
+        updates = sorted(subscriber.pending.values(), key=lambda update: update[1].get("ts_ms", 0))
+        subscriber.pending = {}
+        subscriber.ready.clear()
+        return updates
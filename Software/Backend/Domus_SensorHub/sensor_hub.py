@@ -0,0 +1,797 @@
+"""
+Domus sensor hub: one ingestion service for every ESP32 sensor node. It
+replaces the per-sensor Flask servers (Domus_EnvironSensor and
+Domus_MotionSensor sensor_server.py), which were copies of each other
+competing for port 5000 and their own domus.db.
+
+It runs on asyncio (aiohttp), so a single process holds thousands of
+concurrent keep-alive connections from nodes and app clients, and serves the
+same API the firmware and the app already use, on port 5000:
+  POST /<type>-data, /<type>-data/batch   readings of each type in sensor_types.py
+  GET  /<type>-latest, /<type>-history    cached newest reading (with an ETag); rollup history
+  GET  /<type>-changes?since=<cursor>     readings accepted since a cursor, optionally long-polled
+  POST /device-checkin, GET /devices, /devices/latest
+  GET  /stream                            server-sent events; Socket.IO on the same port
+  GET  /retention                         retention runs; queued writes that failed
+  UDP 5001 and /telemetry/ws              binary telemetry frames (telemetry.py); GET /telemetry
+
+Readings are validated by their type's parser before anything is queued.
+Every write goes through sensor_store's one writer connection, and blocking
+database work runs on executor threads, never on the event loop; reads of
+the latest values, devices and live updates are served from memory.
+
+Usage:
+    python sensor_hub.py [--host 0.0.0.0] [--port 5000]
+    python sensor_hub.py migrate [domus.db]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from functools import partial
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+import zlib
+
+from aiohttp import WSMsgType, web
+import socketio
+
+from change_log import ChangeLog, CursorExpired
+from live_feed import LiveFeed
+import sensor_store as store
+from sensor_types import SENSOR_TYPES, MOTION, MOTION_CODES
+from telemetry import FrameError, LinkTracker, TelemetryProtocol, decode_frame
+
+def run_blocking(func, *args):
+    """Run a blocking sensor_store call on an executor thread."""
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+def busy_response():
+    return web.json_response({"status": "busy", "error": "Server is catching up on writes"}, status=503,
+                             headers={"Retry-After": "1"})
+
+def no_store(response):
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+# Snapshot endpoints tag their responses, so a client that already has the
+# current one gets a bodiless 304 for If-None-Match. Tags are built from
+# in-memory state; tags from version counters include RUN, which changes at
+# every start, so they cannot match after a restart resets the counters.
+RUN = format(int(time.time() * 1000), "x")
+
+def tagged(request, etag, payload):
+    """payload as JSON tagged with etag, or a 304 if If-None-Match already names it."""
+    if any(tag.value in (etag, "*") for tag in request.if_none_match or ()):
+        response = web.Response(status=304)
+    else:
+        response = web.json_response(payload)
+    response.etag = etag
+    response.headers["Cache-Control"] = "no-cache"  # Keep, but revalidate every time
+    return response
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+# ---------------- Devices ---------------- #
+
+# The ESP32 firmware names itself in /device-checkin but not in its readings,
+# so a reading without a device_id is credited to the device that last
+# checked in from the same address.
+device_by_ip = {}  # ip -> device_id
+
+def reading_device_id(request, data):
+    """device_id from the payload, else the device checked in from this address, else DEFAULT_DEVICE."""
+    device_id = data.get("device_id") if isinstance(data, dict) else None
+    if device_id:
+        return str(device_id)
+    return device_by_ip.get(request.remote, store.DEFAULT_DEVICE)
+
+async def device_key(device_id):
+    key = store.device_keys.get(device_id)
+    if key is None:
+        key = await run_blocking(store.device_key, device_id)  # First reading from this device
+    return key
+
+# ---------------- Latest-Value Cache ---------------- #
+
+# Newest reading per sensor type and device, updated by every ingest path, so
+# /<type>-latest never touches SQLite. Everything below runs on the event
+# loop, so none of it needs a lock.
+latest = {name: {} for name in SENSOR_TYPES}  # type name -> device_id -> reading
+latest_version = 0  # Bumped whenever a cached reading changes, for /devices/latest's ETag
+
+def reading_payload(sensor_type, device_id, ts_ms, values):
+    return dict(sensor_type.present(values), timestamp=store.format_ms(ts_ms), ts_ms=ts_ms, device_id=device_id)
+
+def reading_etag(reading):
+    return f"{zlib.crc32(reading['device_id'].encode()):x}-{reading['ts_ms']}" if reading else "empty"
+
+def remember_latest(sensor_type, device_id, ts_ms, values):
+    """
+    Store a reading unless the device already has a newer one (e.g. during a
+    backfill), and push it to live subscribers; for changes_only types only
+    if it changes the device's state.
+    """
+    global latest_version
+    cache = latest[sensor_type.name]
+    current = cache.get(device_id)
+    if current is not None and ts_ms < current["ts_ms"]:
+        return
+    cache[device_id] = reading = reading_payload(sensor_type, device_id, ts_ms, values)
+    latest_version += 1
+    if not sensor_type.changes_only or current is None or any(current[key] != reading[key]
+                                                               for key in sensor_type.fields):
+        feed.publish(sensor_type.name, reading)
+
+def settle_readings(sensor_type, device_id, rows):
+    """
+    Bring the cache and motion hold up to date with stored (ts_ms, *values)
+    rows that arrived together, in a batch or a telemetry frame.
+    """
+    log_changes(sensor_type, device_id, sorted(rows))
+    ts_ms, *values = max(rows)
+    remember_latest(sensor_type, device_id, ts_ms, values)
+    if sensor_type is MOTION:
+        # Ending in fresh motion arms the hold timer like a single event would
+        update_motion_hold(device_id, values[0], ts_ms)
+
+def newest(sensor_type, device_id=None):
+    """The cached reading for device_id, else the newest preferred reading across devices."""
+    cache = latest[sensor_type.name]
+    if device_id:
+        return cache.get(device_id)
+    readings = cache.values()
+    if sensor_type.prefer:
+        readings = [reading for reading in readings if sensor_type.prefer(reading)] or readings
+    return max(readings, key=lambda reading: reading["ts_ms"], default=None)
+
+# ---------------- Motion Hold Timers ---------------- #
+
+# A "motion detected" ping holds its device in motion for the device's hold
+# time; if no newer ping arrives by then, the device drops back to "no
+# motion", stamped with the exact moment the hold ran out. Each armed device
+# has one event-loop timer (the loop keeps them in a heap), so idle sensors
+# cost no CPU; re-arming cancels the old timer. Sensors that report "clear"
+# themselves cancel their hold. States go through MOTION_CODES on every
+# path, so motion_sensor_ESP32.ino's "detected" holds like "motion detected"
+# and a lost "clear" still ends; give such sensors a hold (MOTION_HOLDS) that
+# covers how long their PIR stays high.
+MOTION_HOLD_SECONDS = float(os.environ.get("MOTION_HOLD_SECONDS", 3))
+motion_holds = {}  # device_id -> hold seconds, overriding MOTION_HOLD_SECONDS
+motion_timers = {}  # device_id -> (timer handle, epoch seconds of the ping)
+
+def load_motion_holds(config_path="motion_holds.json"):
+    """
+    Per-device hold times from MOTION_HOLDS ("hallway=10,kitchen=5") or a
+    motion_holds.json file mapping device ids to seconds.
+    """
+    spec = os.environ.get("MOTION_HOLDS", "").strip()
+    if spec:
+        for entry in (item.strip() for item in spec.split(",")):
+            if entry:
+                device_id, _, seconds = entry.rpartition("=")
+                motion_holds[device_id] = float(seconds)
+    elif os.path.exists(config_path):
+        with open(config_path) as file:
+            motion_holds.update((device_id, float(seconds)) for device_id, seconds in json.load(file).items())
+
+def arm_motion_reset(device_id, detected_at):
+    """(Re)start the device's hold from a "motion detected" at epoch seconds detected_at."""
+    current = motion_timers.get(device_id)
+    if current is not None:
+        if current[1] >= detected_at:
+            return
+        current[0].cancel()
+    ended_at = detected_at + motion_holds.get(device_id, MOTION_HOLD_SECONDS)
+    timer = asyncio.get_running_loop().call_later(max(ended_at - time.time(), 0), reset_motion_status,
+                                                  device_id, ended_at)
+    motion_timers[device_id] = (timer, detected_at)
+
+def disarm_motion_reset(device_id, cleared_at):
+    """Cancel the device's hold unless its ping came after epoch seconds cleared_at."""
+    current = motion_timers.get(device_id)
+    if current is not None and current[1] <= cleared_at:
+        current[0].cancel()
+        del motion_timers[device_id]
+
+def update_motion_hold(device_id, code, ts_ms):
+    """Arm the device's hold for a motion reading stamped ts_ms, or cancel it for a "no motion" one."""
+    if code == MOTION_CODES["motion detected"]:
+        arm_motion_reset(device_id, ts_ms / 1000)
+    else:
+        disarm_motion_reset(device_id, ts_ms / 1000)
+
+def reset_motion_status(device_id, ended_at):
+    del motion_timers[device_id]
+    ts_ms = int(ended_at * 1000)
+    code = MOTION_CODES["no motion"]
+    store.queue_write(MOTION.insert, (store.device_keys[device_id], ts_ms, code))
+    log_changes(MOTION, device_id, [(ts_ms, code)])
+    remember_latest(MOTION, device_id, ts_ms, (code,))
+    print(f"Motion reset to 'no motion' for {device_id}")
+
+# ---------------- Device Presence ---------------- #
+
+# Every node checks in every 30 seconds, so check-ins are kept in memory
+# rather than written one by one. A device is online from a check-in until
+# PRESENCE_TIMEOUT seconds pass without another; each online device has one
+# event-loop timer, which when it fires for a device that has checked in
+# since is simply set again for the new deadline. The devices table is
+# written when a device comes online, changes address or goes offline, and
+# otherwise only by a flush of the online devices' last_seen every
+# PRESENCE_FLUSH_INTERVAL seconds (one row per 100 check-ins). The same
+# transitions are pushed as "device" events.
+PRESENCE_TIMEOUT = 60
+PRESENCE_FLUSH_INTERVAL = 3000
+presence = {}  # online device_id -> {"ip", "last_seen" (epoch s), "deadline" (loop time), "flushed", "timer"}
+presence_version = 0  # Bumped at every check-in and departure, for /devices' ETag
+
+def device_event(device_id, device, online):
+    return {"device_id": device_id, "ip": device["ip"], "lastSeen": device["last_seen"], "online": online}
+
+def check_in(device_id, ip, last_seen, timeout=PRESENCE_TIMEOUT):
+    """Record a check-in; returns the device's entry if it came online or moved, else None."""
+    global presence_version
+    presence_version += 1
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    device = presence.get(device_id)
+    if device is not None:
+        moved = device["ip"] != ip
+        device.update(ip=ip, last_seen=last_seen, deadline=deadline)
+        if not moved:
+            return None
+    else:
+        device = presence[device_id] = {"ip": ip, "last_seen": last_seen, "deadline": deadline}
+        device["timer"] = loop.call_at(deadline, presence_due, device_id)
+    device["flushed"] = last_seen
+    return device
+
+def presence_due(device_id):
+    global presence_version
+    loop = asyncio.get_running_loop()
+    device = presence[device_id]
+    if device["deadline"] > loop.time():
+        device["timer"] = loop.call_at(device["deadline"], presence_due, device_id)  # Checked in since
+        return
+    del presence[device_id]
+    presence_version += 1
+    store.queue_write(store.DEVICE_UPSERT, (device_id, device["ip"], device["last_seen"]))
+    feed.publish("device", device_event(device_id, device, online=False))
+    print(f"Device {device_id} went offline (last check-in {store.format_ms(device['last_seen'] * 1000)})")
+
+async def load_presence():
+    """Bring devices that checked in within PRESENCE_TIMEOUT before a restart back online."""
+    rows = await run_blocking(store.stored_devices)
+    for row in rows:
+        device_by_ip[row["ip"]] = row["device_id"]
+        remaining = row["last_seen"] + PRESENCE_TIMEOUT - time.time()
+        if remaining > 0:
+            check_in(row["device_id"], row["ip"], row["last_seen"], timeout=remaining)
+
+def presence_rows():
+    """Rows for online devices that checked in since their row was written, marked as written."""
+    rows = [(device_id, device["ip"], device["last_seen"]) for device_id, device in presence.items()
+            if device["last_seen"] > device["flushed"]]
+    for device_id, ip, last_seen in rows:
+        presence[device_id]["flushed"] = last_seen
+    return [(store.DEVICE_UPSERT, row) for row in rows]
+
+async def flush_presence_loop():
+    while True:
+        await asyncio.sleep(PRESENCE_FLUSH_INTERVAL)
+        rows = presence_rows()
+        if rows:
+            await run_blocking(store.commit_batch, rows)
+
+# ---------------- Live Updates ---------------- #
+
+# Readings, motion transitions and devices going online or offline are
+# pushed to clients as they happen, over Socket.IO (like the face service's
+# alerts) or server-sent events from /stream. Updates come from the ingest
+# paths and the caches above, so connected clients cost no database work.
+STREAM_EVENTS = (*SENSOR_TYPES, "device")
+STREAM_HEARTBEAT = 15
+PUSH_INTERVAL = 0.02  # Socket.IO: updates arriving within this window after an emit go out together
+
+feed = LiveFeed()
+sio = socketio.AsyncServer(async_mode="aiohttp", cors_allowed_origins="*")
+live_clients = {}  # Socket.IO sid -> Subscriber
+
+def stream_events(value):
+    """Events named in a comma-separated query argument; all of them if it is empty."""
+    events = tuple(event.strip() for event in (value or "").split(",") if event.strip())
+    unknown = [event for event in events if event not in STREAM_EVENTS]
+    if unknown:
+        raise ValueError(f"Unknown event {unknown[0]}; expected some of {', '.join(STREAM_EVENTS)}")
+    return events or STREAM_EVENTS
+
+def subscribe(events, device_id=None):
+    """Register a client, starting it with the cached readings and online devices."""
+    snapshot = [(name, reading) for name, cache in latest.items() for reading in cache.values()]
+    snapshot += [("device", device_event(device_id, device, online=True)) for device_id, device in presence.items()]
+    return feed.subscribe(events, device_id, snapshot)
+
+async def stream_updates(request):
+    """
+    Server-sent events: one event per sensor type (every reading; motion only
+    on state changes) and device (online/offline, with the /devices fields
+    plus "online"). Query: events (comma-separated; default all), device_id
+    (default all devices). The cached latest readings are sent first.
+    """
+    try:
+        events = stream_events(request.query.get('events'))
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    subscriber = subscribe(events, request.query.get('device_id'))
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    try:
+        await response.prepare(request)
+        while True:
+            updates = await feed.take(subscriber, STREAM_HEARTBEAT)
+            if updates is None:
+                break
+            if not updates:
+                await response.write(b": keep-alive\n\n")
+            for event, payload in updates:
+                await response.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        feed.unsubscribe(subscriber)
+    return response
+
+# Socket.IO clients pick events and a device with the same query arguments
+# when connecting, e.g. io(url, {query: {events: "motion"}}).
+async def push_updates(sid, subscriber):
+    while True:
+        updates = await feed.take(subscriber)
+        if updates is None:
+            return
+        for event, payload in updates:
+            await sio.emit(event, payload, to=sid)
+        await asyncio.sleep(PUSH_INTERVAL)
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    try:
+        events = stream_events(",".join(query.get("events", [])))
+    except ValueError as e:
+        raise socketio.exceptions.ConnectionRefusedError(str(e))
+    subscriber = subscribe(events, query.get("device_id", [None])[0])
+    live_clients[sid] = subscriber
+    sio.start_background_task(push_updates, sid, subscriber)
+
+@sio.event
+async def disconnect(sid):
+    subscriber = live_clients.pop(sid, None)
+    if subscriber is not None:
+        feed.unsubscribe(subscriber)
+
+# ---------------- Batch Uploads ---------------- #
+
+# Nodes may buffer readings (e.g. through a Wi-Fi outage) and upload them in
+# one request. Each reading carries its own time: "timestamp" as epoch seconds
+# or ISO 8601, or "age" in seconds before the upload for nodes without a clock.
+MAX_BATCH_SIZE = 1000
+MAX_BACKFILL_SECONDS = 7 * 24 * 3600
+MAX_CLOCK_SKEW_SECONDS = 60
+
+def reading_time(reading, received_at):
+    if "timestamp" in reading:
+        value = reading["timestamp"]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            when = datetime.fromtimestamp(value)
+        elif isinstance(value, str):
+            when = datetime.fromisoformat(value)
+            if when.tzinfo is not None:
+                when = when.astimezone().replace(tzinfo=None)
+        else:
+            raise ValueError("timestamp must be epoch seconds or an ISO 8601 string")
+    elif "age" in reading:
+        age = reading["age"]
+        if not isinstance(age, (int, float)) or isinstance(age, bool) or age < 0:
+            raise ValueError("age must be a non-negative number of seconds")
+        when = received_at - timedelta(seconds=age)
+    else:
+        raise ValueError("reading needs a timestamp or an age")
+
+    if when > received_at + timedelta(seconds=MAX_CLOCK_SKEW_SECONDS):
+        raise ValueError("timestamp is in the future")
+    if when < received_at - timedelta(seconds=MAX_BACKFILL_SECONDS):
+        raise ValueError("timestamp is too old to backfill")
+    return when
+
+def validate_batch(data, parse_reading):
+    """
+    Validate a whole batch ({"readings": [...]} or a bare list) before anything
+    is written. Returns (rows, errors); rows start with the reading's epoch
+    milliseconds and errors list every bad reading by index.
+    """
+    readings = data.get("readings") if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not readings:
+        return [], [{"error": "Expected a non-empty list of readings"}]
+    if len(readings) > MAX_BATCH_SIZE:
+        return [], [{"error": f"At most {MAX_BATCH_SIZE} readings per batch"}]
+
+    received_at = datetime.now()
+    rows, errors = [], []
+    for index, reading in enumerate(readings):
+        try:
+            if not isinstance(reading, dict):
+                raise ValueError("reading must be an object")
+            when = reading_time(reading, received_at)
+            rows.append((int(when.timestamp() * 1000), *parse_reading(reading)))
+        except (ValueError, OverflowError, OSError) as e:
+            errors.append({"index": index, "error": str(e)})
+    return rows, errors
+
+# ---------------- Sensor Endpoints ---------------- #
+
+# Registered for every sensor type in sensor_types.py by create_app().
+
+async def receive_reading(sensor_type, request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return web.json_response({"error": "Expected a JSON object"}, status=400)
+    try:
+        values = sensor_type.parse(data)
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    device_id = reading_device_id(request, data)
+    ts_ms = store.now_ms()
+
+    if not store.queue_write(sensor_type.insert, (await device_key(device_id), ts_ms, *values)):
+        return busy_response()
+    log_changes(sensor_type, device_id, [(ts_ms, *values)])
+    remember_latest(sensor_type, device_id, ts_ms, values)
+
+    if sensor_type is MOTION:
+        update_motion_hold(device_id, values[0], ts_ms)
+    return web.json_response({"status": "success"})
+
+async def receive_batch(sensor_type, request):
+    """
+    Insert a validated batch in one transaction before answering. Unlike single
+    readings this bypasses the write-behind queue: a node drops its buffer once
+    it gets a 200, so the 200 must mean the rows are committed. Rows whose
+    device and time are already stored are skipped, and only the new ones are
+    counted and passed on to the change log and live subscribers, so
+    re-sending a batch is harmless.
+    """
+    data = await read_json(request)
+    rows, errors = validate_batch(data, sensor_type.parse)
+    if errors:
+        return web.json_response({"status": "error", "errors": errors}, status=400)
+
+    device_id = reading_device_id(request, data)
+    try:
+        key = await device_key(device_id)
+        stored = await run_blocking(store.insert_new, sensor_type.insert, [(key, *row) for row in rows])
+    except sqlite3.Error as e:
+        print(f"Error in /{sensor_type.name}-data/batch:", str(e))
+        return web.json_response({"error": "Internal server error"}, status=500)
+
+    inserted = [row[1:] for row in stored]
+    if inserted:
+        settle_readings(sensor_type, device_id, inserted)
+    print(f"Received {sensor_type.name} batch of {len(rows)} readings from {device_id}, {len(inserted)} new")
+    return web.json_response({"status": "success", "inserted": len(inserted), "duplicates": len(rows) - len(inserted)})
+
+async def get_latest(sensor_type, request):
+    data = newest(sensor_type, request.query.get('device_id'))
+    return tagged(request, reading_etag(data), data or sensor_type.empty)
+
+def history_time(value, default_ms):
+    """Query argument as epoch seconds or ISO 8601 -> epoch milliseconds."""
+    if not value:
+        return default_ms
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)  # Naive times are local
+
+async def get_history(sensor_type, request):
+    """
+    History of one device.
+    Query: from/to (epoch seconds or ISO 8601; default the last 24 hours),
+    resolution (auto|raw|minute|hour|day; default auto), points (for auto;
+    default 300), device_id (default the device with the newest reading).
+
+    Rollup resolutions answer with columnar lists: t (bucket start, epoch
+    seconds), samples, and {"min", "max", "mean", "last"} per field. raw
+    answers with t and one list of readings per field.
+    """
+    try:
+        to_ms = history_time(request.query.get('to'), store.now_ms())
+        from_ms = history_time(request.query.get('from'), to_ms - 24 * 3600 * 1000)
+        points = min(max(int(request.query.get('points', store.HISTORY_DEFAULT_POINTS)), 1), store.HISTORY_MAX_POINTS)
+    except (ValueError, OverflowError, OSError) as e:
+        return web.json_response({"error": f"Invalid parameter: {e}"}, status=400)
+    resolution = request.query.get('resolution', 'auto')
+    if resolution not in ("auto", "raw", *store.ROLLUPS):
+        return web.json_response({"error": f"resolution must be one of auto, raw, {', '.join(store.ROLLUPS)}"},
+                                 status=400)
+    if to_ms <= from_ms:
+        return web.json_response({"error": "'to' must be after 'from'"}, status=400)
+
+    device_id = request.query.get('device_id') or (newest(sensor_type) or {}).get("device_id", store.DEFAULT_DEVICE)
+    key = store.device_keys.get(device_id)
+    if key is None:
+        return web.json_response({"error": f"No readings from device {device_id}"}, status=404)
+
+    try:
+        resolution, history = await run_blocking(store.history, sensor_type, key, from_ms, to_ms, resolution, points)
+    except sqlite3.Error as e:
+        print(f"Error in /{sensor_type.name}-history:", str(e))
+        return web.json_response({"error": "Internal server error"}, status=500)
+    if history is None:
+        return web.json_response(
+            {"error": f"More than {store.HISTORY_MAX_POINTS} points; use a coarser resolution or a shorter range"},
+            status=400)
+
+    return web.json_response(dict(
+        history,
+        device_id=device_id,
+        resolution=resolution,
+        bucket_seconds=store.ROLLUPS[resolution][1] // 1000 if resolution in store.ROLLUPS else None,
+        **{"from": from_ms // 1000, "to": to_ms // 1000}
+    ))
+
+# ---------------- Incremental Sync ---------------- #
+
+# Clients that keep their own copy of a sensor type's readings (the app, the
+# assistant) ask for what is new since their last cursor instead of
+# re-fetching snapshots. Every reading the hub accepts, from any ingest path,
+# is appended to its type's change log, in memory; an up-to-date client is
+# answered without touching SQLite, and with wait=<seconds> the request is
+# held until a reading arrives. A cursor the log no longer covers (the hub
+# restarted, or the client was away for more than CHANGE_LOG_SIZE readings)
+# answers 410 with the current cursor: resync from /<type>-latest or
+# /<type>-history, then carry on from there.
+CHANGE_LOG_SIZE = int(os.environ.get("CHANGE_LOG_SIZE", 10000))  # Readings kept per sensor type
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_WAIT = 30
+
+change_logs = {name: ChangeLog(RUN, CHANGE_LOG_SIZE) for name in SENSOR_TYPES}
+
+def log_changes(sensor_type, device_id, rows):
+    """Append stored (ts_ms, *values) rows to the type's change log."""
+    log = change_logs[sensor_type.name]
+    for ts_ms, *values in rows:
+        log.append(reading_payload(sensor_type, device_id, ts_ms, values))
+
+async def get_changes(sensor_type, request):
+    """
+    Readings accepted since a cursor, oldest first.
+    Query: since (a cursor from an earlier answer; without it, just the
+    current cursor), device_id (default all devices), limit (default 500),
+    wait (seconds to hold the request while nothing is new; default 0, at
+    most 30).
+    Answers {"readings", "cursor" (pass as since next time), "more" (true if
+    limit cut the answer short)}.
+    """
+    log = change_logs[sensor_type.name]
+    since = request.query.get('since')
+    device_id = request.query.get('device_id')
+    try:
+        limit = max(int(request.query.get('limit', CHANGES_DEFAULT_LIMIT)), 1)
+        wait = min(max(float(request.query.get('wait', 0)), 0), CHANGES_MAX_WAIT)
+    except ValueError as e:
+        return web.json_response({"error": f"Invalid parameter: {e}"}, status=400)
+    if not since:
+        return no_store(web.json_response({"readings": [], "cursor": log.cursor(), "more": False}))
+
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        try:
+            readings, cursor, more = log.since(since, device_id, limit)
+        except CursorExpired:
+            return web.json_response({"error": "Cursor expired; resync and continue from the current cursor",
+                                      "cursor": log.cursor()}, status=410)
+        except ValueError:
+            return web.json_response({"error": "Malformed cursor"}, status=400)
+        remaining = deadline - asyncio.get_running_loop().time()
+        if readings or remaining <= 0 or log.closed:
+            break
+        since = cursor  # Readings of other devices need not be looked at again
+        await log.wait(remaining)
+    return no_store(web.json_response({"readings": readings, "cursor": cursor, "more": more}))
+
+# ---------------- Binary Telemetry ---------------- #
+
+# Nodes may send readings as compact binary frames (telemetry.py) over UDP or
+# a WebSocket instead of HTTP requests: a BME688 reading is 41 bytes rather
+# than a TCP connection, headers and JSON. Frames are decoded in place and
+# stored through the same write queue, cache and live updates as JSON
+# readings; duplicates are dropped and gaps in each node's sequence numbers
+# are counted, reported by /telemetry. Nodes still check in over HTTP.
+TELEMETRY_PORT = int(os.environ.get("TELEMETRY_PORT", 5001))  # 0 turns the UDP listener off
+TELEMETRY_RECEIVE_BUFFER = 1 << 20  # Room for bursts while the loop is busy
+
+links = LinkTracker()
+new_device_frames = set()  # Frames waiting for their device's first key
+
+def receive_frame(data, transport):
+    try:
+        frame = decode_frame(data)
+    except FrameError:
+        links.malformed += 1
+        return
+    if not links.accept(frame, transport):
+        return
+    key = store.device_keys.get(frame.device_id)
+    if key is not None:
+        store_frame(frame, key)
+    else:
+        task = asyncio.get_running_loop().create_task(store_new_device_frame(frame))
+        new_device_frames.add(task)
+        task.add_done_callback(new_device_frames.discard)
+
+async def store_new_device_frame(frame):
+    store_frame(frame, await device_key(frame.device_id))
+
+def store_frame(frame, key):
+    sensor_type = frame.sensor_type
+    received_ms = store.now_ms()
+    rows = [(received_ms - age_ms, *values) for age_ms, values in frame.readings]
+    # A UDP node cannot be asked to retry, so readings that do not fit the queue are counted and dropped
+    queued = [row for row in rows if store.queue_write(sensor_type.insert, (key, *row))]
+    links.busy += len(rows) - len(queued)
+    if queued:
+        settle_readings(sensor_type, frame.device_id, queued)
+
+async def telemetry_socket(request):
+    """One binary message per frame, for nodes that want delivery over a persistent TCP connection."""
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    async for message in ws:
+        if message.type == WSMsgType.BINARY:
+            receive_frame(message.data, "websocket")
+    return ws
+
+async def get_telemetry_status(request):
+    return no_store(web.json_response(dict(links.stats(), udp_port=TELEMETRY_PORT or None)))
+
+# ---------------- Device Endpoints ---------------- #
+
+async def device_checkin(request):
+    data = await read_json(request)
+    device_id = data.get('device_id') if isinstance(data, dict) else None
+    if not device_id:
+        return web.json_response({"error": "Missing device_id"}, status=400)
+
+    ip = request.remote
+    last_seen = time.time()
+
+    device = check_in(device_id, ip, last_seen)
+    device_by_ip[ip] = device_id
+    if device is not None:
+        if not store.queue_write(store.DEVICE_UPSERT, (device_id, ip, last_seen)):
+            return busy_response()
+        feed.publish("device", device_event(device_id, device, online=True))
+        print(f"Device {device_id} is online at {ip}")
+    return web.json_response({"message": "Check-in successful"})
+
+async def list_devices(request):
+    return tagged(request, f"{RUN}-{presence_version}", {
+        device_id: {
+            "ip": device["ip"],
+            "lastSeen": device["last_seen"]
+        }
+        for device_id, device in presence.items()
+    })
+
+async def list_device_readings(request):
+    """Latest cached reading of every type for each device that has sent one, e.g. for a floor-plan view."""
+    device_ids = sorted(set().union(*latest.values()))
+    return tagged(request, f"{RUN}-{latest_version}", {
+        device_id: {name: cache.get(device_id) for name, cache in latest.items()}
+        for device_id in device_ids
+    })
+
+async def get_retention_status(request):
+    return web.json_response({
+        "policies_days": {table: days for table, (column, days) in store.retention_policies.items()},
+        "database_bytes": store.database_bytes(),
+        "free_pages": await run_blocking(store.free_pages),
+        "runs": list(store.retention_runs),
+        "writes": dict(store.write_stats, backlog=len(store.write_backlog))
+    })
+
+# ---------------- Start Server ---------------- #
+
+RETENTION_INTERVAL = 3600
+RETENTION_FIRST_RUN = 300  # Seconds after startup
+
+async def retention_loop():
+    await asyncio.sleep(RETENTION_FIRST_RUN)
+    while True:
+        try:
+            await run_blocking(store.run_retention)
+        except sqlite3.Error as e:
+            print("Error applying retention:", str(e))
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+async def hub_lifecycle(app):
+    await run_blocking(store.init_db)
+    for sensor_type, device_id, ts_ms, values in await run_blocking(store.latest_readings):
+        remember_latest(sensor_type, device_id, ts_ms, values)
+    await load_presence()
+    load_motion_holds()
+    store.load_retention_policies()
+    store.start_writer()
+    telemetry = None
+    if TELEMETRY_PORT:
+        telemetry, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: TelemetryProtocol(receive_frame), local_addr=("0.0.0.0", TELEMETRY_PORT))
+        telemetry.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TELEMETRY_RECEIVE_BUFFER)
+    # Older databases are converted in the background while the hub runs;
+    # an interrupted migration starts over at the next start
+    threading.Thread(target=store.migrate_legacy, name="legacy-migration", daemon=True).start()
+    tasks = [asyncio.create_task(flush_presence_loop()), asyncio.create_task(retention_loop())]
+
+    yield
+
+    if telemetry is not None:
+        telemetry.close()
+    for task in tasks:
+        task.cancel()
+    store.retention_stop.set()
+    rows = presence_rows()
+    if rows:
+        await run_blocking(store.commit_batch, rows)
+    await run_blocking(store.stop_writer)  # Commit queued rows
+
+async def close_streams(app):
+    # Ends open /stream responses, Socket.IO pushes and long polls, so shutdown need not wait for them
+    feed.close()
+    for log in change_logs.values():
+        log.close()
+
+def create_app():
+    app = web.Application()
+    for name, sensor_type in SENSOR_TYPES.items():
+        app.router.add_post(f'/{name}-data', partial(receive_reading, sensor_type))
+        app.router.add_post(f'/{name}-data/batch', partial(receive_batch, sensor_type))
+        app.router.add_get(f'/{name}-latest', partial(get_latest, sensor_type))
+        app.router.add_get(f'/{name}-changes', partial(get_changes, sensor_type))
+        if sensor_type.rollup:
+            app.router.add_get(f'/{name}-history', partial(get_history, sensor_type))
+    app.router.add_post('/device-checkin', device_checkin)
+    app.router.add_get('/devices', list_devices)
+    app.router.add_get('/devices/latest', list_device_readings)
+    app.router.add_get('/stream', stream_updates)
+    app.router.add_get('/retention', get_retention_status)
+    app.router.add_get('/telemetry', get_telemetry_status)
+    app.router.add_get('/telemetry/ws', telemetry_socket)
+    app.cleanup_ctx.append(hub_lifecycle)
+    app.on_shutdown.append(close_streams)
+    sio.attach(app)
+    return app
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['migrate']:
+        store.migrate_offline(sys.argv[2] if len(sys.argv) > 2 else store.DATABASE)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Domus sensor hub")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    # SIGINT/SIGTERM (systemd stop) shut down gracefully, so queued rows are committed
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None, backlog=1024)
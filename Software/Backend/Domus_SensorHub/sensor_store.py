@@ -0,0 +1,698 @@
+"""
+SQLite storage for the sensor hub: schema, the single writer, rollups,
+legacy migration, retention and history reads.
+
+Everything here is blocking; the hub calls it from its executor threads,
+except queue_write(), which never waits and is safe on the event loop.
+"""
+from datetime import datetime
+import collections
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from sensor_types import SENSOR_TYPES, BME688, MOTION, motion_code
+
+DATABASE = os.environ.get("SENSOR_DATABASE", "domus.db")
+SCHEMA_VERSION = 2
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_DEVICE = "default"  # Readings that cannot be tied to a device
+
+# ---------------- Database ---------------- #
+
+# One long-lived writer connection shared by every thread (serialized by
+# write_lock) and a pool of long-lived read connections lent out per call.
+# WAL mode lets readers run while a write is in progress instead of failing
+# with "database is locked".
+read_pool = queue.LifoQueue()
+write_lock = threading.Lock()
+writer_conn = None
+
+def open_connection():
+    conn = sqlite3.connect(DATABASE, check_same_thread=False, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')  # fsync on checkpoint, not on every commit
+    conn.execute('PRAGMA cache_size=-8000')  # 8 MB page cache
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+@contextlib.contextmanager
+def reader():
+    """A read connection borrowed from the pool for the duration of the block."""
+    try:
+        conn = read_pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+    try:
+        yield conn
+    finally:
+        conn.rollback()  # End any open read transaction before the next borrower
+        read_pool.put(conn)
+
+def get_writer():
+    global writer_conn
+    if writer_conn is None:
+        writer_conn = open_connection()
+    return writer_conn
+
+def write_many(batch):
+    """Write a list of (query, params) in one transaction, one executemany per query."""
+    grouped = {}
+    for query, params in batch:
+        grouped.setdefault(query, []).append(params)
+    with write_lock:
+        conn = get_writer()
+        with conn:
+            for query, rows in grouped.items():
+                conn.executemany(query, rows)
+
+def insert_new(query, rows):
+    """
+    Run an INSERT OR IGNORE query for each row in one transaction; returns
+    the rows actually stored, leaving out those that were already there.
+    """
+    with write_lock:
+        conn = get_writer()
+        with conn:
+            return [row for row in rows if conn.execute(query, row).rowcount]
+
+def init_db():
+    with write_lock:
+        conn = get_writer()
+        cursor = conn.cursor()
+        # Let retention hand freed pages back to the filesystem. This applies
+        # at once to a new file, and to an existing one at its next VACUUM.
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+        # Readings are keyed by (device, epoch milliseconds) in WITHOUT ROWID
+        # tables, so rows are stored clustered by device and time: a device's
+        # time range is one contiguous B-tree walk with no separate index.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS DeviceKeys (
+                device_key INTEGER PRIMARY KEY,
+                device_id TEXT NOT NULL UNIQUE
+            )
+        ''')
+
+        for sensor_type in SENSOR_TYPES.values():
+            cursor.execute(sensor_type.create_table())
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id TEXT PRIMARY KEY,
+                ip TEXT,
+                last_seen REAL
+            )
+        ''')
+
+        for sensor_type in SENSOR_TYPES.values():
+            if sensor_type.rollup:
+                create_rollups(cursor, sensor_type)
+
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+
+        if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            if os.path.getsize(DATABASE) <= ONLINE_VACUUM_MAX_BYTES:
+                conn.execute('VACUUM')
+            else:
+                print(f"{DATABASE} is too large to convert to incremental auto-vacuum at startup; "
+                      f"run `python sensor_hub.py migrate {DATABASE}` with the hub stopped")
+
+        device_keys.update(conn.execute('SELECT device_id, device_key FROM DeviceKeys').fetchall())
+
+# ---------------- Devices and Timestamps ---------------- #
+
+# Readings store a small integer per device instead of the device_id string;
+# the mapping is tiny and kept in memory.
+device_keys = {}  # device_id -> device_key
+
+DEVICE_UPSERT = '''
+    INSERT INTO devices (device_id, ip, last_seen)
+    VALUES (?, ?, ?)
+    ON CONFLICT(device_id) DO UPDATE SET
+        ip = excluded.ip,
+        last_seen = excluded.last_seen;
+'''
+
+def device_key(device_id):
+    key = device_keys.get(device_id)
+    if key is None:
+        with write_lock:
+            conn = get_writer()
+            with conn:
+                conn.execute('INSERT OR IGNORE INTO DeviceKeys (device_id) VALUES (?)', (device_id,))
+            key = conn.execute('SELECT device_key FROM DeviceKeys WHERE device_id = ?', (device_id,)).fetchone()[0]
+        device_keys[device_id] = key
+    return key
+
+def stored_devices(seen_since=0):
+    """(device_id, ip, last_seen) rows of devices that checked in at or after epoch seconds seen_since."""
+    with reader() as conn:
+        return conn.execute('SELECT device_id, ip, last_seen FROM devices WHERE last_seen >= ? ORDER BY last_seen',
+                            (seen_since,)).fetchall()
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def format_ms(ts_ms):
+    """Epoch milliseconds as the local "%Y-%m-%d %H:%M:%S" string the app displays."""
+    return datetime.fromtimestamp(ts_ms / 1000).strftime(TIMESTAMP_FORMAT)
+
+# ---------------- Rollups ---------------- #
+
+# Minute, hour and day summaries of each field of a sensor type with a
+# rollup prefix (min, max, sum and count for the mean, and the last value),
+# kept current by a trigger on its readings table: every ingest path,
+# including the legacy migration, updates them in the same transaction as
+# the raw row. Long-range history reads these instead of raw samples. Minute
+# and hour buckets are aligned to epoch time, day buckets to local midnight.
+ROLLUPS = {
+    # resolution -> (table suffix, nominal bucket width in ms, bucket start of a ts_ms expression)
+    "minute": ("Minute", 60 * 1000, "{ts} - {ts} % 60000"),
+    "hour": ("Hourly", 3600 * 1000, "{ts} - {ts} % 3600000"),
+    "day": ("Daily", 86400 * 1000,
+            "CAST(strftime('%s', {ts} / 1000, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER) * 1000")
+}
+ROLLUP_KEEP_DAYS = {"minute": 30, "hour": None, "day": None}
+ROLLUP_STATS = ("min", "max", "sum", "count", "last")
+
+def rollup_table(sensor_type, resolution):
+    return sensor_type.rollup + ROLLUPS[resolution][0]
+
+def rollup_columns(sensor_type):
+    return ["device_key", "bucket_ms", "samples", "last_ts"] + \
+        [f"{field}_{stat}" for field in sensor_type.fields for stat in ROLLUP_STATS]
+
+def rollup_upsert(sensor_type, table, bucket):
+    """Trigger statement folding NEW (a readings row) into its bucket of table."""
+    values = ["NEW.device_key", bucket.format(ts="NEW.ts_ms"), "1", "NEW.ts_ms"]
+    updates = ["samples = samples + 1", "last_ts = max(last_ts, excluded.last_ts)"]
+    for field in sensor_type.fields:
+        values += [f"NEW.{field}", f"NEW.{field}", f"coalesce(NEW.{field}, 0)", f"NEW.{field} IS NOT NULL", f"NEW.{field}"]
+        # SQLite's two-argument min()/max() return NULL if either side is NULL
+        updates += [
+            f"{field}_min = coalesce(min({field}_min, excluded.{field}_min), {field}_min, excluded.{field}_min)",
+            f"{field}_max = coalesce(max({field}_max, excluded.{field}_max), {field}_max, excluded.{field}_max)",
+            f"{field}_sum = {field}_sum + excluded.{field}_sum",
+            f"{field}_count = {field}_count + excluded.{field}_count",
+            f"{field}_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.{field}_last ELSE {field}_last END"
+        ]
+    return f'''
+        INSERT INTO {table} ({", ".join(rollup_columns(sensor_type))})
+        VALUES ({", ".join(values)})
+        ON CONFLICT (device_key, bucket_ms) DO UPDATE SET {", ".join(updates)};
+    '''
+
+def create_rollups(cursor, sensor_type):
+    stats = ", ".join(f"{field}_min REAL, {field}_max REAL, {field}_sum REAL, {field}_count INTEGER, {field}_last REAL"
+                      for field in sensor_type.fields)
+    for resolution in ROLLUPS:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {rollup_table(sensor_type, resolution)} (
+                device_key INTEGER NOT NULL,
+                bucket_ms INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                last_ts INTEGER NOT NULL,
+                {stats},
+                PRIMARY KEY (device_key, bucket_ms)
+            ) WITHOUT ROWID
+        ''')
+    # Raw inserts are INSERT OR IGNORE, so a re-sent reading never fires this
+    # twice. migrate_legacy() copies old readings in through the same inserts,
+    # so they are rolled up as they arrive and need no separate backfill.
+    upserts = "".join(rollup_upsert(sensor_type, rollup_table(sensor_type, resolution), bucket)
+                      for resolution, (suffix, width, bucket) in ROLLUPS.items())
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {sensor_type.name}_rollups AFTER INSERT ON {sensor_type.table}
+        BEGIN
+            {upserts}
+        END
+    ''')
+
+# ---------------- Legacy Migration ---------------- #
+
+# Databases from before schema version 2 keep readings in BME688Data and
+# MotionData (text timestamps, text motion, no device). migrate_legacy()
+# copies them into the compact tables MIGRATION_CHUNK rows at a time, each
+# chunk in its own short write transaction, so the hub keeps ingesting and
+# answering while it runs; the legacy tables are dropped once copied.
+# Re-running it after an interruption is safe: copied rows are skipped.
+MIGRATION_CHUNK = 5000
+MIGRATION_PAUSE = 0.05  # Seconds between chunks, leaving the writer lock to live traffic
+
+LEGACY_TABLES = {
+    "BME688Data": (
+        'SELECT id, timestamp, temperature, humidity, pressure, gas_resistance FROM BME688Data WHERE id > ? ORDER BY id LIMIT ?',
+        BME688.insert,
+        lambda key, ts_ms, row: (key, ts_ms, row["temperature"], row["humidity"], row["pressure"], row["gas_resistance"])
+    ),
+    "MotionData": (
+        'SELECT id, timestamp, motion FROM MotionData WHERE id > ? ORDER BY id LIMIT ?',
+        MOTION.insert,
+        lambda key, ts_ms, row: (key, ts_ms, motion_code(row["motion"]) or 0)
+    )
+}
+
+def legacy_tables(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    return [row[0] for row in rows if row[0] in LEGACY_TABLES]
+
+def legacy_ms(timestamp):
+    try:
+        return int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
+
+def migrate_table(table):
+    select, insert, convert = LEGACY_TABLES[table]
+    key = device_key(DEFAULT_DEVICE)
+    conn_reader = open_connection()
+    last_id, last_ts, copied, skipped = 0, None, 0, 0
+    try:
+        while True:
+            rows = conn_reader.execute(select, (last_id, MIGRATION_CHUNK)).fetchall()
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                ts_ms = legacy_ms(row["timestamp"])
+                if ts_ms is None:
+                    skipped += 1
+                    continue
+                # Legacy timestamps are whole seconds; keep readings that share one apart and in order
+                if last_ts is not None and ts_ms <= last_ts and ts_ms // 1000 == last_ts // 1000:
+                    ts_ms = last_ts + 1
+                last_ts = ts_ms
+                batch.append(convert(key, ts_ms, row))
+            with write_lock:
+                conn = get_writer()
+                with conn:
+                    conn.executemany(insert, batch)
+            copied += len(batch)
+            last_id = rows[-1]["id"]
+            time.sleep(MIGRATION_PAUSE)
+    finally:
+        conn_reader.close()
+
+    with write_lock:
+        conn = get_writer()
+        with conn:
+            conn.execute(f'DROP TABLE {table}')
+    print(f"Migrated {copied} rows from {table} ({skipped} with unreadable timestamps skipped)")
+    return copied
+
+def migrate_legacy():
+    """Copy every legacy table into the compact schema; returns the number of rows copied."""
+    with reader() as conn:
+        tables = legacy_tables(conn)
+    copied = 0
+    for table in tables:
+        try:
+            copied += migrate_table(table)
+        except sqlite3.Error as e:
+            print(f"Error migrating {table}:", str(e))
+    return copied
+
+def migrate_offline(path):
+    """`python sensor_hub.py migrate [domus.db]`: migrate with the hub stopped, then compact the file."""
+    global DATABASE
+    DATABASE = path
+    before = os.path.getsize(path) if os.path.exists(path) else 0
+    init_db()
+    migrate_legacy()
+    with write_lock:
+        conn = get_writer()
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    print(f"{path}: {before / 1024:.0f} KB -> {os.path.getsize(path) / 1024:.0f} KB")
+
+# ---------------- Latest Readings ---------------- #
+
+def latest_readings():
+    """
+    The newest stored reading of every device and sensor type, as
+    (sensor_type, device_id, ts_ms, values); one primary-key lookup each.
+    """
+    readings = []
+    with reader() as conn:
+        for device_id, key in device_keys.items():
+            for sensor_type in SENSOR_TYPES.values():
+                row = conn.execute(f'''
+                    SELECT ts_ms, {", ".join(sensor_type.fields)}
+                    FROM {sensor_type.table} WHERE device_key = ? ORDER BY ts_ms DESC LIMIT 1
+                ''', (key,)).fetchone()
+                if row:
+                    readings.append((sensor_type, device_id, row[0], tuple(row)[1:]))
+
+        # Until migrate_legacy() has finished, the newest reading may still be in a legacy table
+        tables = legacy_tables(conn)
+        if "BME688Data" in tables:
+            row = conn.execute('''
+                SELECT timestamp, temperature, humidity, pressure, gas_resistance
+                FROM BME688Data ORDER BY id DESC LIMIT 1
+            ''').fetchone()
+            if row and legacy_ms(row["timestamp"]) is not None:
+                readings.append((BME688, DEFAULT_DEVICE, legacy_ms(row["timestamp"]), tuple(row)[1:]))
+        if "MotionData" in tables:
+            row = conn.execute('SELECT timestamp, motion FROM MotionData ORDER BY id DESC LIMIT 1').fetchone()
+            if row and legacy_ms(row["timestamp"]) is not None:
+                readings.append((MOTION, DEFAULT_DEVICE, legacy_ms(row["timestamp"]), (motion_code(row["motion"]) or 0,)))
+    return readings
+
+# ---------------- Write-Behind Queue ---------------- #
+
+# Single readings only enqueue their row; one writer thread commits the queue
+# in batches, every FLUSH_INTERVAL seconds or FLUSH_BATCH rows, whichever is
+# first. A full queue makes POSTs answer 503 so the ESP32s back off.
+# Queued rows were already acknowledged, so none is given up lightly. When
+# the database cannot take writes ("database is locked" past the busy
+# timeout, disk full), the batch goes back to the front of the line and the
+# writer backs off; the queue fills meanwhile and POSTs get 503s. A batch the
+# database rejects row by row (a constraint) is split in halves so only the
+# offending rows are dropped. Both are counted in write_stats.
+WRITE_QUEUE_SIZE = 10000
+FLUSH_INTERVAL = 0.25
+FLUSH_BATCH = 500
+WRITE_RETRY_DELAY = 0.5  # Seconds the writer waits after a failed batch, doubled for each one after
+WRITE_RETRY_MAX_DELAY = 30
+
+write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+write_backlog = collections.deque()  # Rows put back after a failed batch, written before the queue
+writer_stop = threading.Event()
+writer_thread = None
+write_stats = {"batches_deferred": 0, "rows_lost": 0, "last_error": None}
+
+def queue_write(query, params):
+    """Queue a write for the writer thread without waiting; False if the queue is full (backpressure)."""
+    try:
+        write_queue.put_nowait((query, params))
+        return True
+    except queue.Full:
+        print("Write queue full; rejecting sensor data")
+        return False
+
+class UnwrittenRows(Exception):
+    """The database became unavailable partway through split_batch; rows holds what was not written."""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.rows = rows
+
+def defer_batch(batch, error):
+    write_backlog.extendleft(reversed(batch))
+    write_stats["batches_deferred"] += 1
+    write_stats["last_error"] = str(error)
+    print(f"Database unavailable; {len(batch)} rows put back:", str(error))
+
+def commit_batch(batch):
+    """Commit queued writes; False if the database could not take them and they were put back."""
+    try:
+        write_many(batch)
+        return True
+    except sqlite3.OperationalError as e:
+        defer_batch(batch, e)
+        return False
+    except sqlite3.Error:
+        try:
+            split_batch(batch)
+            return True
+        except UnwrittenRows as e:
+            defer_batch(e.rows, e.__cause__)
+            return False
+
+def split_batch(batch):
+    """Commit a batch the database rejected in ever smaller halves, dropping only the rows it rejects."""
+    try:
+        write_many(batch)
+        return
+    except sqlite3.OperationalError as e:
+        raise UnwrittenRows(batch) from e
+    except sqlite3.Error as e:
+        if len(batch) == 1:
+            write_stats["rows_lost"] += 1
+            write_stats["last_error"] = str(e)
+            print("Dropping row the database rejects:", str(e), batch[0][1])
+            return
+    half = len(batch) // 2
+    try:
+        split_batch(batch[:half])
+    except UnwrittenRows as e:
+        raise UnwrittenRows(e.rows + batch[half:]) from e.__cause__
+    split_batch(batch[half:])
+
+def take_backlog(max_rows):
+    batch = []
+    while write_backlog and len(batch) < max_rows:
+        batch.append(write_backlog.popleft())
+    return batch
+
+def flush_writes(max_rows=None):
+    """Commit what is put back or queued (up to max_rows) as one batch; returns the rows committed."""
+    batch = take_backlog(max_rows or FLUSH_BATCH)
+    while max_rows is None or len(batch) < max_rows:
+        try:
+            batch.append(write_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch and not commit_batch(batch):
+        return 0
+    return len(batch)
+
+def next_batch():
+    """Rows put back first; otherwise wait for the first queued row, then give the batch FLUSH_INTERVAL to fill."""
+    batch = take_backlog(FLUSH_BATCH)
+    if batch:
+        return batch
+    try:
+        batch.append(write_queue.get(timeout=1))
+    except queue.Empty:
+        return batch
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while len(batch) < FLUSH_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(write_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def run_writer():
+    delay = WRITE_RETRY_DELAY
+    while not writer_stop.is_set():
+        batch = next_batch()
+        if not batch:
+            continue
+        if commit_batch(batch):
+            delay = WRITE_RETRY_DELAY
+        else:
+            writer_stop.wait(delay)
+            delay = min(delay * 2, WRITE_RETRY_MAX_DELAY)
+
+def start_writer():
+    global writer_thread
+    writer_thread = threading.Thread(target=run_writer, name="db-writer", daemon=True)
+    writer_thread.start()
+
+def stop_writer():
+    """Stop the writer thread, letting it commit its batch, then commit everything still queued."""
+    writer_stop.set()
+    if writer_thread is not None:
+        writer_thread.join(timeout=FLUSH_INTERVAL + 5)
+    while flush_writes(FLUSH_BATCH):
+        pass
+    unwritten = len(write_backlog) + write_queue.qsize()
+    if unwritten:
+        write_stats["rows_lost"] += unwritten
+        print(f"Database unavailable at shutdown; {unwritten} rows not written")
+
+# ---------------- Retention ---------------- #
+
+# Rows older than their table's policy are deleted in the background, one
+# device and RETENTION_CHUNK rows at a time, each chunk its own short write
+# transaction so ingest never waits long. Freed pages are then returned to
+# the filesystem with incremental vacuum and the WAL is truncated, so the
+# file settles at the size of the retained window instead of growing.
+# Raw tables keep their type's keep_days and rollups ROLLUP_KEEP_DAYS; both
+# can be overridden with RETENTION ("BME688Readings=14,BME688Minute=forever").
+DEVICE_KEEP_DAYS = 90  # Devices not checked in for this long
+RETENTION_CHUNK = 2000
+RETENTION_PAUSE = 0.05
+VACUUM_STEP_PAGES = 256
+AUTO_VACUUM_INCREMENTAL = 2
+ONLINE_VACUUM_MAX_BYTES = 64 * 1024 * 1024
+
+def default_retention_policies():
+    """table -> (time column, days to keep or None to keep forever)"""
+    policies = {}
+    for sensor_type in SENSOR_TYPES.values():
+        policies[sensor_type.table] = ("ts_ms", sensor_type.keep_days)
+        if sensor_type.rollup:
+            policies.update((rollup_table(sensor_type, resolution), ("bucket_ms", days))
+                            for resolution, days in ROLLUP_KEEP_DAYS.items())
+    policies["devices"] = ("last_seen", DEVICE_KEEP_DAYS)
+    return policies
+
+retention_policies = default_retention_policies()
+retention_runs = collections.deque(maxlen=24)
+retention_stop = threading.Event()
+
+def load_retention_policies():
+    for entry in (item.strip() for item in os.environ.get("RETENTION", "").split(",")):
+        if not entry:
+            continue
+        table, _, days = entry.partition("=")
+        if table not in retention_policies:
+            print(f"Ignoring retention policy for unknown table {table}")
+            continue
+        column = retention_policies[table][0]
+        retention_policies[table] = (column, None if days.strip() in ("", "forever") else float(days))
+
+def delete_chunk(table, column, key, cutoff):
+    """Delete up to RETENTION_CHUNK of one device's rows older than cutoff; returns the count."""
+    with write_lock:
+        conn = get_writer()
+        with conn:
+            row = conn.execute(f'''
+                SELECT {column} FROM {table} WHERE device_key = ? AND {column} < ?
+                ORDER BY {column} LIMIT 1 OFFSET ?
+            ''', (key, cutoff, RETENTION_CHUNK - 1)).fetchone()
+            upper = row[0] + 1 if row else cutoff
+            return conn.execute(f'DELETE FROM {table} WHERE device_key = ? AND {column} < ?', (key, upper)).rowcount
+
+def prune_table(table, column, cutoff_ms):
+    if table == "devices":
+        with write_lock:
+            conn = get_writer()
+            with conn:
+                return conn.execute('DELETE FROM devices WHERE last_seen < ?', (cutoff_ms / 1000,)).rowcount
+    deleted = 0
+    for key in list(device_keys.values()):
+        while not retention_stop.is_set():
+            count = delete_chunk(table, column, key, cutoff_ms)
+            deleted += count
+            if count < RETENTION_CHUNK:
+                break
+            time.sleep(RETENTION_PAUSE)
+    return deleted
+
+def reclaim_space():
+    """Return free pages to the filesystem VACUUM_STEP_PAGES at a time; returns the pages released."""
+    released = 0
+    while not retention_stop.is_set():
+        with write_lock:
+            conn = get_writer()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                break
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if free == 0:
+                break
+            # execute() would only step the pragma once, freeing a single page
+            conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})')
+            released += free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        time.sleep(RETENTION_PAUSE)
+    return released
+
+def database_bytes():
+    return sum(os.path.getsize(path) for path in (DATABASE, DATABASE + '-wal') if os.path.exists(path))
+
+def free_pages():
+    with reader() as conn:
+        return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def run_retention(now=None):
+    """Apply every retention policy once, relative to `now` (epoch ms); returns the run's stats."""
+    now = now or now_ms()
+    started = time.monotonic()
+    size_before = database_bytes()
+    deleted = {}
+    for table, (column, days) in retention_policies.items():
+        if days is not None:
+            deleted[table] = prune_table(table, column, now - int(days * 86400 * 1000))
+    pages_released = reclaim_space()
+    with write_lock:
+        get_writer().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    stats = {
+        "timestamp": format_ms(now),
+        "seconds": round(time.monotonic() - started, 3),
+        "deleted": deleted,
+        "pages_released": pages_released,
+        "bytes_before": size_before,
+        "bytes_after": database_bytes()
+    }
+    retention_runs.append(stats)
+    print(f"Retention: deleted {sum(deleted.values())} rows, released {pages_released} pages, "
+          f"{size_before / 1024:.0f} KB -> {stats['bytes_after'] / 1024:.0f} KB in {stats['seconds']}s")
+    return stats
+
+# ---------------- History ---------------- #
+
+HISTORY_DEFAULT_POINTS = 300
+HISTORY_MAX_POINTS = 5000
+
+def choose_resolution(conn, sensor_type, key, from_ms, to_ms, points):
+    """
+    The coarsest rollup with at least `points` buckets in the range, not
+    exceeding HISTORY_MAX_POINTS. Ranges too short for that many minutes are
+    served raw if the raw readings fit.
+    """
+    chosen = None
+    for resolution in ("day", "hour", "minute"):
+        buckets = (to_ms - from_ms) / ROLLUPS[resolution][1]
+        if buckets > HISTORY_MAX_POINTS:
+            break
+        chosen = resolution
+        if buckets >= points:
+            return resolution
+    if chosen == "minute":
+        count = conn.execute(f'SELECT count(*) FROM {sensor_type.table} WHERE device_key = ? AND ts_ms >= ? AND ts_ms < ?',
+                             (key, from_ms, to_ms)).fetchone()[0]
+        if count <= HISTORY_MAX_POINTS:
+            return "raw"
+    return chosen or "day"
+
+def read_history(conn, sensor_type, key, from_ms, to_ms, resolution):
+    """Columnar history at the given resolution, or None if it has more than HISTORY_MAX_POINTS points."""
+    if resolution == "raw":
+        rows = conn.execute(f'''
+            SELECT ts_ms, {", ".join(sensor_type.fields)} FROM {sensor_type.table}
+            WHERE device_key = ? AND ts_ms >= ? AND ts_ms < ? ORDER BY ts_ms LIMIT ?
+        ''', (key, from_ms, to_ms, HISTORY_MAX_POINTS + 1)).fetchall()
+        if len(rows) > HISTORY_MAX_POINTS:
+            return None
+        history = {"t": [row["ts_ms"] / 1000 for row in rows]}
+        history.update({field: [row[field] for row in rows] for field in sensor_type.fields})
+        return history
+
+    width = ROLLUPS[resolution][1]
+    # Include the bucket that began before from_ms but covers it
+    rows = conn.execute(f'''
+        SELECT * FROM {rollup_table(sensor_type, resolution)}
+        WHERE device_key = ? AND bucket_ms > ? AND bucket_ms < ? ORDER BY bucket_ms LIMIT ?
+    ''', (key, from_ms - width, to_ms, HISTORY_MAX_POINTS + 1)).fetchall()
+    if len(rows) > HISTORY_MAX_POINTS:
+        return None
+    history = {"t": [row["bucket_ms"] // 1000 for row in rows], "samples": [row["samples"] for row in rows]}
+    for field in sensor_type.fields:
+        history[field] = {
+            "min": [row[f"{field}_min"] for row in rows],
+            "max": [row[f"{field}_max"] for row in rows],
+            "mean": [round(row[f"{field}_sum"] / row[f"{field}_count"], 3) if row[f"{field}_count"] else None
+                     for row in rows],
+            "last": [row[f"{field}_last"] for row in rows]
+        }
+    return history
+
+def history(sensor_type, key, from_ms, to_ms, resolution, points):
+    """(resolution used, columnar history or None if too many points) for one device."""
+    with reader() as conn:
+        if resolution == "auto":
+            resolution = choose_resolution(conn, sensor_type, key, from_ms, to_ms, points)
+        return resolution, read_history(conn, sensor_type, key, from_ms, to_ms, resolution)
@@ -0,0 +1,144 @@
+"""
+Sensor types the hub accepts.
+
+Each type is one readings table keyed by (device_key, ts_ms) plus a parser
+that validates a reading before anything is queued. Adding a kind of sensor
+node means registering a SensorType here: the hub creates its table and
+serves /<name>-data, /<name>-data/batch and /<name>-latest for it, and
+/<name>-history when it has rollups. Types with a wire_code can also be sent
+as binary telemetry frames (telemetry.py).
+"""
+import math
+import struct
+
+MOTION_CODES = {"no motion": 0, "motion detected": 1}
+MOTION_NAMES = {code: name for name, code in MOTION_CODES.items()}
+MOTION_ALIASES = {"clear": 0, "detected": 1}  # What motion_sensor_ESP32.ino sends
+
+
+def motion_code(motion):
+    """0/1 for a motion state string, or None if it is not one."""
+    if not isinstance(motion, str):
+        return None
+    return MOTION_CODES.get(motion, MOTION_ALIASES.get(motion))
+
+
+def number_field(reading, field):
+    value = reading.get(field)
+    if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+        raise ValueError(f"{field} must be a number")
+    return value
+
+
+def float_fields(values):
+    """Stored values of a binary reading's float fields; nodes send NaN for a missing one."""
+    return tuple(None if math.isnan(value) else value for value in values)
+
+
+class SensorType:
+    """
+    One kind of sensor reading.
+
+    fields maps each stored column to its SQLite type. parse turns a JSON
+    reading into the column values, raising ValueError for a bad one (the
+    default accepts a number or null per field), and present turns stored
+    values back into the JSON the app reads. empty is what /<name>-latest
+    answers before any reading has arrived.
+
+    Types with a rollup prefix get minute, hour and day summaries of their
+    fields (<prefix>Minute, <prefix>Hourly, <prefix>Daily). keep_days is how
+    long raw readings are kept. For changes_only types only readings that
+    change a device's state are pushed to live clients, and prefer picks the
+    reading /<name>-latest answers with when no device is named (default:
+    the newest).
+
+    wire_code identifies the type in binary telemetry frames and
+    wire_format is the struct format of one reading's fields there;
+    wire_decode checks the unpacked fields and turns them into column values
+    (the default maps NaN to null).
+    """
+
+    def __init__(self, name, table, fields, parse=None, present=None, empty=None, rollup=None, keep_days=30,
+                 changes_only=False, prefer=None, wire_code=None, wire_format=None, wire_decode=None):
+        self.name = name
+        self.table = table
+        self.fields = dict(fields)
+        self.parse = parse or self.parse_numbers
+        self.present = present or (lambda values: dict(zip(self.fields, values)))
+        self.empty = empty or dict.fromkeys(self.fields)
+        self.rollup = rollup
+        self.keep_days = keep_days
+        self.changes_only = changes_only
+        self.prefer = prefer
+        self.wire_code = wire_code
+        self.wire = struct.Struct("<I" + wire_format) if wire_code else None  # Age in ms, then the fields
+        self.wire_decode = wire_decode or float_fields
+        self.insert = f'''
+            INSERT OR IGNORE INTO {table} (device_key, ts_ms, {", ".join(self.fields)})
+            VALUES (?, ?{", ?" * len(self.fields)})
+        '''
+
+    def parse_numbers(self, reading):
+        return tuple(number_field(reading, field) for field in self.fields)
+
+    def create_table(self):
+        columns = ", ".join(f"{field} {column_type}" for field, column_type in self.fields.items())
+        return f'''
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                device_key INTEGER NOT NULL,
+                ts_ms INTEGER NOT NULL,
+                {columns},
+                PRIMARY KEY (device_key, ts_ms)
+            ) WITHOUT ROWID
+        '''
+
+
+SENSOR_TYPES = {}
+WIRE_TYPES = {}  # wire_code -> SensorType
+
+
+def register(sensor_type):
+    SENSOR_TYPES[sensor_type.name] = sensor_type
+    if sensor_type.wire_code:
+        WIRE_TYPES[sensor_type.wire_code] = sensor_type
+    return sensor_type
+
+
+def parse_motion(reading):
+    code = motion_code(reading.get("motion"))
+    if code is None:
+        raise ValueError(f"motion must be one of {', '.join([*MOTION_CODES, *MOTION_ALIASES])}")
+    return (code,)
+
+
+def motion_wire(values):
+    if values[0] not in MOTION_NAMES:
+        raise ValueError("motion must be 0 (no motion) or 1 (motion detected)")
+    return values
+
+
+BME688 = register(SensorType(
+    "bme688", "BME688Readings",
+    {"temperature": "REAL", "humidity": "REAL", "pressure": "REAL", "gas_resistance": "REAL"},
+    empty={"temperature": 0, "humidity": 0, "pressure": 0, "gas_resistance": 0, "timestamp": None,
+           "message": "No recent sensor data"},
+    rollup="BME688",
+    keep_days=7,
+    wire_code=1,
+    wire_format="4f"
+))
+
+MOTION = register(SensorType(
+    "motion", "MotionEvents",
+    {"motion": "INTEGER NOT NULL"},
+    parse=parse_motion,
+    present=lambda values: {"motion": MOTION_NAMES[values[0]]},
+    empty={"motion": "no motion", "timestamp": None},
+    keep_days=30,
+    changes_only=True,
+    # With no device named, a device still reporting motion wins over newer "no motion" events
+    prefer=lambda reading: reading["motion"] == "motion detected",
+    wire_code=2,
+    wire_format="B",
+    wire_decode=motion_wire
+))
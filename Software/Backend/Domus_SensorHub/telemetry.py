@@ -0,0 +1,205 @@
+"""
+Compact binary telemetry: fixed-layout frames a node sends over UDP (port
+TELEMETRY_PORT) or as binary messages on a WebSocket (/telemetry/ws),
+instead of one JSON HTTP request per reading.
+
+Frame layout, little-endian so an ESP32 can send a packed struct as is:
+
+    offset  size  field
+    0       2     magic "DT"
+    2       1     version (1)
+    3       1     sensor type: its wire_code in sensor_types.py (1 BME688, 2 motion)
+    4       2     session: picked at random when the node boots
+    6       4     sequence: the frame's number within the session, +1 per frame
+    10      1     reading count (1-64)
+    11      1     device_id length n (1-32)
+    12      n     device_id, UTF-8
+    12+n          each reading: uint32 age in ms when sent, then the type's
+                  fields (BME688: 4 float32, NaN if missing; motion: uint8 0/1)
+
+One BME688 reading from "env-node1" is a 41-byte datagram. Frames carry no
+acknowledgement; the sequence numbers let the hub count frames lost on the
+way, and a node that must not lose readings should use the WebSocket.
+"""
+import asyncio
+import struct
+import time
+
+from sensor_types import WIRE_TYPES
+
+MAGIC = b"DT"
+VERSION = 1
+HEADER = struct.Struct("<2sBBHIBB")
+MAX_READINGS = 64
+MAX_DEVICE_ID = 32
+MAX_AGE_MS = 7 * 24 * 3600 * 1000  # Like batch uploads, readings older than this are not backfilled
+SEQUENCE_WINDOW = 64  # Frames that may arrive out of order before counting as stale
+MAX_SEQUENCE_GAP = 1 << 16  # A jump further than this either way is a resync, not loss (about 9 h at 2 frames/s)
+
+
+class FrameError(ValueError):
+    pass
+
+
+class Frame:
+    def __init__(self, sensor_type, device_id, session, sequence, readings):
+        self.sensor_type = sensor_type
+        self.device_id = device_id
+        self.session = session
+        self.sequence = sequence
+        self.readings = readings  # [(age_ms, values)]
+
+
+def decode_frame(data):
+    """Decode and validate one frame, unpacking it in place; raises FrameError for a bad one."""
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise FrameError("frame is shorter than its header")
+    magic, version, code, session, sequence, count, id_length = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise FrameError("not a version 1 telemetry frame")
+    sensor_type = WIRE_TYPES.get(code)
+    if sensor_type is None:
+        raise FrameError(f"unknown sensor type {code}")
+    if not 1 <= count <= MAX_READINGS or not 1 <= id_length <= MAX_DEVICE_ID:
+        raise FrameError("bad reading count or device_id length")
+    start = HEADER.size + id_length
+    if len(view) != start + count * sensor_type.wire.size:
+        raise FrameError("frame length does not match its reading count")
+    try:
+        device_id = str(view[HEADER.size:start], "utf-8")
+        readings = []
+        for age_ms, *values in sensor_type.wire.iter_unpack(view[start:]):
+            if age_ms > MAX_AGE_MS:
+                raise FrameError("reading is too old to backfill")
+            readings.append((age_ms, sensor_type.wire_decode(tuple(values))))
+    except ValueError as e:  # Includes UnicodeDecodeError
+        raise FrameError(str(e)) from None
+    return Frame(sensor_type, device_id, session, sequence, readings)
+
+
+def encode_frame(sensor_type, device_id, session, sequence, readings):
+    """Build a frame from (age_ms, values) readings, as a node would; None values are sent as NaN."""
+    device = device_id.encode()
+    parts = [HEADER.pack(MAGIC, VERSION, sensor_type.wire_code, session, sequence & 0xFFFFFFFF,
+                         len(readings), len(device)), device]
+    for age_ms, values in readings:
+        parts.append(sensor_type.wire.pack(int(age_ms), *(float("nan") if value is None else value
+                                                           for value in values)))
+    return b"".join(parts)
+
+
+class Link:
+    """Sequence tracking and counters for one node."""
+
+    def __init__(self, session, transport):
+        self.session = session
+        self.transport = transport
+        self.first = None  # First sequence seen in this session
+        self.sequence = None  # Highest sequence seen in this session
+        self.window = 0  # Bit i set: sequence - i has arrived
+        self.frames = 0
+        self.readings = 0
+        self.lost = 0  # Gaps in the sequence, less frames that turned up late
+        self.late = 0
+        self.duplicates = 0
+        self.stale = 0  # Older than the window, so dropped as possible duplicates
+        self.restarts = 0
+        self.last_frame = None
+
+    def as_dict(self):
+        return {
+            "transport": self.transport,
+            "frames": self.frames,
+            "readings": self.readings,
+            "lost": self.lost,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "stale": self.stale,
+            "restarts": self.restarts,
+            "lastFrame": self.last_frame
+        }
+
+
+class LinkTracker:
+    """
+    Per-node loss accounting over frame sequence numbers, with a sliding
+    window (as in IPsec replay protection) so frames that arrive out of
+    order are stored once and taken back out of the lost count. A new
+    session means the node rebooted and its sequence starts over; so does a
+    jump of more than MAX_SEQUENCE_GAP frames, which is not counted as lost.
+    """
+
+    def __init__(self):
+        self.links = {}  # device_id -> Link
+        self.malformed = 0
+        self.busy = 0  # Readings dropped because the write queue was full
+
+    def accept(self, frame, transport):
+        """Account for a frame; False if it is a duplicate or stale and must not be stored."""
+        link = self.links.get(frame.device_id)
+        if link is None:
+            link = self.links[frame.device_id] = Link(frame.session, transport)
+        elif link.session != frame.session:
+            link.session, link.sequence = frame.session, None
+            link.restarts += 1
+        link.transport = transport
+
+        if link.sequence is not None and (MAX_SEQUENCE_GAP < (frame.sequence - link.sequence) & 0xFFFFFFFF
+                                          < (1 << 32) - MAX_SEQUENCE_GAP):
+            # Spoofed, or a node that lost its count without a new session
+            link.sequence = None
+            link.restarts += 1
+
+        if link.sequence is None:
+            link.first = link.sequence = frame.sequence
+            link.window = 1
+        else:
+            ahead = (frame.sequence - link.sequence) & 0xFFFFFFFF
+            if ahead == 0:
+                link.duplicates += 1
+                return False
+            if ahead < 1 << 31:
+                link.lost += ahead - 1
+                # A jump past the window leaves none of its bits set
+                link.window = (link.window << ahead | 1) & ((1 << SEQUENCE_WINDOW) - 1) if ahead < SEQUENCE_WINDOW else 1
+                link.sequence = frame.sequence
+            else:
+                behind = (1 << 32) - ahead
+                if behind >= SEQUENCE_WINDOW:
+                    link.stale += 1
+                    return False
+                if link.window & 1 << behind:
+                    link.duplicates += 1
+                    return False
+                link.window |= 1 << behind
+                link.late += 1
+                if behind < (link.sequence - link.first) & 0xFFFFFFFF:
+                    link.lost -= 1  # Counted lost when a later frame arrived
+
+        link.frames += 1
+        link.readings += len(frame.readings)
+        link.last_frame = time.time()
+        return True
+
+    def stats(self):
+        links = self.links.values()
+        totals = {field: sum(getattr(link, field) for link in links)
+                  for field in ("frames", "readings", "lost", "late", "duplicates", "stale", "restarts")}
+        sent = totals["frames"] + totals["lost"]
+        return {
+            "totals": dict(totals, loss_rate=totals["lost"] / sent if sent else 0.0),
+            "malformed": self.malformed,
+            "busy": self.busy,
+            "devices": {device_id: link.as_dict() for device_id, link in sorted(self.links.items())}
+        }
+
+
+class TelemetryProtocol(asyncio.DatagramProtocol):
+    """UDP endpoint handing each datagram to receive(data, transport_name)."""
+
+    def __init__(self, receive):
+        self.receive = receive
+
+    def datagram_received(self, data, addr):
+        self.receive(data, "udp")
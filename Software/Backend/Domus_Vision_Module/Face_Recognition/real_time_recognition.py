@@ -4,9 +4,9 @@ import pickle
 import time
 import sqlite3
 from datetime import datetime
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_socketio import SocketIO, emit
-from threading import Thread
+from threading import Condition, Thread
 from queue import Queue
 import os
 
@@ -39,6 +39,40 @@ def init_db():
 
 init_db()
 
+# ---------- Breach Events ---------- #
+
+# The newest breach is kept in memory, so /security-status and clients of
+# /security-events that are already up to date are answered without a query.
+# Breach ids only grow, so an id is also a sync cursor.
+SECURITY_EVENTS_DEFAULT_LIMIT = 100
+SECURITY_EVENTS_MAX_WAIT = 30
+
+breach_changed = Condition()
+last_breach = {"id": 0, "timestamp": None}
+
+def load_last_breach():
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute('SELECT id, timestamp FROM breach_events ORDER BY id DESC LIMIT 1').fetchone()
+    conn.close()
+    if row:
+        last_breach.update(id=row[0], timestamp=row[1])
+
+load_last_breach()
+
+def record_breach(timestamp):
+    """Store a breach event and wake clients waiting on /security-events."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO breach_events (timestamp) VALUES (?)
+    ''', (timestamp,))
+    breach_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    with breach_changed:
+        last_breach.update(id=breach_id, timestamp=timestamp)
+        breach_changed.notify_all()
+
 # ---------- Load Face Encoding ---------- #
 
 with open("face_encoding.pkl", "rb") as file:
@@ -94,13 +128,7 @@ def process_frames():
                         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     })
                     # Save to DB
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT INTO breach_events (timestamp) VALUES (?)
-                    ''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
-                    conn.commit()
-                    conn.close()
+                    record_breach(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
             # Skip OpenCV GUI calls in headless mode
             if not headless:
@@ -117,22 +145,64 @@ def process_frames():
 
 @app.route('/security-status', methods=['GET'])
 def get_security_status():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT timestamp FROM breach_events ORDER BY timestamp DESC LIMIT 1')
-    result = cursor.fetchone()
-    conn.close()
-
-    if result:
-        return jsonify({
+    with breach_changed:
+        breach_id, timestamp = last_breach["id"], last_breach["timestamp"]
+
+    # Tagged with the newest breach id, so an unchanged status is a bodiless 304
+    etag = str(breach_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif breach_id:
+        response = jsonify({
             "status": "Security Alert: Unknown face detected",
-            "timestamp": result[0]
+            "timestamp": timestamp
         })
     else:
-        return jsonify({
+        response = jsonify({
             "status": None,
             "timestamp": None
         })
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route('/security-events', methods=['GET'])
+def get_security_events():
+    """
+    Breach events after a cursor, oldest first.
+    Query: since (the cursor from an earlier answer, or 0 for all events;
+    without it, just the current cursor), limit (default 100), wait (seconds
+    to hold the request while nothing is new; default 0, at most 30).
+    Answers {"events": [{"id", "timestamp"}], "cursor", "more"}; 410 if the
+    cursor is ahead of the newest event (the database was reset).
+    """
+    try:
+        since = request.args.get('since')
+        since = int(since) if since else None
+        limit = max(int(request.args.get('limit', SECURITY_EVENTS_DEFAULT_LIMIT)), 1)
+        wait = min(max(float(request.args.get('wait', 0)), 0), SECURITY_EVENTS_MAX_WAIT)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    with breach_changed:
+        if since is not None and wait:
+            breach_changed.wait_for(lambda: last_breach["id"] != since, timeout=wait)
+        newest = last_breach["id"]
+    if since is None or since == newest:
+        return jsonify({"events": [], "cursor": newest, "more": False})
+    if since > newest:
+        return jsonify({"error": "Cursor is ahead of the newest event; resync from 0", "cursor": newest}), 410
+
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute('SELECT id, timestamp FROM breach_events WHERE id > ? ORDER BY id LIMIT ?',
+                        (since, limit)).fetchall()
+    conn.close()
+    cursor = rows[-1][0] if rows else newest
+    return jsonify({
+        "events": [{"id": row[0], "timestamp": row[1]} for row in rows],
+        "cursor": cursor,
+        "more": cursor < newest
+    })
 
 @app.route('/')
 def index():
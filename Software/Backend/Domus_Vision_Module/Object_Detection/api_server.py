@@ -1,25 +1,113 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
+import json
 import sqlite3
+import threading
+import time
 from flask_cors import CORS
 
 app = Flask(__name__)
-CORS(app, resources={r"/latest_detections": {"origins": "*"}})
+CORS(app, resources={r"/latest_detections": {"origins": "*"}, r"/detections": {"origins": "*"},
+                     r"/detector_stats": {"origins": "*"}})
 db_path = "/home/raspberrypi/Object_detection_project/detections.db"
+stats_path = "/home/raspberrypi/Object_detection_project/detector_stats.json"
+
+DETECTIONS_DEFAULT_LIMIT = 100
+DETECTIONS_MAX_WAIT = 30
+DETECTIONS_POLL_INTERVAL = 0.25  # Seconds between checks while a request waits for new detections
+
+# stream_receiver.py writes detections from another process, so this server
+# notices them through PRAGMA data_version on one long-lived connection: it
+# changes only when another connection has committed, and checking it reads
+# no table. The newest id is re-read only then, so clients that are up to
+# date are answered without a query.
+watch_lock = threading.Lock()
+watch_conn = None
+watch_version = None
+newest_id = 0
+
+def newest_detection_id():
+    """ Highest detection id, re-read only after the detector has committed """
+    global watch_conn, watch_version, newest_id
+    with watch_lock:
+        if watch_conn is None:
+            watch_conn = sqlite3.connect(db_path, check_same_thread=False)
+        version = watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != watch_version:
+            newest_id = watch_conn.execute("SELECT COALESCE(MAX(id), 0) FROM detections").fetchone()[0]
+            watch_version = version
+        return newest_id
 
 def get_latest_detection():
     """ Fetch the latest detected objects from the database """
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    cursor.execute("SELECT object_label, confidence, timestamp FROM detections ORDER BY timestamp DESC LIMIT 5")
+    cursor.execute("SELECT object_label, confidence, timestamp, id FROM detections ORDER BY timestamp DESC LIMIT 5")
+    data = cursor.fetchall()
+    conn.close()
+    return [{"label": row[0], "confidence": row[1], "timestamp": row[2], "id": row[3]} for row in data]
+
+def get_detections_since(since, limit):
+    """ Fetch detections with an id above since, oldest first """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, object_label, confidence, timestamp FROM detections WHERE id > ? ORDER BY id LIMIT ?",
+                   (since, limit))
     data = cursor.fetchall()
     conn.close()
-    return [{"label": row[0], "confidence": row[1], "timestamp": row[2]} for row in data]
+    return [{"id": row[0], "label": row[1], "confidence": row[2], "timestamp": row[3]} for row in data]
 
 @app.route('/latest_detections', methods=['GET'])
 def latest_detections():
-    """ API Endpoint to fetch latest detections """
-    detections = get_latest_detection()
-    return jsonify({"detections": detections})
+    """ API Endpoint to fetch latest detections, tagged with the newest id so unchanged results are a 304 """
+    etag = str(newest_detection_id())
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({"detections": get_latest_detection()})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route('/detections', methods=['GET'])
+def detections_since():
+    """
+    API Endpoint to sync detections: those after a cursor, oldest first.
+    Query: since (the cursor from an earlier answer, or 0 for all detections;
+    without it, just the current cursor), limit (default 100), wait (seconds
+    to hold the request while nothing is new; default 0, at most 30).
+    Answers {"detections", "cursor", "more"}; 410 if the cursor is ahead of
+    the newest detection (the database was reset).
+    """
+    try:
+        since = request.args.get('since')
+        since = int(since) if since else None
+        limit = max(int(request.args.get('limit', DETECTIONS_DEFAULT_LIMIT)), 1)
+        wait = min(max(float(request.args.get('wait', 0)), 0), DETECTIONS_MAX_WAIT)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    newest = newest_detection_id()
+    deadline = time.monotonic() + wait
+    while since is not None and newest == since and time.monotonic() < deadline:
+        time.sleep(DETECTIONS_POLL_INTERVAL)
+        newest = newest_detection_id()
+    if since is None or since == newest:
+        return jsonify({"detections": [], "cursor": newest, "more": False})
+    if since > newest:
+        return jsonify({"error": "Cursor is ahead of the newest detection; resync from 0", "cursor": newest}), 410
+
+    detections = get_detections_since(since, limit)
+    cursor = detections[-1]["id"] if detections else newest
+    return jsonify({"detections": detections, "cursor": cursor, "more": cursor < newest})
+
+@app.route('/detector_stats', methods=['GET'])
+def detector_stats():
+    """ API Endpoint for stream_receiver.py's latency and dropped-frame metrics over its last interval """
+    try:
+        with open(stats_path) as f:
+            return jsonify(json.load(f))
+    except (OSError, ValueError):
+        return jsonify({"error": "No detector stats yet; is stream_receiver.py running?"}), 404
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=8080, debug=True)
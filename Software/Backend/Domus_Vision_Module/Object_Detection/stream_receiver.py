@@ -1,5 +1,9 @@
 import cv2
+import json
 import numpy as np
+import os
+import threading
+import time
 import tflite_runtime.interpreter as tfl
 import sqlite3
 from datetime import datetime
@@ -15,14 +19,73 @@ interpreter.allocate_tensors()
 # Connect to SQLite Database
 db_path = "/home/raspberrypi/Object_detection_project/detections.db"
 
+# Latency and drop metrics, rewritten every STATS_INTERVAL seconds and served by api_server.py
+stats_path = "/home/raspberrypi/Object_detection_project/detector_stats.json"
+STATS_INTERVAL = 5
+
 # MJPEG stream URL from Pi 4
 stream_url = "http://domus-streamer.local:5000/video_feed"
 cap = cv2.VideoCapture(stream_url)
+cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Where the backend honours it; the capture thread below drains the rest
 
 if not cap.isOpened():
     print("ERROR: Could not open video stream.")
     exit()
 
+class LatestFrame:
+    """
+    Single-slot frame buffer between the capture thread and inference. The
+    capture thread overwrites the slot with every decoded frame, and inference
+    takes whatever is newest, so detections describe the room as it is now
+    rather than working through a backlog. Frames overwritten before inference
+    took them are counted as dropped.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.captured_at = None
+        self.captured = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.captured_at = time.monotonic()
+            self.captured += 1
+            self.condition.notify()
+
+    def take(self):
+        """ Wait for a frame newer than the last one taken; returns (frame, captured_at), or None once the stream has ended """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame is not None or self.closed)
+            if self.frame is None:
+                return None
+            frame, captured_at = self.frame, self.captured_at
+            self.frame = None
+            return frame, captured_at
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+latest_frame = LatestFrame()
+stop_capture = threading.Event()
+
+def capture_frames():
+    """ Read the stream as fast as it arrives, keeping only the newest frame """
+    while not stop_capture.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            print("ERROR: No frame received.")
+            latest_frame.close()
+            break
+        latest_frame.put(frame)
+
 def save_detection(label, confidence):
     """ Save detected object with timestamp into SQLite database """
     conn = sqlite3.connect(db_path)
@@ -56,15 +119,52 @@ def detect_objects(image):
 
     return boxes, class_ids, scores
 
+def report_stats(latencies, inference_times, captured, processed, dropped, seconds):
+    """ Print and save metrics for the last interval; latencies run from a frame's capture to its detections """
+    stats = {
+        "updated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "interval_seconds": round(seconds, 1),
+        "captured_fps": round(captured / seconds, 1),
+        "processed_fps": round(processed / seconds, 1),
+        "dropped": dropped,
+        "drop_rate": round(dropped / captured, 3) if captured else 0.0,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)) * 1000, 1),
+            "p95": round(float(np.percentile(latencies, 95)) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1)
+        },
+        "inference_ms": round(float(np.mean(inference_times)) * 1000, 1),
+        "totals": {"captured": latest_frame.captured, "dropped": latest_frame.dropped}
+    }
+    print(f"Detector: {stats['processed_fps']} of {stats['captured_fps']} fps processed, "
+          f"{stats['drop_rate']:.0%} dropped, latency p50 {stats['latency_ms']['p50']} ms, "
+          f"inference {stats['inference_ms']} ms")
+    try:
+        with open(stats_path + ".tmp", "w") as f:
+            json.dump(stats, f)
+        os.replace(stats_path + ".tmp", stats_path)
+    except OSError as e:
+        print("Could not save detector stats:", e)
+
 print("Streaming live video from MJPEG stream with Object Detection...")
+capture_thread = threading.Thread(target=capture_frames, daemon=True)
+capture_thread.start()
+
+latencies, inference_times = [], []
+window_start = time.monotonic()
+window_captured, window_dropped = 0, 0
 while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("ERROR: No frame received.")
+    taken = latest_frame.take()
+    if taken is None:
         break
+    frame, captured_at = taken
 
     # Run Object Detection
+    started = time.monotonic()
     boxes, class_ids, scores = detect_objects(frame)
+    finished = time.monotonic()
+    inference_times.append(finished - started)
+    latencies.append(finished - captured_at)
 
     # Draw bounding boxes & labels
     for i in range(len(scores)):
@@ -83,10 +183,20 @@ while True:
             cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), (0, 255, 0), 2)
             cv2.putText(frame, text, (xmin, ymin - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
+    if finished - window_start >= STATS_INTERVAL:
+        captured, dropped = latest_frame.captured, latest_frame.dropped
+        report_stats(latencies, inference_times, captured - window_captured, len(latencies),
+                     dropped - window_dropped, finished - window_start)
+        latencies, inference_times = [], []
+        window_start, window_captured, window_dropped = finished, captured, dropped
+
     cv2.imshow("Live Stream with Object Detection", frame)
 
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
+# Let the capture thread finish its read before the stream is released under it
+stop_capture.set()
+capture_thread.join(timeout=5)
 cap.release()
 cv2.destroyAllWindows()
@@ -14,8 +14,37 @@ const openai = new OpenAI({
 
 // API URLs
 const DETECTION_API = "http://domus-central.local:8080/latest_detections";
+const DETECTION_CHANGES_API = "http://domus-central.local:8080/detections";
 const SENSOR_API = "http://domus-central.local:5000/bme688-latest";
 const ENERGY_API = "http://domus-central.local:5050/energy"; // 
+
+// The last 5 detections, fetched once and then kept current by asking only
+// for detections after the newest one seen, which costs nothing when there
+// are none
+let recentDetections = null;
+let detectionCursor = null;
+
+async function getRecentDetections() {
+    if (recentDetections !== null) {
+        try {
+            const response = await axios.get(DETECTION_CHANGES_API, { params: { since: detectionCursor } });
+            if (!response.data.more) {
+                recentDetections = [...response.data.detections.reverse(), ...recentDetections].slice(0, 5);
+                detectionCursor = response.data.cursor;
+                return recentDetections;
+            }
+            // More new detections than one answer holds; fetching the latest 5 is cheaper
+        } catch (error) {
+            if (!error.response || error.response.status !== 410) throw error;
+            // The detection database was reset; start over from the latest detections
+        }
+    }
+    const response = await axios.get(DETECTION_API);
+    recentDetections = response.data.detections;
+    detectionCursor = Math.max(0, ...recentDetections.map(d => d.id));
+    return recentDetections;
+}
+
 io.on("connection", (socket) => {
     console.log("Client connected");
 
@@ -30,8 +59,7 @@ io.on("connection", (socket) => {
 
         try {
             // Fetch object detection data
-            const detectionResponse = await axios.get(DETECTION_API);
-            const detections = detectionResponse.data.detections;
+            const detections = await getRecentDetections();
 
             let detectionText = "Current camera view detections:\n";
             if (detections.length > 0) {
@@ -0,0 +1,90 @@
+"""
+Startup-time benchmark for the power plug service (Domus_PowerPlug/backend.py).
+
+Starts the backend as a subprocess several times and measures:
+  - bind:  time until GET / answers (the port is open and Flask is serving)
+  - ready: time until GET /ready answers 200 (store, plug list and
+           baselines are loaded and the scheduler is running)
+
+By default each run uses a fresh, empty data directory and a plug address
+that does not answer (192.0.2.1, TEST-NET-1). That is the worst case the
+service has to survive without delaying startup.
+
+Usage:
+    python powerplug_startup.py [--runs 5] [--port 5059] [--data-dir DIR] [--plug-ip IP]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Domus_PowerPlug", "backend.py")
+
+
+def wait_for(url, expect_ok, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200 or not expect_ok:
+                    return True
+        except urllib.error.HTTPError:
+            if not expect_ok:
+                return True  # Any HTTP answer means the port is bound
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def run_once(args, data_dir):
+    env = dict(os.environ, PORT=str(args.port), SMART_PLUG_IP=args.plug_ip, POWER_SNAPSHOT_INTERVAL="0")
+    env.pop("SMART_PLUGS", None)
+    base = f"http://127.0.0.1:{args.port}"
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(BACKEND)], cwd=data_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for(f"{base}/", expect_ok=False, timeout=args.timeout):
+            raise RuntimeError("backend never bound its port")
+        bound = time.perf_counter() - started
+        if not wait_for(f"{base}/ready", expect_ok=True, timeout=args.timeout):
+            raise RuntimeError("backend never became ready")
+        ready = time.perf_counter() - started
+        return bound, ready
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5059)
+    parser.add_argument("--data-dir", help="Directory holding energy_data.db etc. (default: a fresh temp dir per run)")
+    parser.add_argument("--plug-ip", default="192.0.2.1", help="Plug address; the default never answers")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    bind_times, ready_times = [], []
+    for run in range(args.runs):
+        if args.data_dir:
+            bound, ready = run_once(args, args.data_dir)
+        else:
+            with tempfile.TemporaryDirectory() as data_dir:
+                bound, ready = run_once(args, data_dir)
+        bind_times.append(bound)
+        ready_times.append(ready)
+        print(f"run {run + 1}: bind {bound * 1000:7.1f} ms   ready {ready * 1000:7.1f} ms")
+
+    print(f"median: bind {statistics.median(bind_times) * 1000:7.1f} ms   "
+          f"ready {statistics.median(ready_times) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Fleet load generator for the ESP32 sensor server (Domus_SensorHub/sensor_hub.py).
+
+Simulates --nodes sensor nodes posting concurrently, each under its own
+device_id, the way a large house or a small office would look to one Pi:
+  - environment nodes post a BME688 reading every --period seconds
+  - motion nodes post "motion detected"/"no motion" at random intervals
+    averaging --period seconds
+  - every node checks in every 30 seconds
+Each node sends one request at a time and is scheduled independently; a
+pool of --workers connections carries the requests.
+
+Afterwards the script reads back every node's latest values through
+/bme688-latest and /motion-latest?device_id=... and counts nodes whose
+state does not match what they last sent (allowing for the server's motion
+reset timer), which is how readings from one device overwriting another,
+or one sensor's reset clearing another's motion, would show up.
+
+By default the server is loaded in-process on a fresh database (like
+sensor_server_throughput.py). Pass --url to drive a running server instead.
+
+Usage:
+    python sensor_fleet.py [--nodes 500] [--motion-share 0.3] [--period 10] [--seconds 60] [--workers 64]
+    python sensor_fleet.py --url http://domus-central.local:5000 --seconds 300
+"""
+import argparse
+import contextlib
+import heapq
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from sensor_server_throughput import DEFAULT_SERVER, load_server, serve
+
+CHECKIN_PERIOD = 30
+MOTION_RESET_SECONDS = 3  # sensor_hub.py MOTION_HOLD_SECONDS: "no motion" this long after "motion detected"
+
+
+class Node:
+    def __init__(self, device_id, kind, period):
+        self.device_id = device_id
+        self.kind = kind
+        self.period = period
+        self.last_sent = None
+        self.last_sent_at = 0.0
+        self.motion = "no motion"
+        self.next_checkin = 0.0
+
+    def next_request(self, now):
+        if now >= self.next_checkin:
+            self.next_checkin = now + CHECKIN_PERIOD
+            return "/device-checkin", {"device_id": self.device_id}
+        if self.kind == "motion":
+            self.motion = "no motion" if self.motion == "motion detected" else "motion detected"
+            return "/motion-data", {"device_id": self.device_id, "motion": self.motion}
+        return "/bme688-data", {"device_id": self.device_id, "temperature": round(random.uniform(18, 26), 2),
+                                "humidity": round(random.uniform(30, 60), 2),
+                                "pressure": round(random.uniform(990, 1030), 2),
+                                "gas_resistance": round(random.uniform(5, 50), 2)}
+
+    def next_delay(self):
+        if self.kind == "motion":
+            return random.expovariate(1 / self.period)
+        return self.period
+
+
+class Fleet:
+    """Hands out due node requests to worker threads and reschedules each node when its request is done."""
+
+    def __init__(self, nodes, stop_at):
+        self.stop_at = stop_at
+        self.condition = threading.Condition()
+        # Spread first requests over one period so the nodes do not post in lockstep
+        started = time.perf_counter()
+        self.schedule = [(started + random.uniform(0, node.period), id(node), node) for node in nodes]
+        heapq.heapify(self.schedule)
+
+    def take(self):
+        """Block until a node is due; returns (node, lag in seconds) or None once the run is over."""
+        with self.condition:
+            while True:
+                now = time.perf_counter()
+                if now >= self.stop_at:
+                    self.condition.notify_all()
+                    return None
+                if self.schedule and self.schedule[0][0] <= now:
+                    due, _, node = heapq.heappop(self.schedule)
+                    return node, now - due
+                wait = (self.schedule[0][0] if self.schedule else self.stop_at) - now
+                self.condition.wait(min(wait, self.stop_at - now))
+
+    def done(self, node):
+        with self.condition:
+            heapq.heappush(self.schedule, (time.perf_counter() + node.next_delay(), id(node), node))
+            self.condition.notify()
+
+
+def worker(host, port, fleet, results):
+    latencies, lags, errors = [], [], 0
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    while True:
+        taken = fleet.take()
+        if taken is None:
+            break
+        node, lag = taken
+        path, payload = node.next_request(time.perf_counter())
+        started = time.perf_counter()
+        try:
+            conn.request("POST", path, body=json.dumps(payload), headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+            elif path != "/device-checkin":
+                node.last_sent, node.last_sent_at = payload, time.perf_counter()
+            if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+                conn.close()
+        except Exception:
+            errors += 1
+            conn.close()
+        latencies.append(time.perf_counter() - started)
+        lags.append(lag)
+        fleet.done(node)
+    results.append((latencies, lags, errors))
+
+
+def get_json(host, port, path):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def verify(host, port, nodes):
+    """Count nodes whose latest value on the server is not what they last sent."""
+    mismatches = 0
+    for node in nodes:
+        if node.last_sent is None:
+            continue
+        if node.kind == "motion":
+            expected = node.last_sent["motion"]
+            if expected == "motion detected":
+                age = time.perf_counter() - node.last_sent_at
+                if MOTION_RESET_SECONDS - 0.5 < age < MOTION_RESET_SECONDS + 1.5:
+                    continue  # The reset may or may not have run yet
+                if age >= MOTION_RESET_SECONDS + 1.5:
+                    expected = "no motion"
+            latest = get_json(host, port, f"/motion-latest?device_id={node.device_id}")
+            if latest.get("motion") != expected:
+                mismatches += 1
+        else:
+            latest = get_json(host, port, f"/bme688-latest?device_id={node.device_id}")
+            if latest.get("temperature") != node.last_sent["temperature"]:
+                mismatches += 1
+    return mismatches
+
+
+def run(args, host, port, nodes):
+    results = []
+    fleet = Fleet(nodes, time.perf_counter() + args.seconds)
+    threads = [threading.Thread(target=worker, args=(host, port, fleet, results)) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="sensor_hub.py or sensor_server.py to load in-process")
+    parser.add_argument("--url", help="Drive a running server instead, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--motion-share", type=float, default=0.3, help="Share of nodes that are motion sensors")
+    parser.add_argument("--period", type=float, default=10, help="Seconds between a node's readings")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--port", type=int, default=5097)
+    args = parser.parse_args()
+
+    motion_nodes = round(args.nodes * args.motion_share)
+    nodes = [Node(f"node-{index:04d}", "motion" if index < motion_nodes else "env", args.period)
+             for index in range(args.nodes)]
+    if args.url:
+        target = urlsplit(args.url)
+        results = run(args, target.hostname, target.port or 80, nodes)
+        time.sleep(1)
+        mismatches = verify(target.hostname, target.port or 80, nodes)
+        label = args.url
+    else:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        with tempfile.TemporaryDirectory() as data_dir, open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(devnull):
+            stop = serve(load_server(os.path.abspath(args.server), data_dir), args.port)
+            results = run(args, "127.0.0.1", args.port, nodes)
+            mismatches = verify("127.0.0.1", args.port, nodes)
+            stop()
+        label = os.path.abspath(args.server)
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    lags = sorted(lag for result in results for lag in result[1])
+    errors = sum(result[2] for result in results)
+    quantiles = statistics.quantiles(latencies, n=100)
+    lag_quantiles = statistics.quantiles(lags, n=100)
+    print(f"server:     {label}")
+    print(f"fleet:      {args.nodes} nodes ({motion_nodes} motion), one reading every ~{args.period:g}s each")
+    print(f"requests:   {len(latencies)} in {args.seconds:.0f}s ({len(latencies) / args.seconds:.0f} req/s), "
+          f"errors: {errors}")
+    print(f"latency:    p50 {quantiles[49] * 1000:.1f} ms   p95 {quantiles[94] * 1000:.1f} ms   "
+          f"p99 {quantiles[98] * 1000:.1f} ms")
+    print(f"send lag:   p50 {lag_quantiles[49] * 1000:.1f} ms   p99 {lag_quantiles[98] * 1000:.1f} ms "
+          f"(how late nodes got to send; grows when the server cannot keep up)")
+    print(f"read-back:  {mismatches} of {sum(node.last_sent is not None for node in nodes)} nodes "
+          f"do not see their last reading")
+
+
+if __name__ == "__main__":
+    main()
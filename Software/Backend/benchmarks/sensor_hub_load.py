@@ -0,0 +1,162 @@
+"""
+Ingest load test for the sensor hub (Domus_SensorHub/sensor_hub.py).
+
+Starts the hub as its own process on a fresh database, pinned to --cpus CPU
+cores to approximate a Raspberry Pi (cores only: a Pi core is also several
+times slower than a desktop one, so run it on the Pi itself, or against it
+with --url, for the real numbers). It then opens --connections keep-alive
+connections and sends --rate requests per second for --seconds: BME688
+readings, motion events and check-ins from --nodes devices, in the mix a
+fleet produces.
+
+The load is open-loop: request i is due at i / rate whatever happened to
+the earlier ones, and its latency counts from when it was due, so a server
+that falls behind shows up as latency instead of quietly lowering the rate.
+The script prints p50/p99/p99.9 ingest latency, the achieved rate, errors
+and the hub's CPU use.
+
+Usage:
+    python sensor_hub_load.py [--rate 1000] [--seconds 30] [--connections 1000] [--cpus 1] [--nodes 200]
+    python sensor_hub_load.py --url http://domus-central.local:5000 --rate 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+HUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Domus_SensorHub", "sensor_hub.py")
+
+
+def request_for(index, nodes):
+    """(path, payload) of request index: 70% BME688 readings, 20% motion events, 10% check-ins."""
+    device_id = f"node-{index % nodes:04d}"
+    kind = index % 10
+    if kind < 7:
+        return "/bme688-data", {"device_id": device_id, "temperature": round(random.uniform(18, 26), 2),
+                                "humidity": round(random.uniform(30, 60), 2),
+                                "pressure": round(random.uniform(990, 1030), 2),
+                                "gas_resistance": round(random.uniform(5, 50), 2)}
+    if kind < 9:
+        return "/motion-data", {"device_id": device_id, "motion": random.choice(["motion detected", "no motion"])}
+    return "/device-checkin", {"device_id": device_id}
+
+
+async def send(session, url, path, payload, due, results):
+    try:
+        async with session.post(url + path, json=payload) as response:
+            await response.read()
+            ok = response.status < 400
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        ok = False
+    results.append((time.perf_counter() - due, ok))
+
+
+async def drive(url, args):
+    connector = aiohttp.TCPConnector(limit=args.connections, keepalive_timeout=args.seconds + 60)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+        # Open every connection up front, so the run holds --connections keep-alive connections
+        await asyncio.gather(*(send(session, url, "/device-checkin", {"device_id": f"warmup-{index}"},
+                                    time.perf_counter(), []) for index in range(args.connections)))
+
+        results, tasks = [], []
+        started = time.perf_counter()
+        for index in range(int(args.rate * args.seconds)):
+            due = started + index / args.rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            path, payload = request_for(index, args.nodes)
+            tasks.append(asyncio.create_task(send(session, url, path, payload, due, results)))
+        await asyncio.gather(*tasks)
+        return results, time.perf_counter() - started
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process so far, from /proc."""
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def wait_until_up(url, hub, seconds=15):
+    deadline = time.monotonic() + seconds
+
+    async def probe():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url + "/devices") as response:
+                return response.status == 200
+
+    while time.monotonic() < deadline:
+        if hub is not None and hub.poll() is not None:
+            sys.exit(f"sensor_hub.py exited with status {hub.returncode}")
+        try:
+            if asyncio.run(probe()):
+                return
+        except aiohttp.ClientError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"No answer from {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Load a running hub instead, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--hub", default=HUB, help="sensor_hub.py to start")
+    parser.add_argument("--rate", type=float, default=1000, help="Requests per second")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--connections", type=int, default=1000, help="Keep-alive connections to hold open")
+    parser.add_argument("--nodes", type=int, default=200, help="Devices the requests come from")
+    parser.add_argument("--cpus", type=int, default=1, help="CPU cores to pin the started hub to")
+    parser.add_argument("--port", type=int, default=5095)
+    args = parser.parse_args()
+
+    # Each connection is a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        hub = None
+        url = args.url
+        if url is None:
+            cpus = set(sorted(os.sched_getaffinity(0))[:args.cpus])
+            hub = subprocess.Popen([sys.executable, os.path.abspath(args.hub), "--host", "127.0.0.1",
+                                    "--port", str(args.port)], cwd=data_dir, stdout=subprocess.DEVNULL,
+                                   preexec_fn=lambda: os.sched_setaffinity(0, cpus))
+            # Keep this script's own work off the hub's cores where there are others
+            others = os.sched_getaffinity(0) - cpus
+            if others:
+                os.sched_setaffinity(0, others)
+            url = f"http://127.0.0.1:{args.port}"
+        try:
+            wait_until_up(url, hub)
+            cpu_before = cpu_seconds(hub.pid) if hub else None
+            results, elapsed = asyncio.run(drive(url, args))
+            cpu_used = cpu_seconds(hub.pid) - cpu_before if hub else None
+        finally:
+            if hub is not None:
+                hub.terminate()
+                hub.wait(timeout=30)
+
+    latencies = sorted(latency for latency, ok in results)
+    errors = sum(not ok for latency, ok in results)
+    quantiles = statistics.quantiles(latencies, n=1000)
+    print(f"hub:         {url if args.url else os.path.abspath(args.hub) + f' on {args.cpus} CPU core(s)'}")
+    print(f"load:        {args.rate:g} req/s for {args.seconds:g}s over {args.connections} keep-alive connections "
+          f"from {args.nodes} devices")
+    print(f"achieved:    {len(results) / elapsed:.0f} req/s, errors: {errors}")
+    print(f"latency:     p50 {quantiles[499] * 1000:.1f} ms   p99 {quantiles[989] * 1000:.1f} ms   "
+          f"p99.9 {quantiles[998] * 1000:.1f} ms   max {latencies[-1] * 1000:.1f} ms")
+    if cpu_used is not None:
+        print(f"hub CPU:     {cpu_used / elapsed:.0%} of one core")
+
+
+if __name__ == "__main__":
+    main()
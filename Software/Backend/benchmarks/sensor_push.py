@@ -0,0 +1,164 @@
+"""
+Push latency benchmark for the sensor server's live updates
+(Domus_SensorHub/sensor_hub.py).
+
+Loads the server on a fresh database (like sensor_server_throughput.py)
+and connects --sse clients to /stream and --socketio Socket.IO clients, all
+listening for bme688 events. One node then posts --readings BME688 readings,
+--rate per second, each with a unique temperature, and the script measures
+the time from starting each POST to every client receiving that reading.
+
+It also counts the SQL statements the server runs while all clients stay
+connected with no readings arriving for --idle seconds, which should be 0.
+
+Usage:
+    python sensor_push.py [--sse 50] [--socketio 10] [--transport websocket] [--readings 200] [--rate 20] [--idle 5]
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import socketio
+
+from sensor_server_throughput import DEFAULT_SERVER, load_server, serve
+
+
+class Receipts:
+    """Arrival times of each reading (keyed by its temperature) at each client, per transport."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrivals = {"SSE": {}, "Socket.IO": {}}  # transport -> temperature -> [perf_counter at each client]
+
+    def record(self, transport, reading):
+        received = time.perf_counter()
+        with self.lock:
+            self.arrivals[transport].setdefault(reading["temperature"], []).append(received)
+
+
+def sse_client(port, receipts, connected, stop):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", "/stream?events=bme688")
+    response = conn.getresponse()
+    connected.release()
+    event = None
+    while not stop.is_set():
+        line = response.readline()
+        if not line:
+            break
+        line = line.decode().rstrip("\n")
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: ") and event == "bme688":
+            receipts.record("SSE", json.loads(line[6:]))
+    conn.close()
+
+
+def socketio_client(port, receipts, connected, transport):
+    client = socketio.Client()
+    client.on("bme688", lambda reading: receipts.record("Socket.IO", reading))
+    client.connect(f"http://127.0.0.1:{port}?events=bme688", transports=[transport])
+    connected.release()
+    return client
+
+
+def count_statements(module):
+    """Make every connection the server opens from now on count its SQL statements."""
+    counter = {"statements": 0}
+    open_connection = module.open_connection
+
+    def counting_connection():
+        conn = open_connection()
+        conn.set_trace_callback(lambda statement: counter.__setitem__("statements", counter["statements"] + 1))
+        return conn
+
+    module.open_connection = counting_connection
+    for conn in [module.writer_conn, *list(module.read_pool.queue)]:
+        if conn is not None:
+            conn.set_trace_callback(lambda statement: counter.__setitem__("statements", counter["statements"] + 1))
+    return counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="sensor_hub.py or sensor_server.py to benchmark")
+    parser.add_argument("--sse", type=int, default=50, help="Server-sent event clients")
+    parser.add_argument("--socketio", type=int, default=10, help="Socket.IO clients")
+    parser.add_argument("--transport", choices=("websocket", "polling"), default="websocket",
+                        help="Socket.IO transport (websocket needs the websocket-client package)")
+    parser.add_argument("--readings", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="Readings posted per second")
+    parser.add_argument("--idle", type=float, default=5, help="Seconds to watch connected clients with no traffic")
+    parser.add_argument("--port", type=int, default=5096)
+    args = parser.parse_args()
+
+    server_path = os.path.abspath(args.server)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    receipts = Receipts()
+    clients = args.sse + args.socketio
+    with tempfile.TemporaryDirectory() as data_dir, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        module = load_server(server_path, data_dir)
+        stop_server = serve(module, args.port)
+
+        stop = threading.Event()
+        connected = threading.Semaphore(0)
+        for _ in range(args.sse):
+            threading.Thread(target=sse_client, args=(args.port, receipts, connected, stop), daemon=True).start()
+        socketio_clients = [socketio_client(args.port, receipts, connected, args.transport) for _ in range(args.socketio)]
+        for _ in range(clients):
+            connected.acquire()
+        time.sleep(0.5)
+
+        counter = count_statements(getattr(module, "store", module))  # The hub's database code is sensor_store
+        idle_started = time.process_time()
+        time.sleep(args.idle)
+        idle_cpu = time.process_time() - idle_started
+        idle_statements = counter["statements"]
+
+        sent = {}
+        conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=10)
+        next_at = time.perf_counter()
+        for index in range(args.readings):
+            temperature = 20 + index / 1000
+            next_at += 1 / args.rate
+            sent[temperature] = time.perf_counter()
+            conn.request("POST", "/bme688-data", headers={"Content-Type": "application/json"}, body=json.dumps(
+                {"device_id": "bench-node", "temperature": temperature, "humidity": 40.0,
+                 "pressure": 1010.0, "gas_resistance": 12.5}))
+            conn.getresponse().read()
+            time.sleep(max(next_at - time.perf_counter(), 0))
+        time.sleep(1)
+
+        stop.set()
+        for client in socketio_clients:
+            client.disconnect()
+        stop_server()
+
+    print(f"server:     {server_path}")
+    print(f"clients:    {args.sse} SSE + {args.socketio} Socket.IO, {args.readings} readings at {args.rate:g}/s")
+    for transport, count in (("SSE", args.sse), ("Socket.IO", args.socketio)):
+        with receipts.lock:
+            latencies = sorted(arrival - sent[temperature]
+                               for temperature, arrivals in receipts.arrivals[transport].items()
+                               if temperature in sent for arrival in arrivals)
+        if len(latencies) < 2:
+            continue
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{transport + ':':<11} delivered {len(latencies)} of {args.readings * count}   "
+              f"p50 {quantiles[49] * 1000:.1f} ms   p95 {quantiles[94] * 1000:.1f} ms   "
+              f"p99 {quantiles[98] * 1000:.1f} ms   max {latencies[-1] * 1000:.1f} ms")
+    print("            (a client that falls behind is sent only the newest reading, so may see fewer)")
+    print(f"idle:       {idle_statements} SQL statements, {idle_cpu * 1000:.1f} ms CPU in {args.idle:g}s "
+          f"with {clients} clients connected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Steady-state simulation of the sensor hub's retention
+(Domus_SensorHub/sensor_store.py).
+
+Loads sensor_store.py on a fresh database and replays --days of
+simulated time, one day at a time: each day --devices nodes store a BME688
+reading every --interval seconds and a motion event every minute (through
+the same INSERTs as the hub, so the rollup trigger runs), then the
+hub's run_retention() is applied as of the end of that day. The script
+prints the rows deleted and the database size after each day; once the
+longest policy's window has passed, the size should stop growing.
+
+Usage:
+    python sensor_retention.py [--store PATH] [--days 45] [--devices 2] [--interval 10]
+"""
+import argparse
+import contextlib
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+
+def load_store(path, data_dir):
+    os.chdir(data_dir)  # DATABASE is a relative path
+    sys.path.insert(0, os.path.dirname(path))  # sensor_store imports sensor_types
+    spec = importlib.util.spec_from_file_location("sensor_store_under_test", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.init_db()
+    module.RETENTION_PAUSE = 0
+    return module
+
+
+def store_day(module, keys, day_start_ms, interval):
+    batch = []
+    for key in keys:
+        for offset in range(0, 86400, interval):
+            batch.append(('''
+                INSERT OR IGNORE INTO BME688Readings (device_key, ts_ms, temperature, humidity, pressure, gas_resistance)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, day_start_ms + offset * 1000, 21.5 + (offset % 600) / 100, 40.0, 1010.0, 12.5)))
+        for offset in range(0, 86400, 60):
+            batch.append(('''
+                INSERT OR IGNORE INTO MotionEvents (device_key, ts_ms, motion)
+                VALUES (?, ?, ?)
+            ''', (key, day_start_ms + offset * 1000, offset // 60 % 2)))
+    module.write_many(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                                        "Domus_SensorHub", "sensor_store.py"))
+    parser.add_argument("--days", type=int, default=45)
+    parser.add_argument("--devices", type=int, default=2)
+    parser.add_argument("--interval", type=int, default=10, help="Seconds between BME688 readings")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        module = load_store(os.path.abspath(args.store), data_dir)
+        keys = [module.device_key(f"node-{index}") for index in range(args.devices)]
+        print({table: days for table, (column, days) in module.retention_policies.items()})
+        print(" day   stored   deleted   retention s   database MB")
+
+        day_ms = 86400 * 1000
+        first_day = (int(time.time() * 1000) // day_ms - args.days) * day_ms
+        for day in range(args.days):
+            day_start = first_day + day * day_ms
+            store_day(module, keys, day_start, args.interval)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                stats = module.run_retention(now=day_start + day_ms)
+            stored = args.devices * (86400 // args.interval + 1440)
+            print(f"{day + 1:4d} {stored:8d} {sum(stats['deleted'].values()):9d} {stats['seconds']:13.2f} "
+                  f"{stats['bytes_after'] / 2 ** 20:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
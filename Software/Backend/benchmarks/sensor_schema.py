@@ -0,0 +1,155 @@
+"""
+Storage and range-scan benchmark for the sensor hub schema
+(Domus_SensorHub/sensor_store.py).
+
+Builds a database in the legacy layout (text timestamps, text motion, with
+the timestamp indexes) holding --days of BME688 readings every --interval
+seconds plus motion events. It then migrates a copy with the hub's own
+`migrate` tool, and compares:
+  - file size (the migrated file includes the rollup tables)
+  - time to read 1-day and 30-day windows of BME688 readings ("fetch"), and
+    to aggregate them in SQL ("aggregate", which leaves out Python's
+    per-row cost and shows the storage access alone)
+  - time to fetch the newest reading
+  - time to read a 30-day chart from the hourly rollup instead of raw rows
+
+Usage:
+    python sensor_schema.py [--store PATH] [--days 365] [--interval 10] [--queries 20]
+"""
+import argparse
+import contextlib
+import importlib.util
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Domus_SensorHub", "sensor_store.py")
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def build_legacy(path, days, interval):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE BME688Data (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, temperature REAL,
+                                 humidity REAL, pressure REAL, gas_resistance REAL);
+        CREATE TABLE MotionData (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, motion TEXT);
+        CREATE TABLE devices (device_id TEXT PRIMARY KEY, ip TEXT, last_seen REAL);
+        CREATE INDEX idx_bme688_timestamp ON BME688Data (timestamp);
+        CREATE INDEX idx_motion_timestamp ON MotionData (timestamp);
+    """)
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days)
+    count = days * 86400 // interval
+
+    def readings():
+        for i in range(count):
+            yield ((start + timedelta(seconds=i * interval)).strftime(FORMAT), round(random.uniform(18, 26), 2),
+                   round(random.uniform(30, 60), 2), round(random.uniform(990, 1030), 2), round(random.uniform(5, 50), 2))
+
+    def events():
+        for i in range(0, count, 6):
+            when = start + timedelta(seconds=i * interval)
+            yield when.strftime(FORMAT), "motion detected"
+            yield (when + timedelta(seconds=3)).strftime(FORMAT), "no motion"
+
+    with conn:
+        conn.executemany("INSERT INTO BME688Data (timestamp, temperature, humidity, pressure, gas_resistance) "
+                         "VALUES (?, ?, ?, ?, ?)", readings())
+        conn.executemany("INSERT INTO MotionData (timestamp, motion) VALUES (?, ?)", events())
+    conn.close()
+    return start, count
+
+
+def time_queries(conn, query, windows, to_params):
+    durations = []
+    for begin, end in windows:
+        started = time.perf_counter()
+        conn.execute(query, to_params(begin, end)).fetchall()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default=DEFAULT_STORE, help="sensor_store.py whose migration to use")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--interval", type=int, default=10, help="Seconds between BME688 readings")
+    parser.add_argument("--queries", type=int, default=20, help="Range queries per window size")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.store)))  # sensor_store imports sensor_types
+    spec = importlib.util.spec_from_file_location("sensor_store_under_test", os.path.abspath(args.store))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.MIGRATION_PAUSE = 0
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        legacy_path = os.path.join(data_dir, "legacy.db")
+        compact_path = os.path.join(data_dir, "compact.db")
+        print(f"Building {args.days} days of readings every {args.interval}s ...")
+        start, count = build_legacy(legacy_path, args.days, args.interval)
+        shutil.copy(legacy_path, compact_path)
+
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            module.migrate_offline(compact_path)
+        migrate_seconds = time.perf_counter() - started
+
+        legacy = sqlite3.connect(legacy_path)
+        compact = sqlite3.connect(compact_path)
+        key = compact.execute("SELECT device_key FROM DeviceKeys WHERE device_id = ?", (module.DEFAULT_DEVICE,)).fetchone()[0]
+        span = timedelta(days=args.days)
+
+        print(f"rows:            {count} BME688 readings")
+        print(f"migration:       {migrate_seconds:.1f} s (offline, including VACUUM)")
+        print(f"size:            legacy {os.path.getsize(legacy_path) / 2 ** 20:7.1f} MB   "
+              f"compact {os.path.getsize(compact_path) / 2 ** 20:7.1f} MB")
+
+        for window_days in (1, 30):
+            window = timedelta(days=window_days)
+            windows = []
+            for _ in range(args.queries):
+                begin = start + (span - window) * random.random()
+                windows.append((begin, begin + window))
+            for label, columns in (("fetch", "{time}, temperature, humidity, pressure, gas_resistance"),
+                                   ("aggregate", "count(*), avg(temperature), max(humidity), min(pressure)")):
+                legacy_time = time_queries(
+                    legacy, f"SELECT {columns.format(time='timestamp')} FROM BME688Data "
+                            "WHERE timestamp >= ? AND timestamp < ?",
+                    windows, lambda begin, end: (begin.strftime(FORMAT), end.strftime(FORMAT)))
+                compact_time = time_queries(
+                    compact, f"SELECT {columns.format(time='ts_ms')} FROM BME688Readings "
+                             "WHERE device_key = ? AND ts_ms >= ? AND ts_ms < ?",
+                    windows, lambda begin, end: (key, int(begin.timestamp() * 1000), int(end.timestamp() * 1000)))
+                print(f"{window_days:>2}-day {label + ':':<10} legacy {legacy_time * 1000:8.1f} ms   "
+                      f"compact {compact_time * 1000:8.1f} ms")
+
+        window = timedelta(days=min(30, args.days))
+        windows = [(start + span - window, start + span)] * args.queries
+        to_ms = lambda begin, end: (key, int(begin.timestamp() * 1000), int(end.timestamp() * 1000))
+        raw_time = time_queries(compact, "SELECT * FROM BME688Readings WHERE device_key = ? AND ts_ms >= ? AND ts_ms < ?",
+                                windows, to_ms)
+        rollup_time = time_queries(compact, "SELECT * FROM BME688Hourly WHERE device_key = ? AND bucket_ms >= ? "
+                                            "AND bucket_ms < ?", windows, to_ms)
+        rollup_rows = len(compact.execute("SELECT * FROM BME688Hourly WHERE device_key = ? AND bucket_ms >= ? "
+                                          "AND bucket_ms < ?", to_ms(*windows[0])).fetchall())
+        print(f"30-day chart:    raw {raw_time * 1000:8.1f} ms   hourly rollup {rollup_time * 1000:6.1f} ms "
+              f"({rollup_rows} rows)")
+
+        latest = [(datetime.min, datetime.max)] * args.queries
+        legacy_time = time_queries(legacy, "SELECT * FROM BME688Data ORDER BY timestamp DESC LIMIT 1",
+                                   latest, lambda begin, end: ())
+        compact_time = time_queries(compact, "SELECT * FROM BME688Readings WHERE device_key = ? "
+                                             "ORDER BY ts_ms DESC LIMIT 1", latest, lambda begin, end: (key,))
+        print(f"latest:          legacy {legacy_time * 1e6:8.1f} us   compact {compact_time * 1e6:8.1f} us")
+        legacy.close()
+        compact.close()
+
+
+if __name__ == "__main__":
+    main()
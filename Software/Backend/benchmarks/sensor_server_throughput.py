@@ -0,0 +1,157 @@
+"""
+Throughput benchmark for the ESP32 sensor server (Domus_SensorHub/sensor_hub.py).
+
+Loads the server, points it at a fresh database in a temp dir and serves it
+in-process: the hub on its own event loop, or an older Flask sensor_server.py
+with a threaded Werkzeug server (like app.run). Worker threads then send a
+mix of sensor POSTs and latest-value GETs for a fixed time, and the script
+prints requests/sec, latency percentiles and error counts.
+
+Compare against the Flask server it replaced by benchmarking each file, e.g.:
+    git show <commit>:Software/Backend/Domus_EnvironSensor/sensor_server.py > /tmp/sensor_server_old.py
+    python sensor_server_throughput.py --server /tmp/sensor_server_old.py
+    python sensor_server_throughput.py
+
+Usage:
+    python sensor_server_throughput.py [--server PATH] [--workers 16] [--seconds 10] [--read-ratio 0.3]
+"""
+import argparse
+import asyncio
+import contextlib
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+from werkzeug.serving import make_server
+
+DEFAULT_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Domus_SensorHub", "sensor_hub.py")
+
+WRITES = [
+    ("/bme688-data", lambda: {"temperature": round(random.uniform(18, 26), 2), "humidity": round(random.uniform(30, 60), 2),
+                              "pressure": round(random.uniform(990, 1030), 2), "gas_resistance": round(random.uniform(5, 50), 2)}),
+    ("/motion-data", lambda: {"motion": random.choice(["motion detected", "no motion"])}),
+    ("/device-checkin", lambda: {"device_id": f"esp32-{random.randint(1, 20)}"}),
+]
+READS = ["/bme688-latest", "/motion-latest", "/devices"]
+
+
+def load_server(path, data_dir):
+    os.chdir(data_dir)  # DATABASE is a relative path
+    sys.path.insert(0, os.path.dirname(path))  # The hub imports its sibling modules
+    spec = importlib.util.spec_from_file_location("sensor_server_under_test", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if hasattr(module, "create_app"):
+        return module  # The hub opens its database and starts its writer when served
+    module.init_db()
+    if hasattr(module, "load_latest_values"):
+        module.load_latest_values()
+    if hasattr(module, "start_writer"):
+        module.start_writer()
+    if hasattr(module, "reset_motion_status"):
+        threading.Thread(target=module.reset_motion_status, daemon=True).start()
+    return module
+
+
+def serve(module, port):
+    """Serve a loaded server on 127.0.0.1:port from a background thread; returns a function that stops it."""
+    if not hasattr(module, "create_app"):
+        server = make_server("127.0.0.1", port, module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def stop():
+            server.shutdown()
+            if hasattr(module, "stop_writer"):
+                module.stop_writer()
+        return stop
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(module.create_app(), access_log=None)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port, backlog=1024).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def shutdown():
+        await runner.cleanup()
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()  # e.g. Socket.IO pings of clients that did not disconnect
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    return stop
+
+
+def worker(port, stop_at, read_ratio, results):
+    latencies, errors = [], 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        try:
+            if random.random() < read_ratio:
+                conn.request("GET", random.choice(READS))
+            else:
+                path, payload = random.choice(WRITES)
+                conn.request("POST", path, body=json.dumps(payload()), headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+            if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+                conn.close()
+        except Exception:
+            errors += 1
+            conn.close()
+        latencies.append(time.perf_counter() - started)
+    results.append((latencies, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="sensor_hub.py or sensor_server.py to benchmark")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--read-ratio", type=float, default=0.3, help="Share of requests that are GETs")
+    parser.add_argument("--port", type=int, default=5098)
+    args = parser.parse_args()
+
+    server_path = os.path.abspath(args.server)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # The Flask servers print every reading; keep that out of the report
+    with tempfile.TemporaryDirectory() as data_dir, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        stop = serve(load_server(server_path, data_dir), args.port)
+
+        results = []
+        stop_at = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=worker, args=(args.port, stop_at, args.read_ratio, results))
+                   for _ in range(args.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop()
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"server:   {server_path}")
+    print(f"requests: {len(latencies)} in {args.seconds:.0f}s with {args.workers} workers "
+          f"({args.read_ratio:.0%} reads), errors: {errors}")
+    print(f"rate:     {len(latencies) / args.seconds:.0f} req/s")
+    print(f"latency:  p50 {quantiles[49] * 1000:.1f} ms   p95 {quantiles[94] * 1000:.1f} ms   "
+          f"p99 {quantiles[98] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Node simulator for the sensor hub's binary telemetry (Domus_SensorHub/telemetry.py).
+
+Simulates --nodes sensor nodes sending readings to the hub: environment
+nodes a BME688 reading every --period seconds and motion nodes their state
+every --motion-period seconds (sub-second reporting). With --transport udp
+(default) or websocket they send telemetry frames, each node with its own
+session and sequence numbers, --batch readings per frame; --loss drops that
+share of frames before sending, to exercise the hub's loss accounting. With
+--transport http the same readings go out as JSON requests on a new
+connection each, the way the ESP32 firmware sends them, for comparison.
+
+Afterwards the script compares the hub's /telemetry counters with what the
+nodes sent and dropped, reads every node's latest value back through
+/<type>-latest?device_id=..., and prints the bytes sent and the hub's CPU
+time per reading.
+
+By default it starts the hub on a fresh database, pinned to --cpus cores
+(like sensor_hub_load.py). Pass --url and --udp to drive a running hub.
+
+Usage:
+    python telemetry_nodes.py [--nodes 200] [--seconds 20] [--transport udp|websocket|http] [--loss 0.05] [--batch 1]
+    python telemetry_nodes.py --url http://domus-central.local:5000 --udp domus-central.local:5001
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from sensor_fleet import MOTION_RESET_SECONDS
+from sensor_hub_load import HUB, cpu_seconds, wait_until_up
+
+sys.path.insert(0, os.path.dirname(HUB))
+from sensor_types import BME688, MOTION, MOTION_NAMES  # noqa: E402
+from telemetry import encode_frame  # noqa: E402
+
+
+class Node:
+    def __init__(self, device_id, sensor_type, period):
+        self.device_id = device_id
+        self.sensor_type = sensor_type
+        self.period = period
+        self.session = random.randrange(1 << 16)
+        self.sequence = 0
+        self.buffer = []  # (monotonic time taken, values) not sent yet
+        self.frames = 0
+        self.sent = 0
+        self.dropped = 0
+        self.dropped_since_sent = 0
+        self.lost = 0  # Dropped frames between two sent ones, which the hub can count
+        self.bytes = 0
+        self.readings = 0
+        self.last_sent = None
+        self.last_sent_at = None
+        self.ws = None
+
+    def take_reading(self):
+        if self.sensor_type is MOTION:
+            return (random.choice((0, 1)),)
+        return (round(random.uniform(18, 26), 2), round(random.uniform(30, 60), 2),
+                round(random.uniform(990, 1030), 2), round(random.uniform(5, 50), 2))
+
+
+def json_reading(node, values, age_ms=None):
+    if node.sensor_type is MOTION:
+        reading = {"motion": MOTION_NAMES[values[0]]}
+    else:
+        reading = dict(zip(BME688.fields, values))
+    if age_ms is not None:
+        reading["age"] = age_ms / 1000
+    return reading
+
+
+async def send_http(session, url, node, readings):
+    name = node.sensor_type.name
+    if len(readings) == 1:
+        path, body = f"/{name}-data", dict(json_reading(node, readings[0][1]), device_id=node.device_id)
+    else:
+        path, body = f"/{name}-data/batch", {"device_id": node.device_id,
+                                             "readings": [json_reading(node, values, age_ms)
+                                                          for age_ms, values in readings]}
+    payload = json.dumps(body).encode()
+    async with session.post(url + path, data=payload, headers={"Content-Type": "application/json"}) as response:
+        await response.read()
+    # Request line, headers and body as the firmware's HTTPClient sends them, give or take
+    return len(payload) + 150
+
+
+async def run_node(node, args, url, session, udp, stop_at):
+    if args.transport == "websocket":
+        node.ws = await session.ws_connect(url + "/telemetry/ws")
+    await asyncio.sleep(random.uniform(0, node.period))
+    while time.monotonic() < stop_at:
+        node.buffer.append((time.monotonic(), node.take_reading()))
+        if len(node.buffer) >= args.batch:
+            now = time.monotonic()
+            readings = [(int((now - taken) * 1000), values) for taken, values in node.buffer]
+            node.buffer = []
+            if args.transport == "http":
+                node.bytes += await send_http(session, url, node, readings)
+            else:
+                frame = encode_frame(node.sensor_type, node.device_id, node.session, node.sequence, readings)
+                node.sequence += 1
+                node.frames += 1
+                if random.random() < args.loss:
+                    node.dropped += 1
+                    node.dropped_since_sent += 1
+                    await asyncio.sleep(node.period)
+                    continue
+                if args.transport == "udp":
+                    udp[0].sendto(frame, udp[1])
+                else:
+                    await node.ws.send_bytes(frame)
+                node.bytes += len(frame)
+                if node.sent:
+                    node.lost += node.dropped_since_sent
+                node.dropped_since_sent = 0
+                node.sent += 1
+            node.readings += len(readings)
+            node.last_sent = readings[-1][1]
+            node.last_sent_at = time.monotonic()
+        await asyncio.sleep(node.period)
+    if node.ws is not None:
+        await node.ws.close()
+
+
+def matches(node, latest):
+    if node.sensor_type is MOTION:
+        if latest.get("motion") == "no motion" and node.last_sent[0] == 1:
+            # The hub's reset timer may have ended a hold from the node's last frame
+            return time.monotonic() - node.last_sent_at > MOTION_RESET_SECONDS - 0.5
+        return latest.get("motion") == MOTION_NAMES[node.last_sent[0]]
+    # Frames carry float32, so compare to within its precision
+    return all(latest.get(field) is not None and abs(latest[field] - value) < 1e-3 * max(abs(value), 1)
+               for field, value in zip(BME688.fields, node.last_sent))
+
+
+async def simulate(args, url, udp_address, hub_pid):
+    motion_nodes = round(args.nodes * args.motion_share)
+    nodes = [Node(f"sim-{index:04d}", MOTION if index < motion_nodes else BME688,
+                  args.motion_period if index < motion_nodes else args.period)
+             for index in range(args.nodes)]
+    udp = (socket.socket(socket.AF_INET, socket.SOCK_DGRAM), udp_address)
+    # A new connection per request over HTTP, like the firmware; otherwise one connection per node
+    connector = aiohttp.TCPConnector(limit=0, force_close=args.transport == "http")
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+        cpu_before = cpu_seconds(hub_pid) if hub_pid else None
+        stop_at = time.monotonic() + args.seconds
+        await asyncio.gather(*(run_node(node, args, url, session, udp, stop_at) for node in nodes))
+        await asyncio.sleep(1)  # Let the hub drain its socket buffer
+        cpu_used = cpu_seconds(hub_pid) - cpu_before if hub_pid else None
+
+        async with session.get(url + "/telemetry") as response:
+            telemetry = await response.json()
+        mismatches = 0
+        for node in nodes:
+            if node.last_sent is None:
+                continue
+            async with session.get(f"{url}/{node.sensor_type.name}-latest",
+                                   params={"device_id": node.device_id}) as response:
+                if not matches(node, await response.json()):
+                    mismatches += 1
+    udp[0].close()
+    return nodes, telemetry, mismatches, cpu_used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Drive a running hub instead, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--udp", help="host:port of the running hub's telemetry listener (with --url)")
+    parser.add_argument("--hub", default=HUB, help="sensor_hub.py to start")
+    parser.add_argument("--transport", choices=("udp", "websocket", "http"), default="udp")
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--motion-share", type=float, default=0.3, help="Share of nodes that are motion sensors")
+    parser.add_argument("--period", type=float, default=1, help="Seconds between a BME688 node's readings")
+    parser.add_argument("--motion-period", type=float, default=0.5, help="Seconds between a motion node's readings")
+    parser.add_argument("--batch", type=int, default=1, help="Readings per frame (or per batch upload over HTTP)")
+    parser.add_argument("--loss", type=float, default=0.05, help="Share of frames dropped instead of sent")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--cpus", type=int, default=1, help="CPU cores to pin the started hub to")
+    parser.add_argument("--port", type=int, default=5094)
+    parser.add_argument("--udp-port", type=int, default=5093)
+    args = parser.parse_args()
+    if args.transport == "http":
+        args.loss = 0
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        hub = None
+        if args.url:
+            url = args.url
+            host, _, port = (args.udp or f"{aiohttp.helpers.URL(url).host}:5001").rpartition(":")
+            udp_address = (socket.gethostbyname(host), int(port))
+        else:
+            cpus = set(sorted(os.sched_getaffinity(0))[:args.cpus])
+            hub = subprocess.Popen([sys.executable, os.path.abspath(args.hub), "--host", "127.0.0.1",
+                                    "--port", str(args.port)], cwd=data_dir, stdout=subprocess.DEVNULL,
+                                   env=dict(os.environ, TELEMETRY_PORT=str(args.udp_port)),
+                                   preexec_fn=lambda: os.sched_setaffinity(0, cpus))
+            others = os.sched_getaffinity(0) - cpus
+            if others:
+                os.sched_setaffinity(0, others)
+            url, udp_address = f"http://127.0.0.1:{args.port}", ("127.0.0.1", args.udp_port)
+        try:
+            wait_until_up(url, hub)
+            nodes, telemetry, mismatches, cpu_used = asyncio.run(simulate(args, url, udp_address,
+                                                                          hub.pid if hub else None))
+        finally:
+            if hub is not None:
+                hub.terminate()
+                hub.wait(timeout=30)
+
+    readings = sum(node.readings for node in nodes)
+    totals = telemetry["totals"]
+    print(f"hub:         {url} ({args.transport}{', ' + str(args.cpus) + ' CPU core(s)' if hub else ''})")
+    print(f"nodes:       {args.nodes}, {readings} readings in {args.seconds:g}s "
+          f"({readings / args.seconds:.0f}/s), {args.batch} per {'request' if args.transport == 'http' else 'frame'}")
+    if args.transport != "http":
+        frames = sum(node.frames for node in nodes)
+        dropped = sum(node.dropped for node in nodes)
+        lost = sum(node.lost for node in nodes)
+        print(f"frames:      {frames} built, {dropped} dropped on purpose ({lost} between sent frames)")
+        print(f"hub counted: {totals['frames']} frames, {totals['lost']} lost, {totals['late']} late, "
+              f"{totals['duplicates']} duplicates, {totals['stale']} stale, {telemetry['malformed']} malformed, "
+              f"{telemetry['busy']} readings dropped busy")
+    print(f"read-back:   {mismatches} of {sum(node.last_sent is not None for node in nodes)} nodes "
+          f"do not see their last reading")
+    print(f"wire:        {sum(node.bytes for node in nodes) / max(readings, 1):.0f} bytes per reading "
+          f"(payload; HTTP also pays a TCP handshake per request)")
+    if cpu_used is not None:
+        print(f"hub CPU:     {cpu_used / max(readings, 1) * 1e6:.0f} us per reading, "
+              f"{cpu_used / args.seconds:.0%} of one core")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import React, { useState, useEffect } from "react";
 import { View, Text, StyleSheet, TouchableOpacity } from "react-native";
 import { useNavigation } from "@react-navigation/native";
+import io from "socket.io-client";
+
+const SENSOR_SERVER_URL = "http://domus-central.local:5000";
 
 interface DeviceStatusCardProps {
   lastRefresh?: number;
@@ -20,7 +23,7 @@ export default function DeviceStatusCard({ lastRefresh }: DeviceStatusCardProps)
   useEffect(() => {
     const fetchDevices = async () => {
       try {
-        const response = await fetch("http://domus-central.local:5000/devices");
+        const response = await fetch(`${SENSOR_SERVER_URL}/devices`);
         if (!response.ok) throw new Error("Failed to fetch devices");
         const data = await response.json();
 
@@ -39,6 +42,23 @@ export default function DeviceStatusCard({ lastRefresh }: DeviceStatusCardProps)
     fetchDevices();
   }, [lastRefresh]);
 
+  // The sensor server pushes devices coming online and going offline, so the list stays current without a refresh
+  useEffect(() => {
+    const socket = io(SENSOR_SERVER_URL, { query: { events: "device" } });
+    socket.on("device", (data: { device_id: string; ip: string; lastSeen: number; online: boolean }) => {
+      setDevices((current) => {
+        const others = current.filter((device) => device.device_id !== data.device_id);
+        if (!data.online) return others;
+        return current.some((device) => device.device_id === data.device_id)
+          ? current.map((device) => (device.device_id === data.device_id ? data : device))
+          : [...current, data];
+      });
+    });
+    return () => {
+      socket.disconnect();
+    };
+  }, []);
+
   return (
     <View style={styles.card}>
       <Text style={styles.title}>Connected Devices</Text>
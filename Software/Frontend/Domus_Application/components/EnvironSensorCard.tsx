@@ -3,6 +3,9 @@ import { View, Text, StyleSheet, ActivityIndicator } from "react-native";
 import Svg, { Path, Text as SvgText, Defs, LinearGradient, Stop } from "react-native-svg";
 import Feather from "react-native-vector-icons/Feather";
 import AsyncStorage from "@react-native-async-storage/async-storage";
+import io from "socket.io-client";
+
+const SENSOR_SERVER_URL = "http://domus-central.local:5000";
 
 interface EnvironSensorCardProps {
   lastRefresh?: number;
@@ -19,7 +22,7 @@ export default function EnvironSensorCard({ lastRefresh }: EnvironSensorCardProp
         setSensorData(JSON.parse(cachedData));
       }
 
-      const response = await fetch("http://domus-central.local:5000/bme688-latest");
+      const response = await fetch(`${SENSOR_SERVER_URL}/bme688-latest`);
       if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
       const data = await response.json();
 
@@ -34,10 +37,21 @@ export default function EnvironSensorCard({ lastRefresh }: EnvironSensorCardProp
 
   useEffect(() => {
     fetchSensorData();
-    const interval = setInterval(fetchSensorData, 10000);
-    return () => clearInterval(interval);
   }, [lastRefresh]);
 
+  // New readings are pushed by the sensor server as they arrive
+  useEffect(() => {
+    const socket = io(SENSOR_SERVER_URL, { query: { events: "bme688" } });
+    socket.on("bme688", (data: any) => {
+      setSensorData(data);
+      setLoading(false);
+      AsyncStorage.setItem("environSensorData", JSON.stringify(data));
+    });
+    return () => {
+      socket.disconnect();
+    };
+  }, []);
+
   if (loading) {
     return (
       <View style={[styles.card, { justifyContent: "center", alignItems: "center" }]}>
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from "react";
 import { View, Text, StyleSheet } from "react-native";
 import Feather from "react-native-vector-icons/Feather";
 import AsyncStorage from "@react-native-async-storage/async-storage";
+import io from "socket.io-client";
 
 /**
  * RecentActivityCard
@@ -72,6 +73,18 @@ export default function RecentActivityCard() {
     loadCachedData();
     fetchMotionData();
     fetchDetections();
+
+    // Motion transitions are pushed by the sensor server as they happen
+    const socket = io(MOTION_API, { query: { events: "motion" } });
+    socket.on("motion", (data: { motion: string; timestamp: string }) => {
+      if (data.motion === "motion detected") {
+        setLastMotion(data.timestamp);
+        AsyncStorage.setItem("lastMotion", data.timestamp);
+      }
+    });
+    return () => {
+      socket.disconnect();
+    };
   }, []);
 
   const formatTimeSince = (timestamp: string | null) => {